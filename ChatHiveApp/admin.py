@@ -1,12 +1,18 @@
 # chat/admin.py
 from django.contrib import admin
+from django.db.models.functions import Now
 from django.utils import timezone
 from django.utils.html import format_html
 
+from .hot_window import hot_window
+from .inbox import refresh_last_message
+from .realtime import push_inbox_update
+from .unread import recompute_unread
 from .models import (
     Thread, ThreadMember,
     Message, Attachment, Reaction, Receipt, MessageAudit,
-    ThreadKind, ThreadMemberRole, MessageType, ReceiptStatus, AuditEvent
+    ThreadKind, ThreadMemberRole, MessageType, ReceiptStatus, AuditEvent,
+    bump_message_version,
 )
 
 
@@ -32,7 +38,10 @@ class ThreadMemberInline(admin.TabularInline):
     model = ThreadMember
     extra = 0
     raw_id_fields = ("user",)
-    fields = ("user", "role", "is_active", "mute_until", "last_read_message_id", "created_at", "updated_at")
+    fields = (
+        "user", "role", "is_active", "mute_until",
+        "last_read_message_id", "last_delivered_message_id", "created_at", "updated_at",
+    )
     readonly_fields = ("created_at", "updated_at")
 
 
@@ -102,11 +111,17 @@ class ThreadAdmin(admin.ModelAdmin):
     @admin.action(description="Archivar hilos seleccionados")
     def archive_threads(self, request, queryset):
         updated = queryset.update(is_archived=True)
+        ThreadMember.objects.filter(thread__in=queryset).update(updated_at=Now())
+        for thread_id in queryset.values_list("id", flat=True):
+            push_inbox_update(thread_id)
         self.message_user(request, f"{updated} hilo(s) archivado(s).")
 
     @admin.action(description="Desarchivar hilos seleccionados")
     def unarchive_threads(self, request, queryset):
         updated = queryset.update(is_archived=False)
+        ThreadMember.objects.filter(thread__in=queryset).update(updated_at=Now())
+        for thread_id in queryset.values_list("id", flat=True):
+            push_inbox_update(thread_id)
         self.message_user(request, f"{updated} hilo(s) desarchivado(s).")
 
 
@@ -138,12 +153,28 @@ class MessageAdmin(admin.ModelAdmin):
     @admin.action(description="Borrado lógico (marcar deleted_at=ahora)")
     def soft_delete(self, request, queryset):
         now = timezone.now()
+        thread_ids = set(queryset.filter(deleted_at__isnull=True).values_list("thread_id", flat=True))
         updated = queryset.filter(deleted_at__isnull=True).update(deleted_at=now)
+        bump_message_version(thread_ids)
+        # los borrados no cuentan como no leídos (ni los restaurados dejan de contar)
+        recompute_unread(ThreadMember.objects.filter(thread_id__in=thread_ids))
+        for thread_id in thread_ids:
+            hot_window.invalidate(thread_id)
+            refresh_last_message(thread_id)
+            push_inbox_update(thread_id)
         self.message_user(request, f"{updated} mensaje(s) marcados como borrados.")
 
     @admin.action(description="Restaurar mensajes (deleted_at=NULL)")
     def restore_messages(self, request, queryset):
+        thread_ids = set(queryset.filter(deleted_at__isnull=False).values_list("thread_id", flat=True))
         updated = queryset.filter(deleted_at__isnull=False).update(deleted_at=None)
+        bump_message_version(thread_ids)
+        # los borrados no cuentan como no leídos (ni los restaurados dejan de contar)
+        recompute_unread(ThreadMember.objects.filter(thread_id__in=thread_ids))
+        for thread_id in thread_ids:
+            hot_window.invalidate(thread_id)
+            refresh_last_message(thread_id)
+            push_inbox_update(thread_id)
         self.message_user(request, f"{updated} mensaje(s) restaurados.")
 
 
@@ -0,0 +1,44 @@
+# ChatHiveApp/api/conditional.py
+"""
+GET condicional (ETag / If-None-Match) para los listados que los clientes re-consultan.
+
+El validador se calcula con datos baratos (una agregación indexada, una versión en
+Redis) ANTES de construir el queryset pesado; si coincide con If-None-Match se
+responde 304 sin consultar ni serializar. Las respuestas llevan
+Cache-Control: private, no-cache (siempre se revalidan; nunca en caches compartidas).
+"""
+from __future__ import annotations
+
+import hashlib
+from typing import Optional
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+
+def make_etag(*parts) -> str:
+    """
+    ETag fuerte a partir de los componentes del validador (incluida la URL: cada página el suyo).
+    """
+    raw = "|".join("" if p is None else (p.isoformat() if hasattr(p, "isoformat") else str(p)) for p in parts)
+    return quote_etag(hashlib.sha1(raw.encode()).hexdigest()[:32])
+
+
+def not_modified(request, etag: str):
+    """
+    304 (con el ETag) si If-None-Match coincide; None si hay que generar la respuesta.
+    """
+    if request.method not in ("GET", "HEAD"):
+        return None
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response["ETag"] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def with_etag(response, etag: Optional[str]):
+    if etag and response.status_code == 200:
+        response["ETag"] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -8,6 +8,8 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from accounts.models import User
+from ChatHiveApp import inbox, realtime, unread
+from ChatHiveApp.hot_window import hot_window
 from ChatHiveApp.models import Thread, ThreadMember, Message, MessageType
 from ChatHiveApp.serializers import ThreadListSerializer, MessageSerializer
 from ChatHiveApp.api.threads import annotated_queryset_for
@@ -43,7 +45,9 @@ def ensure_direct_thread(me: User, target: User) -> Thread:
             )
             if not created and not tm.is_active:
                 tm.is_active = True
-                tm.save(update_fields=["is_active"])
+                tm.save(update_fields=["is_active", "updated_at"])
+                # vuelve al hilo: sus contadores no se mantuvieron mientras estuvo inactivo
+                unread.recompute_unread(ThreadMember.objects.filter(pk=tm.pk))
                 changed = True
 
         if changed:
@@ -146,10 +150,10 @@ class DirectSendFirstMessageView(APIView):
                 client_id=client_id or None,
                 type=MessageType.TEXT,
             )
-            Thread.objects.filter(id=thread.id).update(
-                last_message_id=msg.id,
-                last_message_at=msg.created_at,
-            )
+            unread.on_message_created(msg)
+            hot_window.messages_created([msg])
+            inbox.set_last_message(msg)
+            realtime.push_inbox_update(thread.id)
 
         annotated = annotated_queryset_for(me).filter(id=thread.id).first()
         return Response(
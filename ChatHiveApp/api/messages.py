@@ -1,36 +1,125 @@
 # ChatHiveApp/api/messages.py
 from __future__ import annotations
 
-from django.utils.dateparse import parse_datetime
+from collections import OrderedDict
+
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
 
 from rest_framework import viewsets, permissions
-from rest_framework.exceptions import NotFound, ValidationError, PermissionDenied
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
 
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
-
+from ChatHiveApp import inbox, outbox, realtime, receipts, unread
+from ChatHiveApp.hot_window import HOT_WINDOW_SIZE, hot_window
 from ChatHiveApp.models import (
     Thread,
     Message,
     MessageAudit,
     AuditEvent,
+    bump_message_version,
 )
 from ChatHiveApp.serializers import MessageSerializer
 from ChatHiveApp.permissions import IsThreadMember
-from ChatHiveApp.consumers import thread_group_name
+from ChatHiveApp.realtime import thread_group_name
+from ChatHiveApp.api.conditional import make_etag, not_modified, with_etag
+from ChatHiveApp.api.pagination import KeysetPagination, _is_uuid, decode_cursor
 
 
-class ChatMessagePagination(PageNumberPagination):
+class LegacyChatMessagePagination(PageNumberPagination):
     page_size = 30
     page_size_query_param = "page_size"
     max_page_size = 200
 
 
+class ChatMessagePagination(KeysetPagination):
+    """
+    Historial por keyset sobre Message.seq (índice único (thread, seq)):
+      ?before=<cursor|seq|message_id>  -> mensajes anteriores (scroll hacia atrás)
+      ?after=<cursor|seq|message_id>   -> mensajes posteriores (p.ej. ?after=<último seq visto>)
+      ?around=<message_id>             -> "saltar a mensaje"
+    Los cursores antiguos [created_at, id] siguen valiendo (se resuelven por el id).
+    ?page=N se mantiene para clientes antiguos (PageNumberPagination, con COUNT).
+    La página más reciente (sin anclas) puede venir ya serializada de la ventana caliente.
+    """
+
+    page_size = 30
+    max_page_size = 200
+
+    # ── Posiciones por seq (un solo entero en vez de (timestamp, id)) ──
+    def get_position(self, obj) -> list:
+        return [obj.seq]
+
+    def resolve_anchor(self, queryset, param: str, value: str) -> list:
+        if value.isdigit():
+            return [int(value)]
+        message_id = value if _is_uuid(value) else None
+        if message_id is None:
+            values = decode_cursor(value)
+            if values and len(values) == 1 and str(values[0]).isdigit():
+                return [int(values[0])]
+            if values and len(values) == 2 and _is_uuid(values[1]):
+                message_id = values[1]  # cursor antiguo (created_at, id)
+            else:
+                raise ValidationError({param: "Cursor inválido"})
+        seq = queryset.filter(id=message_id).order_by().values_list("seq", flat=True).first()
+        if seq is None:
+            raise ValidationError({param: "Elemento no encontrado"})
+        return [seq]
+
+    def _older_than(self, position) -> Q:
+        return Q(seq__lt=position[0])
+
+    def _at_or_older(self, position) -> Q:
+        return Q(seq__lte=position[0])
+
+    def _newer_than(self, position) -> Q:
+        return Q(seq__gt=position[0])
+
+    def _desc(self, queryset):
+        return queryset.order_by("-seq")
+
+    def _asc(self, queryset):
+        return queryset.order_by("seq")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.legacy = None
+        if request.query_params.get("page"):
+            self.legacy = LegacyChatMessagePagination()
+            return self.legacy.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.legacy is not None:
+            return self.legacy.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def is_latest_page(self, request) -> bool:
+        params = request.query_params
+        return not any(
+            params.get(p)
+            for p in ("page", self.before_query_param, self.after_query_param, self.around_query_param)
+        )
+
+    def get_serialized_response(self, request, data, has_older: bool):
+        """
+        Respuesta de la página más reciente a partir de mensajes ya serializados (sin queryset).
+        """
+        self.request = request
+        next_url = None
+        if data and has_older:
+            last = data[-1]
+            next_url = self._position_link(self.before_query_param, [last["seq"]])
+        return Response(OrderedDict([("next", next_url), ("previous", None), ("results", data)]))
+
+
 class MessageViewSet(viewsets.ModelViewSet):
     """
-    GET    /api/chat/threads/<thread_id>/messages/
+    GET    /api/chat/threads/<thread_id>/messages/             (?receipts=1 -> "receipts": {delivered, read})
+           ETag = (message_seq, message_version) del hilo + versión de la ventana caliente
+           (salvo ?receipts=1); If-None-Match -> 304
     POST   /api/chat/threads/<thread_id>/messages/
     PATCH  /api/chat/threads/<thread_id>/messages/<id>/
     DELETE /api/chat/threads/<thread_id>/messages/<id>/
@@ -54,30 +143,65 @@ class MessageViewSet(viewsets.ModelViewSet):
         thread = self.get_thread()
 
         # 👇 NO filtramos por deleted_at; queremos ver también los eliminados
-        qs = (
+        # before/after/around los resuelve ChatMessagePagination (keyset por seq)
+        return (
             Message.objects.filter(thread=thread)
             .select_related("sender")
-            .order_by("-created_at", "-id")
+            .order_by("-seq")
         )
 
-        before = self.request.query_params.get("before")
-        after = self.request.query_params.get("after")
-
-        if before:
-            dt = parse_datetime(before)
-            if not dt:
-                raise ValidationError({"before": "Fecha/hora inválida"})
-            qs = qs.filter(created_at__lt=dt)
-
-        if after:
-            dt = parse_datetime(after)
-            if not dt:
-                raise ValidationError({"after": "Fecha/hora inválida"})
-            qs = qs.filter(created_at__gt=dt)
-
-        return qs
+    # ── Listado: la página más reciente sale de la ventana caliente ──
+    def list(self, request, *args, **kwargs):
+        thread_id = self.kwargs.get("thread_id")
+        with_receipts = request.query_params.get("receipts") in ("1", "true", "True")
+
+        # Los contadores de marcas cambian sin escribir mensajes: esas páginas no llevan ETag
+        etag = None
+        if not with_receipts:
+            etag = make_etag("messages", thread_id, request.get_full_path(), *self.history_version(thread_id))
+            cached = not_modified(request, etag)
+            if cached is not None:
+                return cached
+
+        paginator = self.paginator
+        size = paginator.get_page_size(request)
+        if size <= HOT_WINDOW_SIZE and paginator.is_latest_page(request) and not with_receipts:
+            # La membresía (IsThreadMember) ya garantiza que el hilo existe
+            cached = hot_window.first_page(thread_id, size) or hot_window.load(thread_id, size)
+            return with_etag(paginator.get_serialized_response(request, *cached), etag)
+        return with_etag(super().list(request, *args, **kwargs), etag)
+
+    @staticmethod
+    def history_version(thread_id) -> tuple:
+        """
+        Validador del historial. Lo que decide es la fila del Thread, que cambia en la misma
+        transacción que cada escritura (message_seq con los envíos, message_version con
+        ediciones, borrados y perfiles de remitentes): nunca da 304 para datos ya cambiados.
+        La versión de la ventana caliente (None si Redis falla) cambia además cuando se aplica
+        el on_commit, así que una página servida de la ventana antes de parchearla no se
+        queda en la caché del cliente.
+        """
+        row = Thread.objects.filter(id=thread_id).values_list("message_seq", "message_version").first()
+        return (*(row or (None, None)), hot_window.version(thread_id))
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        self.receipt_counts = None
+        if page is not None and self.request.query_params.get("receipts") in ("1", "true", "True"):
+            # Una consulta de marcas para toda la página
+            self.receipt_counts = receipts.receipt_counts(self.kwargs.get("thread_id"), page)
+        return page
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        counts = getattr(self, "receipt_counts", None)
+        if counts is not None:
+            context["receipt_counts"] = counts
+        return context
 
     # ── Crear mensaje (REST) + broadcast WS ────────────────────────
+    # Los broadcasts van al outbox en la misma transacción (ver ChatHiveApp.outbox)
+    @transaction.atomic
     def perform_create(self, serializer):
         thread = self.get_thread()
 
@@ -92,27 +216,26 @@ class MessageViewSet(viewsets.ModelViewSet):
             else:
                 message: Message = serializer.save(thread=thread)
                 self.instance = message
+                unread.on_message_created(message)
+                hot_window.messages_created([message])
         else:
             message: Message = serializer.save(thread=thread)
             self.instance = message
+            unread.on_message_created(message)
+            hot_window.messages_created([message])
 
-        # Actualizar último mensaje del hilo
-        Thread.objects.filter(id=thread.id).update(
-            last_message_id=message.id,
-            last_message_at=message.created_at,
-        )
+        # Actualizar snapshot del último mensaje del hilo (y avisar al inbox de cada miembro)
+        inbox.set_last_message(message)
+        realtime.push_inbox_update(thread.id)
 
         # Broadcast WS
-        channel_layer = get_channel_layer()
-        if not channel_layer:
-            return
-
         group = thread_group_name(str(thread.id))
 
         ws_message = {
             "id": str(message.id),
             "thread_id": str(thread.id),
             "sender_id": str(message.sender_id) if message.sender_id else None,
+            "seq": message.seq,
             "text": message.text,
             "type": message.type,
             "created_at": message.created_at.isoformat(),
@@ -120,15 +243,10 @@ class MessageViewSet(viewsets.ModelViewSet):
             "deleted_at": message.deleted_at.isoformat() if message.deleted_at else None,
         }
 
-        async_to_sync(channel_layer.group_send)(
-            group,
-            {
-                "type": "thread.event",
-                "data": {"type": "message.created", "payload": {"message": ws_message}},
-            },
-        )
+        outbox.enqueue_group(group, {"type": "message.created", "payload": {"message": ws_message}})
 
     # ── Editar mensaje (PATCH) ─────────────────────────────────────
+    @transaction.atomic
     def perform_update(self, serializer):
         message: Message = self.get_object()
         user = self.request.user
@@ -139,6 +257,8 @@ class MessageViewSet(viewsets.ModelViewSet):
         old_text = message.text or ""
 
         message = serializer.save(edited_at=timezone.now())
+        hot_window.messages_changed([message])
+        bump_message_version([message.thread_id])
 
         new_text = message.text or ""
 
@@ -151,9 +271,9 @@ class MessageViewSet(viewsets.ModelViewSet):
                 new_text=new_text,
             )
 
-        channel_layer = get_channel_layer()
-        if not channel_layer:
-            return
+        # Si es el último mensaje del hilo, refrescar la vista previa
+        if inbox.patch_last_message(message):
+            realtime.push_inbox_update(message.thread_id)
 
         group = thread_group_name(str(message.thread_id))
 
@@ -161,6 +281,7 @@ class MessageViewSet(viewsets.ModelViewSet):
             "id": str(message.id),
             "thread_id": str(message.thread_id),
             "sender_id": str(message.sender_id) if message.sender_id else None,
+            "seq": message.seq,
             "text": message.text,
             "type": message.type,
             "created_at": message.created_at.isoformat(),
@@ -168,21 +289,18 @@ class MessageViewSet(viewsets.ModelViewSet):
             "deleted_at": message.deleted_at.isoformat() if message.deleted_at else None,
         }
 
-        async_to_sync(channel_layer.group_send)(
-            group,
-            {
-                "type": "thread.event",
-                "data": {"type": "message.updated", "payload": {"message": ws_message}},
-            },
-        )
+        outbox.enqueue_group(group, {"type": "message.updated", "payload": {"message": ws_message}})
 
     # ── Eliminar mensaje (soft delete + audit) ─────────────────────
+    @transaction.atomic
     def perform_destroy(self, instance: Message):
         user = self.request.user
 
         if instance.sender_id != user.id:
             raise PermissionDenied("Solo puedes eliminar tus propios mensajes.")
 
+        was_deleted = instance.deleted_at is not None
+
         # Audit
         MessageAudit.objects.create(
             message=instance,
@@ -196,50 +314,34 @@ class MessageViewSet(viewsets.ModelViewSet):
         instance.text = ""
         instance.deleted_at = timezone.now()
         instance.save(update_fields=["text", "deleted_at", "updated_at"])
+        hot_window.messages_changed([instance])
+        bump_message_version([instance.thread_id])
+
+        if not was_deleted:
+            unread.on_message_deleted(instance)
 
         thread = instance.thread
 
-        # Recalcular last_message_* solo entre NO eliminados
-        try:
-            last = (
-                Message.objects.filter(thread=thread, deleted_at__isnull=True)
-                .order_by("-created_at", "-id")
-                .first()
-            )
-        except Exception:
-            last = None
-
-        if last:
-            Thread.objects.filter(id=thread.id).update(
-                last_message_id=last.id,
-                last_message_at=last.created_at,
-            )
-        else:
-            Thread.objects.filter(id=thread.id).update(
-                last_message_id=None,
-                last_message_at=None,
-            )
+        # Recalcular last_message_* solo entre NO eliminados (si era el último)
+        if thread.last_message_id == instance.id:
+            inbox.refresh_last_message(thread.id)
+        if not was_deleted or thread.last_message_id == instance.id:
+            realtime.push_inbox_update(thread.id)
 
         # Broadcast de eliminación
-        channel_layer = get_channel_layer()
-        if not channel_layer:
-            return
-
         group = thread_group_name(str(thread.id))
 
-        async_to_sync(channel_layer.group_send)(
+        outbox.enqueue_group(
             group,
             {
-                "type": "thread.event",
-                "data": {
-                    "type": "message.deleted",
-                    "payload": {
-                        "id": str(instance.id),
-                        "thread_id": str(thread.id),
-                        "deleted_at": instance.deleted_at.isoformat()
-                        if instance.deleted_at
-                        else None,
-                    },
+                "type": "message.deleted",
+                "payload": {
+                    "id": str(instance.id),
+                    "thread_id": str(thread.id),
+                    "seq": instance.seq,
+                    "deleted_at": instance.deleted_at.isoformat()
+                    if instance.deleted_at
+                    else None,
                 },
             },
         )
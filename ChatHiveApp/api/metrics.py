@@ -0,0 +1,53 @@
+# ChatHiveApp/api/metrics.py
+from rest_framework import permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from ChatHiveApp import outbox
+from ChatHiveApp.api.pagination import _is_uuid
+from ChatHiveApp.hot_window import hot_window
+from ChatHiveApp.publisher import get_publisher
+
+
+class OutboxLagView(APIView):
+    """
+    GET /api/chat/metrics/outbox/
+    Pendientes del outbox realtime y antigüedad de la más vieja (segundos).
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(outbox.lag())
+
+
+class PublisherStatsView(APIView):
+    """
+    GET /api/chat/metrics/publisher/
+    Contadores del publisher de fondo de este proceso (pendientes, enviados, descartados).
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(get_publisher().stats())
+
+
+class HotWindowStatsView(APIView):
+    """
+    GET /api/chat/metrics/hot-window/[?thread_id=<uuid>]
+    Aciertos/fallos de la ventana caliente en este proceso; con thread_id, además
+    cuántos mensajes y bytes ocupa la ventana de ese hilo.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        data = hot_window.stats()
+        thread_id = request.query_params.get("thread_id")
+        if thread_id:
+            if not _is_uuid(thread_id):
+                raise ValidationError({"thread_id": "thread_id inválido"})
+            data["thread"] = hot_window.footprint(thread_id)
+        return Response(data)
@@ -0,0 +1,241 @@
+# ChatHiveApp/api/pagination.py
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+from collections import OrderedDict
+from typing import List, Optional
+from uuid import UUID
+
+from django.db.models import F, Q
+from django.utils.dateparse import parse_datetime
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+# ─────────────────────────────────────────────────────────
+# Cursores opacos
+# ─────────────────────────────────────────────────────────
+def encode_cursor(values) -> str:
+    """
+    Serializa la posición (valores del keyset) a un token opaco url-safe.
+    """
+    raw = json.dumps(
+        [v.isoformat() if hasattr(v, "isoformat") else (str(v) if v is not None else None) for v in values],
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Optional[list]:
+    """
+    Inverso de encode_cursor. Devuelve None si el token no es un cursor válido.
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(values, list):
+        return None
+    return values
+
+
+def _is_uuid(value: str) -> bool:
+    try:
+        UUID(str(value))
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+# ─────────────────────────────────────────────────────────
+# Keyset (seek) pagination
+# ─────────────────────────────────────────────────────────
+class KeysetPagination(BasePagination):
+    """
+    Paginación por keyset sobre (timestamp, id), más nuevo primero.
+    Cada página es un index seek: sin COUNT(*) ni OFFSET.
+
+    Anclas (query params):
+      ?before=<cursor|id>  -> elementos más antiguos que el ancla
+      ?after=<cursor|id>   -> elementos más nuevos que el ancla
+      ?around=<id>         -> ventana centrada en el elemento (incluido)
+      (sin ancla)          -> la página más reciente
+
+    Respuesta: { "next": <url más antiguos|null>, "previous": <url más nuevos|null>, "results": [...] }
+    """
+
+    page_size = 30
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+    # (campo timestamp, campo desempate). Orden descendente en ambos.
+    timestamp_field = "created_at"
+    tiebreak_field = "id"
+    # Si el timestamp admite NULL, esos elementos van al final (los "más antiguos")
+    timestamp_nullable = False
+
+    before_query_param = "before"
+    after_query_param = "after"
+    around_query_param = "around"
+
+    def get_page_size(self, request) -> int:
+        raw = request.query_params.get(self.page_size_query_param)
+        if raw:
+            try:
+                size = int(raw)
+            except (TypeError, ValueError):
+                size = 0
+            if size > 0:
+                return min(size, self.max_page_size)
+        return self.page_size
+
+    # ── Posiciones ────────────────────────────────────────────────
+    def get_position(self, obj) -> list:
+        return [getattr(obj, self.timestamp_field), getattr(obj, self.tiebreak_field)]
+
+    def resolve_anchor(self, queryset, param: str, value: str) -> list:
+        """
+        Convierte un ancla (cursor opaco o id de elemento) en [timestamp, id].
+        Los ids se buscan dentro del queryset (p.ej. solo mensajes del hilo).
+        """
+        if _is_uuid(value):
+            row = (
+                queryset.filter(**{self.tiebreak_field: value})
+                .order_by()
+                .values_list(self.timestamp_field, self.tiebreak_field)
+                .first()
+            )
+            if row is None:
+                raise ValidationError({param: "Elemento no encontrado"})
+            return list(row)
+
+        values = decode_cursor(value)
+        if not values or len(values) != 2 or not values[1]:
+            raise ValidationError({param: "Cursor inválido"})
+        ts = parse_datetime(values[0]) if values[0] else None
+        if ts is None and not (self.timestamp_nullable and values[0] is None):
+            raise ValidationError({param: "Cursor inválido"})
+        return [ts, values[1]]
+
+    def _older_than(self, position) -> Q:
+        ts, pk = position
+        t, k = self.timestamp_field, self.tiebreak_field
+        if ts is None:
+            return Q(**{f"{t}__isnull": True, f"{k}__lt": pk})
+        q = Q(**{f"{t}__lt": ts}) | Q(**{t: ts, f"{k}__lt": pk})
+        if self.timestamp_nullable:
+            q |= Q(**{f"{t}__isnull": True})
+        return q
+
+    def _at_or_older(self, position) -> Q:
+        return self._older_than(position) | Q(**{self.tiebreak_field: position[1]})
+
+    def _newer_than(self, position) -> Q:
+        ts, pk = position
+        t, k = self.timestamp_field, self.tiebreak_field
+        if ts is None:
+            return Q(**{f"{t}__isnull": False}) | Q(**{f"{t}__isnull": True, f"{k}__gt": pk})
+        return Q(**{f"{t}__gt": ts}) | Q(**{t: ts, f"{k}__gt": pk})
+
+    # NULLS LAST/FIRST solo si hace falta: en columnas NOT NULL mantiene el orden natural del índice
+    def _desc(self, queryset):
+        ts = F(self.timestamp_field).desc(nulls_last=True) if self.timestamp_nullable else F(self.timestamp_field).desc()
+        return queryset.order_by(ts, F(self.tiebreak_field).desc())
+
+    def _asc(self, queryset):
+        ts = F(self.timestamp_field).asc(nulls_first=True) if self.timestamp_nullable else F(self.timestamp_field).asc()
+        return queryset.order_by(ts, F(self.tiebreak_field).asc())
+
+    # ── API de DRF ────────────────────────────────────────────────
+    def paginate_queryset(self, queryset, request, view=None) -> List:
+        self.request = request
+        size = self.get_page_size(request)
+        params = request.query_params
+
+        before = params.get(self.before_query_param)
+        after = params.get(self.after_query_param)
+        around = params.get(self.around_query_param)
+
+        if around:
+            if not _is_uuid(around):
+                raise ValidationError({self.around_query_param: "Debe ser un id"})
+            anchor = self.resolve_anchor(queryset, self.around_query_param, around)
+            newer_size = size // 2
+            older_size = size - newer_size  # incluye el ancla
+
+            older = list(
+                self._desc(queryset.filter(self._at_or_older(anchor)))[
+                    : older_size + 1
+                ]
+            )
+            newer = list(self._asc(queryset.filter(self._newer_than(anchor)))[: newer_size + 1])
+
+            self.has_older = len(older) > older_size
+            self.has_newer = len(newer) > newer_size
+            page = list(reversed(newer[:newer_size])) + older[:older_size]
+
+        elif after:
+            anchor = self.resolve_anchor(queryset, self.after_query_param, after)
+            rows = list(self._asc(queryset.filter(self._newer_than(anchor)))[: size + 1])
+            self.has_newer = len(rows) > size
+            self.has_older = True
+            page = list(reversed(rows[:size]))
+
+        else:
+            if before:
+                anchor = self.resolve_anchor(queryset, self.before_query_param, before)
+                queryset = queryset.filter(self._older_than(anchor))
+            rows = list(self._desc(queryset)[: size + 1])
+            self.has_older = len(rows) > size
+            self.has_newer = bool(before)
+            page = rows[:size]
+
+        self.page = page
+        return page
+
+    def _link(self, param: str, obj) -> str:
+        return self._position_link(param, self.get_position(obj))
+
+    def _position_link(self, param: str, position) -> str:
+        url = self.request.build_absolute_uri()
+        for p in (self.before_query_param, self.after_query_param, self.around_query_param):
+            url = remove_query_param(url, p)
+        return replace_query_param(url, param, encode_cursor(position))
+
+    def get_next_link(self) -> Optional[str]:
+        if not self.page or not self.has_older:
+            return None
+        return self._link(self.before_query_param, self.page[-1])
+
+    def get_previous_link(self) -> Optional[str]:
+        if not self.page or not self.has_newer:
+            return None
+        return self._link(self.after_query_param, self.page[0])
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
@@ -0,0 +1,118 @@
+# ChatHiveApp/api/receipts.py
+from __future__ import annotations
+
+from uuid import UUID
+
+from rest_framework import permissions
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from accounts.models import User
+from ChatHiveApp import receipts
+from ChatHiveApp.models import Message
+from ChatHiveApp.permissions import IsThreadMember
+from ChatHiveApp.serializers import UserMiniSerializer
+
+
+def _uuid_or_none(value):
+    try:
+        return UUID(str(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class ThreadReceiptsView(APIView):
+    """
+    GET  /api/chat/threads/<thread_id>/receipts/
+         -> marcas de entrega/lectura de los miembros activos
+    POST /api/chat/threads/<thread_id>/receipts/   { "message_id": "<uuid>", "kind": "read"|"delivered" }
+         -> avanza la marca del usuario (solo hacia adelante; leer implica entregado)
+    """
+
+    permission_classes = [permissions.IsAuthenticated, IsThreadMember]
+
+    def get(self, request, thread_id):
+        return Response({"thread_id": thread_id, "members": receipts.watermarks(thread_id)})
+
+    def post(self, request, thread_id):
+        kind = request.data.get("kind") or receipts.READ
+        if kind not in receipts.KINDS:
+            raise ValidationError({"kind": f"Debe ser uno de: {', '.join(receipts.KINDS)}"})
+        message_id = _uuid_or_none(request.data.get("message_id"))
+        if message_id is None:
+            raise ValidationError({"message_id": "message_id inválido"})
+
+        result = receipts.advance(thread_id, request.user.id, message_id, kind)
+        if result is None:
+            raise NotFound("Mensaje no encontrado en este hilo")
+        return Response(result)
+
+
+class ThreadReadView(APIView):
+    """
+    POST /api/chat/threads/<thread_id>/read/   { "message_id": "<uuid-opcional>" }
+    Marca leído hasta 'message_id' (o hasta el último mensaje). Se escribe en la request con
+    un UPDATE condicional: repetir o mandar una marca anterior no escribe nada. Para marcas
+    por cada mensaje que entra en pantalla, usar thread.read por WebSocket (coalescido).
+    """
+
+    permission_classes = [permissions.IsAuthenticated, IsThreadMember]
+
+    def post(self, request, thread_id):
+        message_id = request.data.get("message_id")
+        if message_id is not None:
+            message_id = _uuid_or_none(message_id)
+            if message_id is None:
+                raise ValidationError({"message_id": "message_id inválido"})
+
+        result = receipts.advance(thread_id, request.user.id, message_id, receipts.READ)
+        if result is None:
+            raise NotFound("Mensaje no encontrado en este hilo")
+        return Response(result)
+
+
+class MarkAllReadView(APIView):
+    """
+    POST /api/chat/threads/read-all/
+    Marca como leídos todos los hilos activos del usuario (un UPDATE).
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        return Response({"thread_ids": receipts.mark_all_read(request.user.id)})
+
+
+class MessageReceiptsView(APIView):
+    """
+    GET /api/chat/threads/<thread_id>/messages/<pk>/receipts/
+        -> contadores y "leído por" del mensaje, derivados de las marcas de los miembros
+    """
+
+    permission_classes = [permissions.IsAuthenticated, IsThreadMember]
+
+    def get(self, request, thread_id, pk):
+        message_id = _uuid_or_none(pk)
+        message = (
+            Message.objects.filter(id=message_id, thread_id=thread_id)
+            .only("id", "thread_id", "sender_id", "created_at", "seq")
+            .first()
+            if message_id
+            else None
+        )
+        if message is None:
+            raise NotFound("Mensaje no encontrado")
+
+        read_by = list(User.objects.filter(id__in=receipts.read_by(message).values("user_id")))
+        delivered_to = [str(u) for u in receipts.delivered_to(message).values_list("user_id", flat=True)]
+        return Response(
+            {
+                "message_id": str(message.id),
+                "seq": message.seq,
+                "delivered": len(delivered_to),
+                "read": len(read_by),
+                "read_by": UserMiniSerializer(read_by, many=True).data,
+                "delivered_to": delivered_to,
+            }
+        )
@@ -0,0 +1,83 @@
+# ChatHiveApp/api/search.py
+from __future__ import annotations
+
+from django.utils.dateparse import parse_datetime
+
+from rest_framework import permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import APIView
+
+from ChatHiveApp import search
+from ChatHiveApp.api.pagination import decode_cursor, encode_cursor, _is_uuid
+from ChatHiveApp.models import Message
+from ChatHiveApp.serializers import MessageSerializer
+
+
+class MessageSearchView(APIView):
+    """
+    GET /api/chat/search/messages/?q=texto[&thread_id=<uuid>][&cursor=<cursor>][&page_size=N]
+    Búsqueda en todos los hilos activos del usuario (o en uno), por relevancia.
+    { "next": <url|null>, "results": [ <mensaje> + "snippet" (HTML con <mark>) + "rank" ] }
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+    page_size = 20
+    max_page_size = 50
+    min_query_length = 2
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params.get("page_size") or self.page_size)
+        except ValueError:
+            size = self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get(self, request):
+        query = (request.query_params.get("q") or "").strip()
+        if len(query) < self.min_query_length:
+            raise ValidationError({"q": f"Mínimo {self.min_query_length} caracteres"})
+
+        thread_id = request.query_params.get("thread_id")
+        if thread_id and not _is_uuid(thread_id):
+            raise ValidationError({"thread_id": "thread_id inválido"})
+
+        position = None
+        cursor = request.query_params.get("cursor")
+        if cursor:
+            values = decode_cursor(cursor)
+            try:
+                position = [float(values[0]), parse_datetime(values[1]), values[2]]
+            except (TypeError, ValueError, IndexError):
+                position = None
+            if position is None or position[1] is None or not _is_uuid(position[2]):
+                raise ValidationError({"cursor": "Cursor inválido"})
+
+        size = self.get_page_size(request)
+        hits = search.search_hits(request.user.id, query, thread_id, position, size + 1)
+        has_more = len(hits) > size
+        hits = hits[:size]
+
+        messages = {
+            m.id: m for m in Message.objects.filter(id__in=[pk for pk, _, _ in hits]).select_related("sender")
+        }
+        results = []
+        for pk, rank, snippet in hits:
+            message = messages.get(pk)
+            if message is None:
+                continue  # borrado entre ambas consultas
+            data = MessageSerializer(message, context={"request": request}).data
+            data["snippet"] = search.render_snippet(snippet or message.text)
+            data["rank"] = rank
+            results.append(data)
+
+        next_url = None
+        if has_more and hits:
+            last_pk, last_rank, _ = hits[-1]
+            last = messages.get(last_pk)
+            if last is not None:
+                next_url = replace_query_param(
+                    request.build_absolute_uri(), "cursor", encode_cursor([last_rank, last.created_at, last.id])
+                )
+        return Response({"next": next_url, "results": results})
@@ -1,14 +1,30 @@
 # ChatHiveApp/api/threads.py
 from __future__ import annotations
 
+from datetime import timedelta
+
 from django.db import models
-from django.db.models import Count, Q, OuterRef, Subquery, F, DateTimeField
+from django.db.models import Count, F, Max, Q, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 from rest_framework import viewsets, permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
 
 from accounts.models import User
-from ChatHiveApp.models import Thread, ThreadMember, Message
+from ChatHiveApp.models import Thread, ThreadMember
 from ChatHiveApp.serializers import ThreadListSerializer
+from ChatHiveApp.api.conditional import make_etag, not_modified, with_etag
+from ChatHiveApp.api.pagination import KeysetPagination, decode_cursor, encode_cursor
+
+# Margen para transacciones que confirman después de emitir el cursor de sync:
+# el siguiente delta repite (idempotente) lo cambiado en esa ventana.
+SYNC_SAFETY_WINDOW = timedelta(seconds=5)
+
+
+def sync_cursor(since, thread_id=None) -> str:
+    return encode_cursor([since, thread_id])
 
 
 # ─────────────────────────────────────────────────────────
@@ -18,45 +34,20 @@ def annotated_queryset_for(user: User):
     """
     Devuelve un queryset de Thread con las mismas anotaciones utilizadas en el listado,
     listo para serializar con ThreadListSerializer.
-    """
-    member_sub = ThreadMember.objects.filter(
-        thread=OuterRef("pk"), user=user
-    ).values("last_read_message_id")[:1]
-
-    last_read_at_sub = Message.objects.filter(
-        id=Subquery(member_sub)
-    ).values("created_at")[:1]
-
-    last_text_sub = Message.objects.filter(
-        id=OuterRef("last_message_id")
-    ).values("text")[:1]
-
-    last_sender_id_sub = Message.objects.filter(
-        id=OuterRef("last_message_id")
-    ).values("sender_id")[:1]
-
-    last_created_at_sub = Message.objects.filter(
-        id=OuterRef("last_message_id")
-    ).values("created_at")[:1]
 
+    unread_count / last_read_at se leen de la propia membresía (contadores
+    desnormalizados, ver ChatHiveApp.unread): el JOIN del filtro es 1 fila por hilo.
+    El último mensaje sale del snapshot last_message_* de Thread (ver ChatHiveApp.inbox).
+    """
     return (
         Thread.objects.filter(
             members__user=user,
             members__is_active=True,
         )
         .annotate(
-            members_count=Count("members", filter=Q(members__is_active=True), distinct=True),
-            last_text=Subquery(last_text_sub),
-            last_sender_id=Subquery(last_sender_id_sub),
-            last_created_at=Subquery(last_created_at_sub),
-            last_read_at=Subquery(last_read_at_sub, output_field=DateTimeField()),
-        )
-        .annotate(
-            unread_count=Count(
-                "messages",
-                filter=Q(messages__created_at__gt=F("last_read_at")) | Q(last_read_at__isnull=True),
-                distinct=True,
-            )
+            # F() reutiliza el JOIN de la membresía del filtro
+            last_read_at=F("members__last_read_at"),
+            unread_count=F("members__unread_count"),
         )
         .select_related("created_by")
         .prefetch_related(
@@ -79,84 +70,133 @@ def annotated_queryset_for(user: User):
     )
 
 
-class ThreadViewSet(viewsets.ReadOnlyModelViewSet):
+def inbox_version(user: User) -> tuple:
     """
-    GET /api/chat/threads/           -> lista hilos del usuario
-    GET /api/chat/threads?q=texto    -> filtro por título
-    GET /api/chat/threads?archived=1 -> incluye archivados
+    Validador del inbox del usuario: una agregación sobre sus membresías (índice (user, updated_at)).
+    Los updated_at solos no bastan: en PostgreSQL Now() es el inicio de la transacción, y
+    una escritura larga puede confirmar un updated_at por debajo del máximo ya visto. Por
+    eso entran también los contadores y las marcas por seq (no leídos, lectura, entrega,
+    mensajes y último mensaje del hilo), que cambian con cada escritura que afecta al inbox.
     """
+    row = ThreadMember.objects.filter(user=user).aggregate(
+        memberships=Count("id"),
+        active=Count("id", filter=Q(is_active=True)),
+        changed=Max("updated_at"),
+        unread=Sum("unread_count"),
+        read=Sum("last_read_seq"),
+        delivered=Sum("last_delivered_seq"),
+        messages=Sum("thread__message_seq"),
+        last_messages=Sum("thread__last_message_seq"),
+        activity=Max("thread__last_message_at"),
+        thread_changed=Max("thread__updated_at"),
+    )
+    return tuple(row.values())
 
-    serializer_class = ThreadListSerializer
-    permission_classes = [permissions.IsAuthenticated]
 
-    def get_queryset(self):
-        user = self.request.user
+class InboxPagination(KeysetPagination):
+    """
+    Inbox por keyset sobre (last_message_at, id), más reciente primero;
+    los hilos sin mensajes van al final. Añade "sync": cursor para ?changed_since=.
+    """
 
-        member_sub = ThreadMember.objects.filter(
-            thread=OuterRef("pk"), user=user
-        ).values("last_read_message_id")[:1]
+    page_size = 30
+    max_page_size = 100
+    timestamp_field = "last_message_at"
+    timestamp_nullable = True
 
-        last_read_at_sub = Message.objects.filter(
-            id=Subquery(member_sub)
-        ).values("created_at")[:1]
+    def paginate_queryset(self, queryset, request, view=None):
+        self.sync = sync_cursor(timezone.now() - SYNC_SAFETY_WINDOW)
+        return super().paginate_queryset(queryset, request, view)
 
-        last_text_sub = Message.objects.filter(
-            id=OuterRef("last_message_id")
-        ).values("text")[:1]
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data["sync"] = self.sync
+        return response
 
-        last_sender_id_sub = Message.objects.filter(
-            id=OuterRef("last_message_id")
-        ).values("sender_id")[:1]
 
-        last_created_at_sub = Message.objects.filter(
-            id=OuterRef("last_message_id")
-        ).values("created_at")[:1]
+class ThreadViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    GET /api/chat/threads/                      -> lista hilos del usuario (keyset, ver InboxPagination)
+    GET /api/chat/threads?q=texto               -> filtro por título
+    GET /api/chat/threads?archived=1            -> incluye archivados
+    GET /api/chat/threads?changed_since=<sync>  -> solo hilos cambiados desde el cursor
+                                                   { results, removed, has_more, sync }
+    Todas las variantes llevan ETag (ver inbox_version); If-None-Match -> 304 sin consultas.
+    """
 
-        qs = (
-            Thread.objects.filter(
-                members__user=user,
-                members__is_active=True,
-            )
-            .annotate(
-                members_count=Count("members", filter=Q(members__is_active=True), distinct=True),
-                last_text=Subquery(last_text_sub),
-                last_sender_id=Subquery(last_sender_id_sub),
-                last_created_at=Subquery(last_created_at_sub),
-                last_read_at=Subquery(last_read_at_sub, output_field=DateTimeField()),
-            )
-            .annotate(
-                unread_count=Count(
-                    "messages",
-                    filter=Q(messages__created_at__gt=F("last_read_at")) | Q(last_read_at__isnull=True),
-                    distinct=True,
-                )
-            )
-            .select_related("created_by")
-            .prefetch_related(
-                models.Prefetch(
-                    "members",
-                    queryset=ThreadMember.objects.select_related("user").only(
-                        "id",
-                        "thread_id",
-                        "user__id",
-                        "user__email",
-                        "user__first_name",
-                        "user__last_name",
-                        "is_active",
-                        "role",
-                    ),
-                    to_attr="members_all",
-                )
-            )
-            .order_by("-last_message_at", "-created_at")
-        )
+    serializer_class = ThreadListSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = InboxPagination
+
+    def get_base_queryset(self):
+        qs = annotated_queryset_for(self.request.user)
 
         q = self.request.query_params.get("q")
         if q:
             qs = qs.filter(Q(title__icontains=q) | Q(created_by__email__icontains=q))
 
+        return qs
+
+    def get_queryset(self):
+        # El orden lo pone InboxPagination
+        qs = self.get_base_queryset()
+
         archived = self.request.query_params.get("archived")
         if archived not in ("1", "true", "True"):
             qs = qs.filter(is_archived=False)
 
         return qs
+
+    def list(self, request, *args, **kwargs):
+        etag = make_etag("inbox", request.user.pk, request.get_full_path(), *inbox_version(request.user))
+        cached = not_modified(request, etag)
+        if cached is not None:
+            return cached
+
+        since = request.query_params.get("changed_since")
+        if since:
+            return with_etag(self.changes_since(request, since), etag)
+        return with_etag(super().list(request, *args, **kwargs), etag)
+
+    # ── Inbox incremental ─────────────────────────────────────────
+    def changes_since(self, request, since: str):
+        """
+        Hilos cuya fila del inbox (actividad, membresía o lectura) cambió después del cursor,
+        por keyset sobre (ThreadMember.updated_at, thread id). Incluye archivados para que el
+        cliente vea el cambio de estado; "removed" son hilos de los que el usuario salió.
+        """
+        values = decode_cursor(since)
+        ts = parse_datetime(values[0]) if values and len(values) == 2 and values[0] else None
+        if ts is None:
+            raise ValidationError({"changed_since": "Cursor inválido"})
+        last_id = values[1]
+
+        started = timezone.now()
+        size = self.paginator.get_page_size(request)
+
+        qs = self.get_base_queryset().annotate(changed_at=F("members__updated_at"))
+        seek = Q(changed_at__gt=ts)
+        if last_id:
+            seek |= Q(changed_at=ts, id__gt=last_id)
+        rows = list(qs.filter(seek).order_by("changed_at", "id")[: size + 1])
+
+        has_more = len(rows) > size
+        rows = rows[:size]
+
+        removed = ThreadMember.objects.filter(
+            user=request.user, is_active=False, updated_at__gt=ts
+        ).values_list("thread_id", flat=True)
+
+        if has_more:
+            next_sync = sync_cursor(rows[-1].changed_at, str(rows[-1].id))
+        else:
+            next_sync = sync_cursor(max(ts, started - SYNC_SAFETY_WINDOW))
+
+        return Response(
+            {
+                "results": self.get_serializer(rows, many=True).data,
+                "removed": [str(t) for t in removed],
+                "has_more": has_more,
+                "sync": next_sync,
+            }
+        )
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ChathiveappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ChatHiveApp'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,160 @@
+# ChatHiveApp/codecs.py
+"""
+Codificación de frames del WebSocket.
+
+  - json (por defecto): texto JSON compacto.
+  - chathive.msgpack (subprotocolo negociado): frames binarios MessagePack.
+    Los valores de claves "id" / "*_id" / "*_ids" que son UUID viajan como ext
+    EXT_UUID (16 bytes) y los de "*_at" como Timestamp nativo de msgpack. Las claves
+    que elige el cliente (CLIENT_KEYS, p.ej. client_id) vuelven tal cual las mandó.
+
+Los eventos del channel layer siguen siendo dicts con str (channels_redis los
+serializa); la conversión a tipos binarios ocurre solo al escribir al socket.
+
+Fan-out: encode_frames() codifica el frame una vez en JSON en el emisor, y es lo único
+que viaja por el channel layer. Cada receptor lo obtiene con frame_for(): los JSON lo
+escriben tal cual y los msgpack lo transcodifican una vez por proceso (LRU compartido
+por las conexiones del worker), así que sin clientes msgpack no se paga su codificación.
+encode_batch() incrusta los frames tal cual en un envelope "batch".
+"""
+from __future__ import annotations
+
+import json
+from collections import OrderedDict
+from datetime import datetime
+from uuid import UUID
+
+import msgpack
+from django.utils.dateparse import parse_datetime
+
+MSGPACK_SUBPROTOCOL = "chathive.msgpack"
+EXT_UUID = 1
+TRANSCODE_CACHE_SIZE = 256
+# Valores que elige el cliente: nunca se convierten (un client_id str vuelve como str)
+CLIENT_KEYS = frozenset({"client_id"})
+
+# {"type": "batch", "payload": <array>} sin el array
+_BATCH_PREFIX = b"\x82" + b"".join(msgpack.packb(s) for s in ("type", "batch", "payload"))
+
+
+def _is_id_key(key) -> bool:
+    return (
+        isinstance(key, str)
+        and key not in CLIENT_KEYS
+        and (key == "id" or key.endswith("_id") or key.endswith("_ids"))
+    )
+
+
+def _is_time_key(key) -> bool:
+    return isinstance(key, str) and key.endswith("_at")
+
+
+def _to_wire(value, key=None):
+    if isinstance(value, dict):
+        return {k: _to_wire(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_wire(v, key) for v in value]
+    if isinstance(value, str):
+        if _is_id_key(key) and len(value) == 36:
+            try:
+                return msgpack.ExtType(EXT_UUID, UUID(value).bytes)
+            except ValueError:
+                return value
+        if _is_time_key(key):
+            dt = parse_datetime(value)
+            if dt is not None and dt.tzinfo is not None:
+                return dt
+    return value
+
+
+def _from_wire(value):
+    if isinstance(value, dict):
+        return {k: _from_wire(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_from_wire(v) for v in value]
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _ext_hook(code, data):
+    if code == EXT_UUID and len(data) == 16:
+        return UUID(bytes=data)
+    return msgpack.ExtType(code, data)
+
+
+class JSONCodec:
+    name = "json"
+    subprotocol = None
+    binary = False
+
+    def encode(self, content) -> str:
+        return json.dumps(content, separators=(",", ":"), ensure_ascii=False)
+
+    def decode(self, data: str):
+        return json.loads(data)
+
+    def encode_batch(self, frames) -> str:
+        return '{"type":"batch","payload":[' + ",".join(frames) + "]}"
+
+
+class MsgpackCodec:
+    name = "msgpack"
+    subprotocol = MSGPACK_SUBPROTOCOL
+    binary = True
+
+    def encode(self, content) -> bytes:
+        return msgpack.packb(_to_wire(content), use_bin_type=True, datetime=True)
+
+    def decode(self, data: bytes):
+        return _from_wire(msgpack.unpackb(data, raw=False, ext_hook=_ext_hook, timestamp=3))
+
+    def encode_batch(self, frames) -> bytes:
+        # Un array msgpack es su cabecera seguida de los elementos ya codificados
+        return _BATCH_PREFIX + msgpack.Packer().pack_array_header(len(frames)) + b"".join(frames)
+
+
+JSON_CODEC = JSONCodec()
+MSGPACK_CODEC = MsgpackCodec()
+CODECS = {JSON_CODEC.name: JSON_CODEC, MSGPACK_CODEC.name: MSGPACK_CODEC}
+
+
+def encode_frames(content) -> dict:
+    """
+    Frame para el fan-out: {"json": str}. Los demás codecs lo derivan en frame_for().
+    """
+    return {JSON_CODEC.name: JSON_CODEC.encode(content)}
+
+
+# (codec, frame JSON) -> frame transcodificado; solo lo usa el event loop del worker
+_transcoded: "OrderedDict[tuple, bytes]" = OrderedDict()
+
+
+def frame_for(codec, frames: dict):
+    """
+    Frame de 'frames' para 'codec': el que trajo el emisor o, si no, el JSON
+    transcodificado (una vez por proceso y evento).
+    """
+    wire = frames.get(codec.name)
+    if wire is not None:
+        return wire
+    key = (codec.name, frames[JSON_CODEC.name])
+    wire = _transcoded.get(key)
+    if wire is not None:
+        _transcoded.move_to_end(key)
+        return wire
+    wire = _transcoded[key] = codec.encode(JSON_CODEC.decode(key[1]))
+    if len(_transcoded) > TRANSCODE_CACHE_SIZE:
+        _transcoded.popitem(last=False)
+    return wire
+
+
+def negotiate(subprotocols) -> JSONCodec | MsgpackCodec:
+    """
+    Elige el codec según los subprotocolos ofrecidos por el cliente (JSON por defecto).
+    """
+    if MSGPACK_SUBPROTOCOL in (subprotocols or []):
+        return MSGPACK_CODEC
+    return JSON_CODEC
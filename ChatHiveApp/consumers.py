@@ -1,27 +1,168 @@
 # ChatHiveApp/consumers.py
 from __future__ import annotations
 
-from typing import Dict, Set
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs
 from uuid import UUID
 
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from django.contrib.auth.models import AnonymousUser
-from django.db import IntegrityError, transaction
-from django.utils import timezone
 
-from ChatHiveApp.models import (
-    Thread,
-    ThreadMember,
-    Message,
-    MessageType,
-)
+from ChatHiveApp import receipts, replay
+from ChatHiveApp.receipts import get_receipt_coalescer
+from ChatHiveApp.codecs import JSON_CODEC, frame_for, negotiate
+from ChatHiveApp.models import ThreadMember
+from ChatHiveApp.presence import PRESENCE_HEARTBEAT, get_presence
+from ChatHiveApp.realtime import group_add_many, thread_event_message, thread_group_name, user_group_name
+from ChatHiveApp.writer import get_message_writer
+
+logger = logging.getLogger(__name__)
 
 # ─────────────────────────────────────────────────────────
 # Utils
 # ─────────────────────────────────────────────────────────
-def thread_group_name(thread_id: str) -> str:
-    return f"thread_{thread_id}"
+def normalize_thread_id(thread_id) -> Optional[str]:
+    try:
+        return str(UUID(str(thread_id)))
+    except (TypeError, ValueError):
+        return None
+
+
+# Re-verificación de membresía por si se pierde un evento membership.revoked
+MEMBERSHIP_CACHE_TTL = 300  # segundos
+
+# Typing: el emisor re-anuncia "start" como mucho cada TYPING_REFRESH; el receptor
+# lo expira tras TYPING_TTL sin refresco y emite el conjunto como mucho cada TYPING_FLUSH_INTERVAL.
+# En origen, un group_send por (hilo, emisor) como mucho cada TYPING_SEND_INTERVAL (TypingThrottle).
+TYPING_REFRESH = 3.0
+TYPING_TTL = 6.0
+TYPING_FLUSH_INTERVAL = 0.5
+TYPING_SEND_INTERVAL = 0.5
+TYPING_THROTTLE_MAX_KEYS = 10_000
+
+# Frames agrupados: máximo de operaciones por envelope entrante; ventana y tope del batch saliente
+MAX_BATCH_OPS = 100
+# thread.join_many: máximo de hilos por operación
+MAX_JOIN_MANY = 1000
+OUTBOUND_FLUSH_WINDOW = 0.02
+OUTBOUND_BATCH_MAX = 100
+
+
+# ─────────────────────────────────────────────────────────
+# Typing en origen (uno por event loop)
+# ─────────────────────────────────────────────────────────
+class TypingThrottle:
+    """
+    Como mucho un typing.event por (hilo, emisor) cada TYPING_SEND_INTERVAL, contando juntas
+    todas las conexiones del usuario en este worker. Un cambio dentro del intervalo no se
+    pierde: sale al cerrarlo con el último estado. Repetir el estado ya difundido no envía
+    nada (salvo el refresco de "start" cada TYPING_REFRESH), ni un "stop" sin "start" previo.
+    Es el único estado de typing del lado emisor (las conexiones no guardan copia).
+    """
+
+    def __init__(self, interval: float = TYPING_SEND_INTERVAL, refresh: float = TYPING_REFRESH):
+        self.interval = interval
+        self.refresh = refresh
+        # (thread_id, user_id) -> (último estado difundido, cuándo, canal que lo originó)
+        self._sent: Dict[Tuple[str, str], Tuple[str, float, str]] = {}
+        # (thread_id, user_id) -> (estado pendiente, canal que lo originó)
+        self._pending: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        self._timers: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+
+    def _redundant(self, key, status: str, now: float) -> bool:
+        last = self._sent.get(key)
+        if last is None:
+            return status == "stop"
+        return last[0] == status and (status == "stop" or now - last[1] < self.refresh)
+
+    def _cancel(self, key) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        self._pending.pop(key, None)
+
+    def reset(self, thread_id: str, user_id: str) -> None:
+        """
+        El emisor acaba de enviar un mensaje: los receptores ya lo sacaron de "escribiendo",
+        así que se olvida su estado y el siguiente "start" sale sin esperar al refresco.
+        """
+        key = (thread_id, user_id)
+        self._cancel(key)
+        self._sent.pop(key, None)
+
+    async def stop_channel(self, layer, user_id: str, channel: str) -> None:
+        """
+        Al desconectar: "stop" en los hilos donde el último "start" (difundido o pendiente)
+        vino de 'channel'.
+        """
+        keys = {k for k, v in self._sent.items() if k[1] == user_id and v[0] == "start" and v[2] == channel}
+        keys |= {k for k, v in self._pending.items() if k[1] == user_id and v == ("start", channel)}
+        for key in keys:
+            self._cancel(key)
+            if self._sent.get(key, ("stop",))[0] == "start":
+                await self._send(layer, key, "stop", channel)
+            else:
+                self._sent.pop(key, None)
+
+    async def submit(self, layer, thread_id: str, user_id: str, status: str, sender_channel: str) -> None:
+        key = (thread_id, user_id)
+        if key in self._timers:
+            self._pending[key] = (status, sender_channel)
+            return
+
+        now = time.monotonic()
+        if self._redundant(key, status, now):
+            return
+        last = self._sent.get(key)
+        if last is not None and now - last[1] < self.interval:
+            self._pending[key] = (status, sender_channel)
+            self._timers[key] = asyncio.get_running_loop().call_later(
+                self.interval - (now - last[1]), lambda: asyncio.ensure_future(self._flush(layer, key))
+            )
+            return
+        await self._send(layer, key, status, sender_channel)
+
+    async def _flush(self, layer, key):
+        self._timers.pop(key, None)
+        pending = self._pending.pop(key, None)
+        if pending is None or self._redundant(key, pending[0], time.monotonic()):
+            return
+        try:
+            await self._send(layer, key, *pending)
+        except Exception:
+            logger.exception("typing: no se pudo difundir el estado de %s en %s", key[1], key[0])
+
+    async def _send(self, layer, key, status: str, sender_channel: str):
+        now = time.monotonic()
+        self._sent[key] = (status, now, sender_channel)
+        if len(self._sent) > TYPING_THROTTLE_MAX_KEYS:
+            self._sent = {k: v for k, v in self._sent.items() if now - v[1] < TYPING_TTL}
+        thread_id, user_id = key
+        await layer.group_send(
+            thread_group_name(thread_id),
+            {
+                "type": "typing.event",
+                "thread_id": thread_id,
+                "user_id": user_id,
+                "status": status,
+                "sender_channel": sender_channel,
+            },
+        )
+
+
+_typing_throttles: Dict[asyncio.AbstractEventLoop, TypingThrottle] = {}
+
+
+def get_typing_throttle() -> TypingThrottle:
+    loop = asyncio.get_running_loop()
+    throttle = _typing_throttles.get(loop)
+    if throttle is None:
+        throttle = _typing_throttles[loop] = TypingThrottle()
+    return throttle
 
 
 # ─────────────────────────────────────────────────────────
@@ -29,28 +170,76 @@ def thread_group_name(thread_id: str) -> str:
 # ─────────────────────────────────────────────────────────
 class ChatConsumer(AsyncJsonWebsocketConsumer):
     """
-    Protocolo de mensajes (JSON):
+    Protocolo de mensajes (JSON por defecto; MessagePack binario si el cliente ofrece el
+    subprotocolo "chathive.msgpack", ver ChatHiveApp.codecs):
       -> Cliente → Servidor
-        { "type": "thread.join",  "payload": { "thread_id": "<uuid>" } }
+        { "type": "thread.join",  "payload": { "thread_id": "<uuid>", "since": "<replay_id-opcional>" } }
+                                                           con since: reenvía en orden los eventos del hilo
+                                                           posteriores (ver ChatHiveApp.replay) antes de thread.joined
+        { "type": "thread.join_many", "payload": { "thread_ids": ["<uuid>", ...] } }   (hasta MAX_JOIN_MANY)
         { "type": "thread.leave", "payload": { "thread_id": "<uuid>" } }
         { "type": "message.send", "payload": { "thread_id": "<uuid>", "text": "...", "client_id": "<uuid-opcional>" } }
         { "type": "typing.start", "payload": { "thread_id": "<uuid>" } }
         { "type": "typing.stop",  "payload": { "thread_id": "<uuid>" } }
+        { "type": "thread.read", "payload": { "thread_id": "<uuid>", "message_id": "<uuid-opcional>" } }
+                                                           (sin message_id: hasta el último mensaje del hilo)
+        { "type": "message.read" | "message.delivered", "payload": { "thread_id": "<uuid>", "message_id": "<uuid>" } }
+                                                           marcas coalescidas por ventana, sin ACK (ver ChatHiveApp.receipts)
+        { "type": "batch", "payload": [ { "type": ..., "payload": ... }, ... ] }   (hasta MAX_BATCH_OPS, en orden)
 
       <- Servidor → Cliente
+        { "type": "batch", "payload": [ <frame>, ... ] }   respuestas a un batch entrante, o todo lo
+                                                           encolado en OUTBOUND_FLUSH_WINDOW si se conectó con ?batch=1
         { "type": "ready", "payload": { "user_id": "<id>" } }
         { "type": "thread.joined", "payload": { "thread_id": "<uuid>" } }
-        { "type": "thread.left", "payload": { "thread_id": "<uuid>" } }
+                                    con since: + { "replayed": N, "gap": bool, "last_id": "<replay_id|null>" };
+                                    gap=true -> el registro ya no cubre 'since': recargar por REST y seguir desde last_id;
+                                    lo reenviado empieza REPLAY_REORDER_WINDOW antes de 'since' (puede repetir lo visto)
+        { "type": "thread.joined_many", "payload": { "thread_ids": [...], "forbidden": [...] } }   (también tras
+                                                           conectar con ?subscribe=all: todos los hilos activos)
+        { "type": "thread.left", "payload": { "thread_id": "<uuid>", "reason": "removed" (si lo sacaron del hilo) } }
         { "type": "error", "payload": { "code": "FORBIDDEN|BAD_REQUEST|...", "detail": "..." } }
-        { "type": "message.ack", "payload": { "client_id": "<uuid|None>", "id": "<uuid>", "thread_id": "<uuid>" } }
-        { "type": "message.created", "payload": { "message": { ... } } }
-        { "type": "typing", "payload": { "thread_id": "<uuid>", "user_id": "<id>", "status": "start|stop" } }
+        { "type": "message.ack", "payload": { "client_id": "<uuid|None>", "id": "<uuid>", "thread_id": "<uuid>", "seq": N } }
+        { "type": "message.created", "payload": { "message": { ..., "seq": N } } }   seq: posición densa en el hilo
+                                    (un salto de seq = eventos perdidos: reanudar con thread.join + since)
+                                    message.* y receipt.updated llevan "replay_id" (posición en el registro del hilo)
+                                    y "event_id": pueden llegar desordenados, se deduplica por event_id (no por
+                                    replay_id) y 'since' es el mayor replay_id visto
+        { "type": "typing", "payload": { "thread_id": "<uuid>", "user_ids": ["<id>", ...] } }   (quién escribe, sin uno mismo)
+        { "type": "receipt.updated", "payload": { "thread_id", "user_id", "kind", "message_id", "seq" } }   marca de otro miembro
+        { "type": "presence", "payload": { "user_id", "online", "last_seen" } }   peers DIRECT (ver ChatHiveApp.presence)
+        { "type": "inbox.thread" | "inbox.thread.added" | "inbox.thread.removed", ... }   deltas del inbox, sin
+                                                           thread.join previo (ver ChatHiveApp.realtime)
+
+    Typing: se agrega por hilo en cada conexión receptora y se emite el conjunto completo
+    como mucho una vez por TYPING_FLUSH_INTERVAL; las entradas caducan solas tras TYPING_TTL.
+
+    Membresía: los hilos verificados se cachean por conexión (thread_id -> instante de verificación);
+    al quitar a un usuario de un hilo llega "membership.revoked" por el grupo user_<id>.
+    Cada conexión se suscribe a user_<id> al conectar: por ahí llegan también los deltas del inbox.
     """
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.user = None
+        self.codec = JSON_CODEC
         self._joined_groups: Set[str] = set()  # Siempre existe, aunque falle connect
+        self._member_of: Dict[str, float] = {}
+        self._user_group: Optional[str] = None
+
+        # typing (receptor): thread_id -> {user_id: expira}, último conjunto enviado y flush programado
+        self._typing: Dict[str, Dict[str, float]] = {}
+        self._typing_shown: Dict[str, frozenset] = {}
+        self._typing_flush: Dict[str, Tuple[asyncio.TimerHandle, float]] = {}
+
+        # frames salientes agrupados
+        self._batch_out = False
+        self._hold = 0
+        self._outbox: List = []  # frames ya codificados (str|bytes según el codec)
+        self._outbox_timer: Optional[asyncio.TimerHandle] = None
+
+        # presencia: refresco periódico de esta conexión
+        self._heartbeat_timer: Optional[asyncio.TimerHandle] = None
 
     async def connect(self):
         user = self.scope.get("user")
@@ -64,10 +253,53 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         self.user = user
         print(f"✅ WS: usuario autenticado {self.user}")
 
-        await self.accept()
+        qs = parse_qs((self.scope.get("query_string") or b"").decode())
+        self._batch_out = (qs.get("batch") or [""])[0].lower() in ("1", "true", "yes")
+        subscribe_all = (qs.get("subscribe") or [""])[0].lower() == "all"
+
+        self.codec = negotiate(self.scope.get("subprotocols"))
+        await self.accept(subprotocol=self.codec.subprotocol)
+
+        self._user_group = user_group_name(self.user.id)
+        await self.channel_layer.group_add(self._user_group, self.channel_name)
+
+        await get_presence().connected(self.user.id, self.channel_name)
+        self._schedule_heartbeat()
+
         await self.send_json({"type": "ready", "payload": {"user_id": str(self.user.id)}})
 
+        if subscribe_all:
+            joined = await self._join_threads(await self._active_thread_ids(self.user.id))
+            await self.send_json({"type": "thread.joined_many", "payload": {"thread_ids": joined, "forbidden": []}})
+
     async def disconnect(self, code):
+        if self._heartbeat_timer is not None:
+            self._heartbeat_timer.cancel()
+            self._heartbeat_timer = None
+            await get_presence().disconnected(self.user.id, self.channel_name)
+
+        if self._outbox_timer is not None:
+            self._outbox_timer.cancel()
+            self._outbox_timer = None
+        self._outbox.clear()
+
+        for handle, _ in self._typing_flush.values():
+            handle.cancel()
+        self._typing_flush.clear()
+
+        # Que los demás no esperen al TTL para dejar de vernos escribiendo
+        if self.user is not None and self.user.is_authenticated:
+            try:
+                await get_typing_throttle().stop_channel(self.channel_layer, str(self.user.id), self.channel_name)
+            except Exception:
+                pass
+
+        if self._user_group:
+            try:
+                await self.channel_layer.group_discard(self._user_group, self.channel_name)
+            except Exception:
+                pass
+
         # Salir de todos los grupos suscritos en esta conexión
         for g in list(self._joined_groups):
             try:
@@ -77,7 +309,42 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         self._joined_groups.clear()
 
     # ── Entrada cliente
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        if bytes_data is not None and self.codec.binary:
+            try:
+                data = self.codec.decode(bytes_data)
+            except Exception:
+                await self._send_error("BAD_REQUEST", "Frame binario inválido")
+                return
+            await self.receive_json(data)
+            return
+        await super().receive(text_data=text_data, bytes_data=bytes_data, **kwargs)
+
     async def receive_json(self, data, **kwargs):
+        if not isinstance(data, dict):
+            await self._send_error("BAD_REQUEST", "Se esperaba un objeto")
+            return
+
+        if data.get("type") == "batch":
+            ops = data.get("payload")
+            if not isinstance(ops, list) or len(ops) > MAX_BATCH_OPS:
+                await self._send_error("BAD_REQUEST", f"batch requiere una lista de hasta {MAX_BATCH_OPS} operaciones")
+                return
+
+            # Las respuestas de todo el batch salen en un solo frame
+            self._hold += 1
+            try:
+                for op in ops:
+                    await self._dispatch(op if isinstance(op, dict) else {})
+            finally:
+                self._hold -= 1
+                if not self._hold:
+                    await self._flush_outbox()
+            return
+
+        await self._dispatch(data)
+
+    async def _dispatch(self, data: Dict):
         t = data.get("type")
         p = data.get("payload") or {}
 
@@ -85,6 +352,9 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             if t == "thread.join":
                 await self._handle_thread_join(p)
 
+            elif t == "thread.join_many":
+                await self._handle_thread_join_many(p)
+
             elif t == "thread.leave":
                 await self._handle_thread_leave(p)
 
@@ -97,6 +367,15 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             elif t == "typing.stop":
                 await self._handle_typing(p, status="stop")
 
+            elif t == "thread.read":
+                await self._handle_receipt(p, receipts.READ, require_message=False)
+
+            elif t == "message.read":
+                await self._handle_receipt(p, receipts.READ)
+
+            elif t == "message.delivered":
+                await self._handle_receipt(p, receipts.DELIVERED)
+
             else:
                 await self._send_error("BAD_REQUEST", f"Unknown type: {t}")
 
@@ -112,23 +391,95 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             return
 
         # Validar UUID format
-        try:
-            UUID(str(thread_id))
-        except Exception:
+        thread_id = normalize_thread_id(thread_id)
+        if not thread_id:
             await self._send_error("BAD_REQUEST", "thread_id inválido")
             return
 
-        # Validar membresía
-        if not await self._user_in_thread(self.user.id, thread_id):
+        since = payload.get("since")
+        if since is not None and replay.parse_replay_id(since) is None:
+            await self._send_error("BAD_REQUEST", "since inválido")
+            return
+
+        # Validar membresía (y cachearla para esta conexión)
+        if not await self._is_member(thread_id):
             await self._send_error("FORBIDDEN", "No eres miembro de este hilo")
             return
 
+        # Primero el grupo: lo publicado desde aquí llega en vivo (puede repetir lo reenviado)
         group = thread_group_name(thread_id)
         if group not in self._joined_groups:
             await self.channel_layer.group_add(group, self.channel_name)
             self._joined_groups.add(group)
 
-        await self.send_json({"type": "thread.joined", "payload": {"thread_id": thread_id}})
+        if since is None:
+            await self.send_json({"type": "thread.joined", "payload": {"thread_id": thread_id}})
+            return
+
+        missed = await replay.get_replay_log().since(group, since)
+        # Lo reenviado y thread.joined salen juntos (un frame "batch" si hay más de uno)
+        self._hold += 1
+        try:
+            for data in missed.events:
+                await self.send_json(data)
+            await self.send_json({
+                "type": "thread.joined",
+                "payload": {
+                    "thread_id": thread_id,
+                    "replayed": len(missed.events),
+                    "gap": missed.gap,
+                    "last_id": missed.last_id,
+                },
+            })
+        finally:
+            self._hold -= 1
+            if not self._hold:
+                await self._flush_outbox()
+
+    async def _handle_thread_join_many(self, payload: Dict):
+        raw = payload.get("thread_ids")
+        if not isinstance(raw, list) or not raw or len(raw) > MAX_JOIN_MANY:
+            await self._send_error("BAD_REQUEST", f"thread_ids requiere una lista de 1 a {MAX_JOIN_MANY} ids")
+            return
+
+        normalized = [normalize_thread_id(t) for t in raw]
+        if None in normalized:
+            await self._send_error("BAD_REQUEST", "thread_ids contiene ids inválidos")
+            return
+        thread_ids = list(dict.fromkeys(normalized))
+
+        # Una sola consulta para todos los que no estén en la caché de membresía
+        now = time.monotonic()
+        unknown = [
+            t for t in thread_ids
+            if not (t in self._member_of and now - self._member_of[t] < MEMBERSHIP_CACHE_TTL)
+        ]
+        allowed = set(thread_ids) - set(unknown)
+        if unknown:
+            allowed |= set(await self._member_thread_ids(self.user.id, unknown))
+        for t in unknown:
+            if t not in allowed:
+                self._member_of.pop(t, None)
+
+        joined = await self._join_threads([t for t in thread_ids if t in allowed])
+        forbidden = [t for t in thread_ids if t not in allowed]
+        await self.send_json({"type": "thread.joined_many", "payload": {"thread_ids": joined, "forbidden": forbidden}})
+
+    async def _join_threads(self, thread_ids: List[str]) -> List[str]:
+        """
+        group_add de varios hilos (ya verificados) en un pipeline de Redis por shard
+        (realtime.group_add_many).
+        """
+        now = time.monotonic()
+        pending = []
+        for thread_id in thread_ids:
+            self._member_of[thread_id] = now
+            group = thread_group_name(thread_id)
+            if group not in self._joined_groups:
+                pending.append(group)
+        await group_add_many(self.channel_layer, pending, self.channel_name)
+        self._joined_groups.update(pending)
+        return list(thread_ids)
 
     async def _handle_thread_leave(self, payload: Dict):
         thread_id = payload.get("thread_id")
@@ -136,10 +487,12 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             await self._send_error("BAD_REQUEST", "thread_id es requerido")
             return
 
+        thread_id = normalize_thread_id(thread_id) or thread_id
         group = thread_group_name(thread_id)
         if group in self._joined_groups:
             await self.channel_layer.group_discard(group, self.channel_name)
             self._joined_groups.discard(group)
+        self._clear_typing(thread_id)
 
         await self.send_json({"type": "thread.left", "payload": {"thread_id": thread_id}})
 
@@ -155,38 +508,44 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             await self._send_error("BAD_REQUEST", "text no puede estar vacío")
             return
 
+        thread_id = normalize_thread_id(thread_id)
+        if not thread_id:
+            await self._send_error("BAD_REQUEST", "thread_id inválido")
+            return
+
         # Validar membresía
-        if not await self._user_in_thread(self.user.id, thread_id):
+        if not await self._is_member(thread_id):
             await self._send_error("FORBIDDEN", "No eres miembro de este hilo")
             return
 
-        # Persistir (con idempotencia por client_id)
-        msg = await self._create_or_get_message(thread_id, self.user.id, text, client_id)
+        # Persistir (con idempotencia por client_id) en el siguiente lote del writer
+        msg = await get_message_writer().submit(thread_id, self.user.id, text, client_id)
+
+        # Los receptores lo sacan de "escribiendo" con message.created: su próximo "start" sale ya
+        get_typing_throttle().reset(thread_id, str(self.user.id))
 
         # ACK inmediato al emisor (reconciliar client_id → id)
         await self.send_json({
             "type": "message.ack",
-            "payload": {"client_id": client_id, "id": str(msg.id), "thread_id": thread_id},
+            "payload": {"client_id": client_id, "id": str(msg.id), "thread_id": thread_id, "seq": msg.seq},
         })
 
         # Broadcast al grupo
         group = thread_group_name(thread_id)
-        event = {
-            "type": "thread.event",
-            "data": {
-                "type": "message.created",
-                "payload": {
-                    "message": {
-                        "id": str(msg.id),
-                        "thread_id": thread_id,
-                        "sender_id": str(msg.sender_id) if msg.sender_id else None,
-                        "text": msg.text,
-                        "type": msg.type,
-                        "created_at": msg.created_at.isoformat(),
-                    }
-                },
+        event = thread_event_message(await replay.arecord(group, {
+            "type": "message.created",
+            "payload": {
+                "message": {
+                    "id": str(msg.id),
+                    "thread_id": thread_id,
+                    "sender_id": str(msg.sender_id) if msg.sender_id else None,
+                    "seq": msg.seq,
+                    "text": msg.text,
+                    "type": msg.type,
+                    "created_at": msg.created_at.isoformat(),
+                }
             },
-        }
+        }))
         await self.channel_layer.group_send(group, event)
 
     async def _handle_typing(self, payload: Dict, status: str):
@@ -195,66 +554,223 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             await self._send_error("BAD_REQUEST", "thread_id es requerido")
             return
 
-        if not await self._user_in_thread(self.user.id, thread_id):
+        thread_id = normalize_thread_id(thread_id)
+        if not thread_id:
+            await self._send_error("BAD_REQUEST", "thread_id inválido")
+            return
+
+        if not await self._is_member(thread_id):
             await self._send_error("FORBIDDEN", "No eres miembro de este hilo")
             return
 
-        # Notificar al grupo (sin persistencia)
-        group = thread_group_name(thread_id)
-        await self.channel_layer.group_send(
-            group,
-            {
-                "type": "thread.event",
-                "data": {
-                    "type": "typing",
-                    "payload": {"thread_id": thread_id, "user_id": str(self.user.id), "status": status},
-                },
-            },
+        # Solo cambios de estado (y un refresco cada TYPING_REFRESH) llegan al grupo: TypingThrottle
+        await self._broadcast_typing(thread_id, status)
+
+    async def _handle_receipt(self, payload: Dict, kind: str, require_message: bool = True):
+        thread_id = normalize_thread_id(payload.get("thread_id"))
+        if not thread_id:
+            await self._send_error("BAD_REQUEST", "thread_id inválido")
+            return
+
+        message_id = payload.get("message_id")
+        if message_id is not None or require_message:
+            message_id = normalize_thread_id(message_id)
+            if not message_id:
+                await self._send_error("BAD_REQUEST", "message_id inválido")
+                return
+
+        if not await self._is_member(thread_id):
+            await self._send_error("FORBIDDEN", "No eres miembro de este hilo")
+            return
+
+        # Se escribe al cerrar la ventana; el resultado llega como inbox.thread / receipt.updated
+        get_receipt_coalescer().submit(self.user.id, thread_id, kind, message_id)
+
+    async def _broadcast_typing(self, thread_id: str, status: str):
+        # Notificar al grupo (sin persistencia), limitado por (hilo, emisor) en origen
+        await get_typing_throttle().submit(
+            self.channel_layer, thread_id, str(self.user.id), status, self.channel_name
         )
 
     # ── Fan-out handler (desde group_send)
     async def thread_event(self, event):
-        # Reenvía tal cual el payload
-        await self.send_json(event["data"])
+        # Reenvía el frame pre-codificado (transcodificado si nuestro codec no es JSON)
+        await self._send_wire(frame_for(self.codec, event["frames"]))
+
+        # Quien acaba de enviar un mensaje ya no está escribiendo
+        if event.get("kind") == "message.created":
+            data = JSON_CODEC.decode(event["frames"][JSON_CODEC.name])
+            message = data.get("payload", {}).get("message", {})
+            users = self._typing.get(message.get("thread_id"))
+            if users and users.pop(message.get("sender_id"), None) is not None:
+                self._schedule_typing_flush(message["thread_id"], TYPING_FLUSH_INTERVAL)
+
+    async def typing_event(self, event):
+        """
+        Agrega typing por hilo; nunca devuelve el eco a la conexión (ni al usuario) que lo originó.
+        """
+        if event.get("sender_channel") == self.channel_name or event["user_id"] == str(self.user.id):
+            return
+
+        thread_id = event["thread_id"]
+        users = self._typing.setdefault(thread_id, {})
+        known = event["user_id"] in users
+
+        if event["status"] == "start":
+            users[event["user_id"]] = time.monotonic() + TYPING_TTL
+            if known:
+                return  # solo refresco de expiración: el conjunto no cambia
+        else:
+            if not known:
+                return
+            users.pop(event["user_id"], None)
+
+        self._schedule_typing_flush(thread_id, TYPING_FLUSH_INTERVAL)
+
+    def _schedule_typing_flush(self, thread_id: str, delay: float):
+        loop = asyncio.get_running_loop()
+        due = loop.time() + delay
+        current = self._typing_flush.get(thread_id)
+        if current is not None:
+            if current[1] <= due:
+                return
+            current[0].cancel()
+        handle = loop.call_at(due, lambda: asyncio.ensure_future(self._flush_typing(thread_id)))
+        self._typing_flush[thread_id] = (handle, due)
+
+    async def _flush_typing(self, thread_id: str):
+        self._typing_flush.pop(thread_id, None)
+
+        now = time.monotonic()
+        users = self._typing.get(thread_id, {})
+        for user_id, expires in list(users.items()):
+            if expires <= now:
+                users.pop(user_id)
+
+        current = frozenset(users)
+        if current != self._typing_shown.get(thread_id, frozenset()):
+            self._typing_shown[thread_id] = current
+            await self.send_json(
+                {"type": "typing", "payload": {"thread_id": thread_id, "user_ids": sorted(current)}}
+            )
+
+        if users:
+            # Próxima expiración
+            self._schedule_typing_flush(thread_id, max(min(users.values()) - now, TYPING_FLUSH_INTERVAL))
+        else:
+            self._typing.pop(thread_id, None)
+            self._typing_shown.pop(thread_id, None)
+
+    def _clear_typing(self, thread_id: str):
+        entry = self._typing_flush.pop(thread_id, None)
+        if entry is not None:
+            entry[0].cancel()
+        self._typing.pop(thread_id, None)
+        self._typing_shown.pop(thread_id, None)
+
+    # ── Eventos dirigidos al usuario (grupo user_<id>)
+    async def membership_revoked(self, event):
+        """
+        El usuario ya no es miembro activo: invalida la caché y lo saca del grupo del hilo.
+        """
+        thread_id = event["thread_id"]
+        self._member_of.pop(thread_id, None)
+        self._clear_typing(thread_id)
+
+        group = thread_group_name(thread_id)
+        if group in self._joined_groups:
+            await self.channel_layer.group_discard(group, self.channel_name)
+            self._joined_groups.discard(group)
+
+        await self.send_json({"type": "thread.left", "payload": {"thread_id": thread_id, "reason": "removed"}})
+        await self.send_json({"type": "inbox.thread.removed", "payload": {"thread_id": thread_id}})
+
+    # ── Presencia
+    def _schedule_heartbeat(self):
+        self._heartbeat_timer = asyncio.get_running_loop().call_later(
+            PRESENCE_HEARTBEAT, lambda: asyncio.ensure_future(self._heartbeat())
+        )
+
+    async def _heartbeat(self):
+        if self._heartbeat_timer is None:
+            return  # ya desconectado
+        await get_presence().heartbeat(self.user.id, self.channel_name)
+        self._schedule_heartbeat()
+
+    # ── Membresía (caché por conexión)
+    async def _is_member(self, thread_id: str) -> bool:
+        verified_at = self._member_of.get(thread_id)
+        if verified_at is not None and time.monotonic() - verified_at < MEMBERSHIP_CACHE_TTL:
+            return True
+
+        ok = await self._user_in_thread(self.user.id, thread_id)
+        if ok:
+            self._member_of[thread_id] = time.monotonic()
+        else:
+            self._member_of.pop(thread_id, None)
+        return ok
+
+    # ── Salida agrupada
+    async def send_json(self, content, close=False):
+        await self._send_wire(self.codec.encode(content), close=close)
+
+    async def _send_wire(self, wire, close=False):
+        if close:
+            await self._flush_outbox()
+        if close or not (self._hold or self._batch_out):
+            return await self._send_frame(wire, close=close)
+
+        self._outbox.append(wire)
+        if self._hold:
+            return
+        if len(self._outbox) >= OUTBOUND_BATCH_MAX:
+            await self._flush_outbox()
+        elif self._outbox_timer is None:
+            self._outbox_timer = asyncio.get_running_loop().call_later(
+                OUTBOUND_FLUSH_WINDOW, lambda: asyncio.ensure_future(self._flush_outbox(from_timer=True))
+            )
+
+    async def _flush_outbox(self, from_timer: bool = False):
+        if from_timer and self._hold:
+            return  # lo envía el final del batch entrante
+        if self._outbox_timer is not None:
+            self._outbox_timer.cancel()
+            self._outbox_timer = None
+
+        frames, self._outbox = self._outbox, []
+        if not frames:
+            return
+        await self._send_frame(frames[0] if len(frames) == 1 else self.codec.encode_batch(frames))
+
+    async def _send_frame(self, wire, close=False):
+        if self.codec.binary:
+            await self.send(bytes_data=wire, close=close)
+        else:
+            await self.send(text_data=wire, close=close)
 
     # ── Helpers de envío de errores
     async def _send_error(self, code: str, detail: str):
         await self.send_json({"type": "error", "payload": {"code": code, "detail": detail}})
 
     # ── Helpers DB (async)
+    @database_sync_to_async
+    def _member_thread_ids(self, user_id, thread_ids) -> List[str]:
+        return [
+            str(t)
+            for t in ThreadMember.objects.filter(
+                user_id=user_id, thread_id__in=thread_ids, is_active=True
+            ).values_list("thread_id", flat=True)
+        ]
+
+    @database_sync_to_async
+    def _active_thread_ids(self, user_id) -> List[str]:
+        return [
+            str(t)
+            for t in ThreadMember.objects.filter(user_id=user_id, is_active=True).values_list("thread_id", flat=True)
+        ]
+
     @database_sync_to_async
     def _user_in_thread(self, user_id, thread_id) -> bool:
         return ThreadMember.objects.filter(
             user_id=user_id, thread_id=thread_id, is_active=True
         ).exists()
-
-    @database_sync_to_async
-    def _create_or_get_message(self, thread_id, user_id, text, client_id=None) -> Message:
-        """
-        Idempotencia:
-          - Si llega client_id y ya existe (UniqueConstraint en (thread, client_id)), regresa el existente.
-          - Si no, crea el mensaje y actualiza last_message_* del Thread.
-        """
-        if client_id:
-            existing = Message.objects.filter(thread_id=thread_id, client_id=client_id).first()
-            if existing:
-                return existing
-
-        with transaction.atomic():
-            try:
-                msg = Message.objects.create(
-                    thread_id=thread_id,
-                    sender_id=user_id,
-                    type=MessageType.TEXT,
-                    text=text,
-                    client_id=client_id,
-                )
-            except IntegrityError:
-                # colisión por client_id concurrente (otro proceso lo creó primero)
-                msg = Message.objects.get(thread_id=thread_id, client_id=client_id)
-
-            Thread.objects.filter(id=thread_id).update(
-                last_message_at=timezone.now(),
-                last_message_id=msg.id,
-            )
-            return msg
@@ -0,0 +1,435 @@
+# ChatHiveApp/hot_window.py
+"""
+Ventana caliente: los HOT_WINDOW_SIZE mensajes más recientes de cada hilo, ya serializados.
+
+Abrir un hilo pide siempre la misma primera página; aquí se sirve sin consultar Message
+(MessageViewSet.list, sin anclas ni ?page=). Se guarda en el Redis del channel layer:
+  - chathive:hot:v2:<thread>:z  ZSET message_id -> seq (orden del hilo)
+  - chathive:hot:v2:<thread>:h  HASH message_id -> JSON del mensaje; "~more" = hay mensajes más antiguos
+  - chathive:hot:v2:<thread>:v  versión del hilo: la sube cada escritura
+La versión nace del reloj (µs) cuando no existe, así que tras expirar nunca repite un
+valor anterior; el ETag del historial la combina con la fila del Thread (ver
+MessageViewSet.history_version).
+Sin Redis (tests / InMemoryChannelLayer) se usa un LRU en proceso con el mismo contrato.
+
+Caminos de escritura (tras el commit): crear añade y recorta al tamaño, editar/borrar
+(soft delete) reemplaza la entrada si está en la ventana, y un borrado físico invalida
+el hilo. Un fallo llena la ventana desde la BD solo si la versión no cambió mientras
+se leía (una escritura concurrente nunca queda tapada por una foto vieja).
+Un cambio de perfil de un miembro (nombre, email) invalida las ventanas de sus hilos
+(ChatHiveApp.signals.sender_profile_saved).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from rest_framework.utils.encoders import JSONEncoder
+
+from ChatHiveApp.models import Message
+from ChatHiveApp.realtime import channel_layer_redis
+
+logger = logging.getLogger(__name__)
+
+HOT_WINDOW_SIZE = 50
+HOT_WINDOW_TTL = 300  # segundos
+HOT_WINDOW_MAX_THREADS = 2000  # solo el LRU en proceso
+VERSION_TTL = 86400
+
+# v2: ZSET por seq y JSON con "seq"; las ventanas v1 (por created_at) expiran solas
+KEY_PREFIX = "chathive:hot:v2"
+MORE_FIELD = "~more"
+
+# (message_id, score = seq, json)
+Row = Tuple[str, int, str]
+
+
+def _score(message: Message) -> int:
+    return message.seq
+
+
+# ─────────────────────────────────────────────────────────
+# Stores
+# ─────────────────────────────────────────────────────────
+# Crea la versión (segundos del reloj de Redis en µs) si no existe; la deja en 'version'
+_ENSURE_VERSION = """
+if redis.call('EXISTS', KEYS[3]) == 0 then
+  redis.call('SET', KEYS[3], redis.call('TIME')[1] .. '000000')
+end
+"""
+
+_BUMP_VERSION = _ENSURE_VERSION + """
+redis.call('INCR', KEYS[3])
+"""
+
+_VERSION = _ENSURE_VERSION + """
+redis.call('EXPIRE', KEYS[3], ARGV[1])
+return redis.call('GET', KEYS[3])
+"""
+
+_FILL = """
+if (tonumber(redis.call('GET', KEYS[3]) or '0')) ~= tonumber(ARGV[1]) then return 0 end
+redis.call('DEL', KEYS[1], KEYS[2])
+redis.call('HSET', KEYS[2], '~more', ARGV[2])
+for i = 5, #ARGV, 3 do
+  redis.call('ZADD', KEYS[1], ARGV[i + 1], ARGV[i])
+  redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 2])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return 1
+"""
+
+_APPEND = _BUMP_VERSION + """
+redis.call('EXPIRE', KEYS[3], ARGV[3])
+if redis.call('EXISTS', KEYS[2]) == 0 then return 0 end
+for i = 4, #ARGV, 3 do
+  redis.call('ZADD', KEYS[1], ARGV[i + 1], ARGV[i])
+  redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 2])
+end
+local extra = redis.call('ZCARD', KEYS[1]) - tonumber(ARGV[1])
+if extra > 0 then
+  local old = redis.call('ZRANGE', KEYS[1], 0, extra - 1)
+  redis.call('ZREMRANGEBYRANK', KEYS[1], 0, extra - 1)
+  redis.call('HDEL', KEYS[2], unpack(old))
+  redis.call('HSET', KEYS[2], '~more', '1')
+end
+return 1
+"""
+
+_PATCH = _BUMP_VERSION + """
+redis.call('EXPIRE', KEYS[3], ARGV[1])
+for i = 2, #ARGV, 2 do
+  if redis.call('HEXISTS', KEYS[2], ARGV[i]) == 1 then
+    redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 1])
+  end
+end
+return 1
+"""
+
+_INVALIDATE = _BUMP_VERSION + """
+redis.call('EXPIRE', KEYS[3], ARGV[1])
+redis.call('DEL', KEYS[1], KEYS[2])
+return 1
+"""
+
+_READ = """
+if redis.call('EXISTS', KEYS[2]) == 0 then return false end
+local ids = redis.call('ZREVRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+local values = {}
+if #ids > 0 then values = redis.call('HMGET', KEYS[2], unpack(ids)) end
+return {values, redis.call('HGET', KEYS[2], '~more') or '0', redis.call('ZCARD', KEYS[1])}
+"""
+
+
+class RedisHotWindowStore:
+    def __init__(self, client):
+        self.redis = client
+        self._fill = client.register_script(_FILL)
+        self._append = client.register_script(_APPEND)
+        self._patch = client.register_script(_PATCH)
+        self._invalidate = client.register_script(_INVALIDATE)
+        self._version = client.register_script(_VERSION)
+        self._read = client.register_script(_READ)
+
+    @staticmethod
+    def _keys(thread_id) -> List[str]:
+        return [f"{KEY_PREFIX}:{thread_id}:z", f"{KEY_PREFIX}:{thread_id}:h", f"{KEY_PREFIX}:{thread_id}:v"]
+
+    def version(self, thread_id) -> int:
+        return int(self._version(keys=self._keys(thread_id), args=[VERSION_TTL]))
+
+    def fill(self, thread_id, version: int, rows: List[Row], more: bool) -> bool:
+        args = [version, int(more), HOT_WINDOW_TTL, 0]
+        for row in rows:
+            args.extend(row)
+        return bool(self._fill(keys=self._keys(thread_id), args=args))
+
+    def append(self, thread_id, rows: List[Row]) -> None:
+        args = [HOT_WINDOW_SIZE, 0, VERSION_TTL]
+        for row in rows:
+            args.extend(row)
+        self._append(keys=self._keys(thread_id), args=args)
+
+    def patch(self, thread_id, rows: List[Row]) -> None:
+        args = [VERSION_TTL]
+        for message_id, _, data in rows:
+            args.extend([message_id, data])
+        self._patch(keys=self._keys(thread_id), args=args)
+
+    def invalidate(self, thread_id) -> None:
+        self._invalidate(keys=self._keys(thread_id), args=[VERSION_TTL])
+
+    def read(self, thread_id, size: int) -> Optional[Tuple[List[str], bool]]:
+        res = self._read(keys=self._keys(thread_id), args=[size])
+        if not res:
+            return None
+        values, more, total = res
+        if any(v is None for v in values):
+            return None  # entrada a medio recortar: se trata como fallo
+        return [_str(v) for v in values], _str(more) == "1" or int(total) > size
+
+    def footprint(self, thread_id) -> dict:
+        z, h, _ = self._keys(thread_id)
+        with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zcard(z)
+            pipe.memory_usage(z)
+            pipe.memory_usage(h)
+            count, z_bytes, h_bytes = pipe.execute()
+        return {"messages": count, "bytes": (z_bytes or 0) + (h_bytes or 0)}
+
+    def size(self) -> Optional[int]:
+        return None  # no se recorre el keyspace de Redis
+
+
+class MemoryHotWindowStore:
+    """
+    Mismo contrato que RedisHotWindowStore: LRU de hilos en proceso, acotado a HOT_WINDOW_MAX_THREADS.
+    """
+
+    def __init__(self, max_threads: int = HOT_WINDOW_MAX_THREADS):
+        self.max_threads = max_threads
+        # thread_id -> (expira, {message_id: (score, json)}, more)
+        self._windows: "OrderedDict[str, Tuple[float, Dict[str, Tuple[int, str]], bool]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, thread_id):
+        entry = self._windows.get(thread_id)
+        if entry is not None and entry[0] <= time.monotonic():
+            del self._windows[thread_id]
+            return None
+        return entry
+
+    def _bump(self, key: str) -> None:
+        self._versions[key] = self._versions.get(key, _clock_version()) + 1
+
+    def version(self, thread_id) -> int:
+        with self._lock:
+            return self._versions.setdefault(str(thread_id), _clock_version())
+
+    def fill(self, thread_id, version, rows, more) -> bool:
+        key = str(thread_id)
+        with self._lock:
+            if self._versions.get(key) != version:
+                return False
+            self._windows[key] = (time.monotonic() + HOT_WINDOW_TTL, {i: (s, d) for i, s, d in rows}, more)
+            self._windows.move_to_end(key)
+            while len(self._windows) > self.max_threads:
+                self._windows.popitem(last=False)
+            return True
+
+    def append(self, thread_id, rows) -> None:
+        key = str(thread_id)
+        with self._lock:
+            self._bump(key)
+            entry = self._live(key)
+            if entry is None:
+                return
+            expires, window, more = entry
+            for message_id, score, data in rows:
+                window[message_id] = (score, data)
+            if len(window) > HOT_WINDOW_SIZE:
+                for message_id, _ in sorted(window.items(), key=lambda kv: (kv[1][0], kv[0]))[
+                    : len(window) - HOT_WINDOW_SIZE
+                ]:
+                    del window[message_id]
+                more = True
+            self._windows[key] = (expires, window, more)
+
+    def patch(self, thread_id, rows) -> None:
+        key = str(thread_id)
+        with self._lock:
+            self._bump(key)
+            entry = self._live(key)
+            if entry is None:
+                return
+            window = entry[1]
+            for message_id, _, data in rows:
+                if message_id in window:
+                    window[message_id] = (window[message_id][0], data)
+
+    def invalidate(self, thread_id) -> None:
+        key = str(thread_id)
+        with self._lock:
+            self._bump(key)
+            self._windows.pop(key, None)
+
+    def read(self, thread_id, size: int):
+        key = str(thread_id)
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                return None
+            self._windows.move_to_end(key)
+            _, window, more = entry
+            ordered = sorted(window.items(), key=lambda kv: (kv[1][0], kv[0]), reverse=True)
+            return [data for _, (_, data) in ordered[:size]], more or len(window) > size
+
+    def footprint(self, thread_id) -> dict:
+        with self._lock:
+            entry = self._live(str(thread_id))
+            window = entry[1] if entry else {}
+            # Aproximado: JSON + id (36) + score
+            return {"messages": len(window), "bytes": sum(len(data) + 44 for _, data in window.values())}
+
+    def size(self) -> Optional[int]:
+        return len(self._windows)
+
+
+def _clock_version() -> int:
+    return int(time.time()) * 1_000_000
+
+
+def _str(value) -> str:
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+# ─────────────────────────────────────────────────────────
+# Servicio
+# ─────────────────────────────────────────────────────────
+class HotWindow:
+    def __init__(self):
+        self._store = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.fills = 0
+        self.stale_fills = 0  # fills descartados por una escritura concurrente
+        self.errors = 0
+
+    @property
+    def store(self):
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    client = channel_layer_redis(aio=False)
+                    self._store = RedisHotWindowStore(client) if client is not None else MemoryHotWindowStore()
+        return self._store
+
+    @staticmethod
+    def _rows(messages: Iterable[Message]) -> List[Row]:
+        from ChatHiveApp.serializers import MessageSerializer
+
+        messages = list(messages)
+        prefetch_related_objects([m for m in messages if not Message.sender.is_cached(m)], "sender")
+        return [
+            (str(m.id), _score(m), json.dumps(MessageSerializer(m).data, cls=JSONEncoder, separators=(",", ":")))
+            for m in messages
+        ]
+
+    # ── Lectura
+    def version(self, thread_id) -> Optional[int]:
+        """
+        Versión actual del hilo (cambia con cada escritura de mensajes), o None si el store falla.
+        """
+        try:
+            return self.store.version(thread_id)
+        except Exception:
+            self.errors += 1
+            logger.exception("hot_window: versión no disponible para %s", thread_id)
+            return None
+
+    def first_page(self, thread_id, size: int) -> Optional[Tuple[List[dict], bool]]:
+        """
+        (mensajes más nuevos primero, hay_más) desde la ventana, o None si no está cacheada.
+        """
+        try:
+            cached = self.store.read(thread_id, size)
+        except Exception:
+            self.errors += 1
+            logger.exception("hot_window: lectura fallida de %s", thread_id)
+            return None
+        if cached is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        values, more = cached
+        return [json.loads(v) for v in values], more
+
+    def load(self, thread_id, size: int) -> Tuple[List[dict], bool]:
+        """
+        Fallo: lee HOT_WINDOW_SIZE (+1) mensajes de la BD, intenta guardar la ventana y
+        devuelve la primera página desde esos mismos datos.
+        """
+        version = self.version(thread_id)
+        messages = list(
+            Message.objects.filter(thread_id=thread_id)
+            .select_related("sender")
+            .order_by("-seq")[: HOT_WINDOW_SIZE + 1]
+        )
+        more = len(messages) > HOT_WINDOW_SIZE
+        rows = self._rows(messages[:HOT_WINDOW_SIZE])
+
+        if version is not None:
+            try:
+                if self.store.fill(thread_id, version, rows, more):
+                    self.fills += 1
+                else:
+                    self.stale_fills += 1
+            except Exception:
+                self.errors += 1
+                logger.exception("hot_window: no se pudo llenar %s", thread_id)
+
+        return [json.loads(data) for _, _, data in rows[:size]], more or len(rows) > size
+
+    # ── Escrituras (tras el commit)
+    def _apply(self, op: str, thread_id, messages=None) -> None:
+        try:
+            if op == "invalidate":
+                self.store.invalidate(thread_id)
+            else:
+                getattr(self.store, op)(thread_id, self._rows(messages))
+        except Exception:
+            self.errors += 1
+            logger.exception("hot_window: %s fallido en %s", op, thread_id)
+            try:
+                self.store.invalidate(thread_id)
+            except Exception:
+                pass
+
+    def _on_commit(self, op: str, messages: Iterable[Message]) -> None:
+        by_thread: Dict[str, List[Message]] = {}
+        for m in messages:
+            by_thread.setdefault(str(m.thread_id), []).append(m)
+        for thread_id, msgs in by_thread.items():
+            transaction.on_commit(lambda t=thread_id, ms=msgs: self._apply(op, t, ms))
+
+    def messages_created(self, messages: Iterable[Message]) -> None:
+        self._on_commit("append", messages)
+
+    def messages_changed(self, messages: Iterable[Message]) -> None:
+        """
+        Edición o soft delete: se reemplaza la entrada si sigue dentro de la ventana.
+        """
+        self._on_commit("patch", messages)
+
+    def invalidate(self, thread_id) -> None:
+        transaction.on_commit(lambda: self._apply("invalidate", thread_id))
+
+    def stats(self) -> dict:
+        reads = self.hits + self.misses
+        return {
+            "backend": type(self.store).__name__,
+            "window_size": HOT_WINDOW_SIZE,
+            "ttl": HOT_WINDOW_TTL,
+            "threads": self.store.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / reads, 4) if reads else None,
+            "fills": self.fills,
+            "stale_fills": self.stale_fills,
+            "errors": self.errors,
+        }
+
+    def footprint(self, thread_id) -> dict:
+        return {"thread_id": str(thread_id), **self.store.footprint(thread_id)}
+
+
+hot_window = HotWindow()
@@ -0,0 +1,84 @@
+# ChatHiveApp/inbox.py
+"""
+Snapshot del último mensaje guardado en Thread (last_message_*).
+
+La sidebar se pinta solo con columnas de Thread: los caminos de escritura
+(WS, REST, directos, admin) llaman a estos helpers en vez de que el inbox
+resuelva el último mensaje con subqueries.
+"""
+from __future__ import annotations
+
+from django.db.models import Q
+from django.db.models.functions import Now
+
+from ChatHiveApp.models import Message, Thread, ThreadMember
+
+PREVIEW_LENGTH = 140
+
+
+def last_message_fields(message: Message | None) -> dict:
+    """
+    Campos de Thread que describen 'message' como último mensaje (o vacío si None).
+    """
+    if message is None:
+        return {
+            "last_message_id": None,
+            "last_message_at": None,
+            "last_message_preview": "",
+            "last_message_sender_id": None,
+            "last_message_type": "",
+            "last_message_deleted": False,
+            "last_message_seq": None,
+        }
+    return {
+        "last_message_id": message.id,
+        "last_message_at": message.created_at,
+        "last_message_preview": "" if message.deleted_at else (message.text or "")[:PREVIEW_LENGTH],
+        "last_message_sender_id": message.sender_id,
+        "last_message_type": message.type,
+        "last_message_deleted": message.deleted_at is not None,
+        "last_message_seq": message.seq,
+    }
+
+
+def touch_members(thread_id) -> int:
+    """
+    Marca como cambiada la fila del inbox de todos los miembros (para ?changed_since=).
+    """
+    return ThreadMember.objects.filter(thread_id=thread_id).update(updated_at=Now())
+
+
+def set_last_message(message: Message) -> int:
+    """
+    Solo hacia adelante por seq: un escritor que confirma tarde no pisa un mensaje posterior.
+    """
+    qs = Thread.objects.filter(id=message.thread_id)
+    if message.seq is not None:
+        qs = qs.filter(Q(last_message_seq__isnull=True) | Q(last_message_seq__lt=message.seq))
+    return qs.update(**last_message_fields(message))
+
+
+def patch_last_message(message: Message) -> int:
+    """
+    Edición/borrado: solo toca el hilo si 'message' es su último mensaje (un UPDATE condicional).
+    """
+    updated = Thread.objects.filter(id=message.thread_id, last_message_id=message.id).update(
+        **last_message_fields(message)
+    )
+    if updated:
+        touch_members(message.thread_id)
+    return updated
+
+
+def refresh_last_message(thread_id) -> Message | None:
+    """
+    Recalcula el snapshot con el último mensaje NO eliminado del hilo.
+    """
+    last = (
+        Message.objects.filter(thread_id=thread_id, deleted_at__isnull=True)
+        .order_by("-seq")
+        .first()
+    )
+    Thread.objects.filter(id=thread_id).update(**last_message_fields(last))
+    touch_members(thread_id)
+    return last
@@ -0,0 +1,68 @@
+# ChatHiveApp/management/commands/bench_rest_writes.py
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.signals import post_delete
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from ChatHiveApp.models import Thread, ThreadKind, ThreadMember
+from ChatHiveApp.publisher import get_publisher
+from ChatHiveApp.realtime import channel_layer_redis
+from ChatHiveApp.signals import membership_deleted
+
+
+class Command(BaseCommand):
+    help = (
+        "Latencia de POST /api/chat/threads/<id>/messages/ con envío realtime dentro de la request "
+        "(REALTIME_OUTBOX=False): async_to_sync por llamada (inline) vs publisher de fondo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=300)
+        parser.add_argument("--members", type=int, default=20)
+
+    def handle(self, *args, **options):
+        # Con InMemoryChannelLayer el publisher envía en línea: ambos modos serían el mismo
+        if channel_layer_redis(aio=False) is None:
+            raise CommandError("bench_rest_writes necesita el channel layer de Redis (CHANNEL_LAYERS)")
+        tag = uuid.uuid4().hex[:8]
+        users = [
+            User.objects.create_user(email=f"bench-{tag}-{i}@chathive.invalid", password=None)
+            for i in range(options["members"])
+        ]
+        thread = Thread.objects.create(kind=ThreadKind.GROUP, title=f"bench {tag}", created_by=users[0])
+        ThreadMember.objects.bulk_create([ThreadMember(thread=thread, user=u) for u in users])
+
+        client = APIClient()
+        client.force_authenticate(users[0])
+        url = f"/api/chat/threads/{thread.id}/messages/"
+
+        try:
+            for mode in ("inline", "publisher"):
+                with override_settings(REALTIME_OUTBOX=False, REALTIME_PUBLISHER=(mode == "publisher"),
+                                       ALLOWED_HOSTS=["*"]):
+                    latencies = []
+                    for n in range(options["requests"]):
+                        t0 = time.perf_counter()
+                        resp = client.post(url, {"text": f"bench {n}"}, format="json")
+                        latencies.append(time.perf_counter() - t0)
+                        if resp.status_code != 201:
+                            raise RuntimeError(f"{resp.status_code}: {resp.content[:200]}")
+                latencies.sort()
+                p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+                self.stdout.write(
+                    f"{mode:>9}: p50 {statistics.median(latencies) * 1000:6.2f} ms   "
+                    f"p99 {p99 * 1000:6.2f} ms   mean {statistics.mean(latencies) * 1000:6.2f} ms"
+                )
+            self.stdout.write(f"publisher: {get_publisher().stats()}")
+        finally:
+            post_delete.disconnect(membership_deleted, sender=ThreadMember)
+            try:
+                thread.delete()
+                User.objects.filter(id__in=[u.id for u in users]).delete()
+            finally:
+                post_delete.connect(membership_deleted, sender=ThreadMember)
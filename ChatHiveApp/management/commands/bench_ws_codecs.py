@@ -0,0 +1,51 @@
+# ChatHiveApp/management/commands/bench_ws_codecs.py
+import timeit
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ChatHiveApp.codecs import CODECS
+
+
+def _message_created(text: str) -> dict:
+    return {
+        "type": "message.created",
+        "payload": {
+            "message": {
+                "id": str(uuid.uuid4()),
+                "thread_id": str(uuid.uuid4()),
+                "sender_id": str(uuid.uuid4()),
+                "text": text,
+                "type": "TEXT",
+                "created_at": timezone.now().isoformat(),
+            }
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = "Compara los codecs del WebSocket (json vs msgpack): CPU de encode/decode y bytes por frame."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        n = options["iterations"]
+        frames = {
+            "message.created": _message_created("¿Nos vemos mañana a las 10 en la oficina? Llevo los documentos."),
+            "typing": {
+                "type": "typing",
+                "payload": {"thread_id": str(uuid.uuid4()), "user_ids": [str(uuid.uuid4()) for _ in range(3)]},
+            },
+            "batch x20": {"type": "batch", "payload": [_message_created(f"mensaje {i}") for i in range(20)]},
+        }
+
+        self.stdout.write(f"{'frame':<16} {'codec':<8} {'bytes':>7} {'encode µs':>10} {'decode µs':>10}")
+        for label, frame in frames.items():
+            for name, codec in CODECS.items():
+                wire = codec.encode(frame)
+                size = len(wire.encode()) if isinstance(wire, str) else len(wire)
+                enc = timeit.timeit(lambda: codec.encode(frame), number=n) / n * 1e6
+                dec = timeit.timeit(lambda: codec.decode(wire), number=n) / n * 1e6
+                self.stdout.write(f"{label:<16} {name:<8} {size:>7} {enc:>10.2f} {dec:>10.2f}")
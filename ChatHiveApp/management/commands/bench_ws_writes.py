@@ -0,0 +1,76 @@
+# ChatHiveApp/management/commands/bench_ws_writes.py
+import asyncio
+import statistics
+import time
+import uuid
+
+from channels.db import database_sync_to_async
+from django.core.management.base import BaseCommand
+from django.db.models.signals import post_delete
+
+from accounts.models import User
+from ChatHiveApp.models import Thread, ThreadKind, ThreadMember
+from ChatHiveApp.signals import membership_deleted
+from ChatHiveApp.writer import MessageBatchWriter, create_or_get_message
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide throughput y latencia de ACK (p50/p99) del camino de escritura de message.send: "
+        "un mensaje por transacción (single) vs group commit (batch)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=100, help="Envíos simultáneos (conexiones)")
+        parser.add_argument("--members", type=int, default=20)
+        parser.add_argument("--mode", choices=["single", "batch", "both"], default="both")
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        users = [
+            User.objects.create_user(email=f"bench-{tag}-{i}@chathive.invalid", password=None)
+            for i in range(options["members"])
+        ]
+        thread = Thread.objects.create(kind=ThreadKind.GROUP, title=f"bench {tag}", created_by=users[0])
+        ThreadMember.objects.bulk_create([ThreadMember(thread=thread, user=u) for u in users])
+
+        try:
+            modes = ["single", "batch"] if options["mode"] == "both" else [options["mode"]]
+            for mode in modes:
+                latencies, elapsed = asyncio.run(
+                    self._run(mode, str(thread.id), [str(u.id) for u in users], options)
+                )
+                latencies.sort()
+                p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+                self.stdout.write(
+                    f"{mode:>6}: {len(latencies) / elapsed:8.0f} msg/s   "
+                    f"p50 {statistics.median(latencies) * 1000:7.1f} ms   p99 {p99 * 1000:7.1f} ms"
+                )
+        finally:
+            post_delete.disconnect(membership_deleted, sender=ThreadMember)
+            try:
+                thread.delete()
+                User.objects.filter(id__in=[u.id for u in users]).delete()
+            finally:
+                post_delete.connect(membership_deleted, sender=ThreadMember)
+
+    async def _run(self, mode, thread_id, user_ids, options):
+        total, concurrency = options["messages"], options["concurrency"]
+        writer = MessageBatchWriter()
+        single = database_sync_to_async(create_or_get_message)
+        latencies = []
+
+        async def sender(worker: int):
+            for n in range(worker, total, concurrency):
+                user_id = user_ids[n % len(user_ids)]
+                t0 = time.perf_counter()
+                if mode == "batch":
+                    await writer.submit(thread_id, user_id, f"bench {n}", uuid.uuid4().hex)
+                else:
+                    await single(thread_id, user_id, f"bench {n}", uuid.uuid4().hex)
+                latencies.append(time.perf_counter() - t0)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(sender(w) for w in range(concurrency)))
+        return latencies, time.perf_counter() - started
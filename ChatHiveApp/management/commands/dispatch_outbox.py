@@ -0,0 +1,104 @@
+# ChatHiveApp/management/commands/dispatch_outbox.py
+import asyncio
+import time
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand
+
+from ChatHiveApp import outbox
+from ChatHiveApp.publisher import send_ordered
+
+MAX_BACKOFF = 30.0  # segundos entre reintentos tras fallos seguidos
+
+
+class Command(BaseCommand):
+    help = (
+        "Dispatcher del outbox realtime: envía al channel layer los OutboxEvent pendientes "
+        "por lotes y los marca como enviados (at-least-once). Ejecutar una sola instancia."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=outbox.OUTBOX_BATCH)
+        parser.add_argument("--interval", type=float, default=0.05, help="Espera mínima (s) sin pendientes")
+        parser.add_argument("--max-interval", type=float, default=1.0, help="Espera máxima (s) sin pendientes")
+        parser.add_argument("--stats-every", type=float, default=60.0, help="Cada cuánto (s) loguear el lag")
+        parser.add_argument("--once", action="store_true", help="Vacía lo pendiente y termina")
+
+    def handle(self, *args, **options):
+        asyncio.run(self._run(options))
+
+    async def _send(self, layer, batch):
+        """
+        Envía el lote; si falla, fila a fila para aislar las que fallan.
+        Devuelve (ids enviados, ids fallidos).
+        """
+        try:
+            await send_ordered(layer, [send for _, sends in batch for send in sends])
+            return [pk for pk, _ in batch], []
+        except Exception as e:
+            self.stderr.write(f"outbox: fallo enviando {len(batch)} evento(s), se reintenta uno a uno: {e}")
+
+        sent, failed = [], []
+        for pk, sends in batch:
+            try:
+                await send_ordered(layer, sends)
+                sent.append(pk)
+            except Exception:
+                failed.append(pk)
+        if not sent:
+            # Nada salió (¿channel layer caído?): solo cuenta el intento de la cabeza,
+            # que es la que bloquea la cola si el problema es ella.
+            failed = failed[:1]
+        return sent, failed
+
+    async def _run(self, options):
+        layer = get_channel_layer()
+        load = database_sync_to_async(outbox.load_pending)
+        mark = database_sync_to_async(outbox.mark_dispatched)
+        fail = database_sync_to_async(outbox.mark_failed)
+        purge = database_sync_to_async(outbox.purge_dispatched)
+        lag = database_sync_to_async(outbox.lag)
+
+        idle = options["interval"]
+        failures = 0
+        next_stats = time.monotonic() + options["stats_every"]
+        while True:
+            try:
+                batch, broken = await load(options["batch"])
+                loaded = len(batch) + len(broken)
+                sent, failed = await self._send(layer, batch) if batch else ([], [])
+                failed += broken
+                if sent:
+                    await mark(sent)
+                if failed:
+                    await fail(failed)
+            except Exception as e:
+                self.stderr.write(f"outbox: fallo en el ciclo de despacho: {e}")
+                loaded, sent, failed = 0, [], [None]
+
+            if failed and not sent:
+                # Sin avance: espera creciente (las filas que fallan acaban en dead letter)
+                failures += 1
+                await asyncio.sleep(min(options["max_interval"] * 2 ** (failures - 1), MAX_BACKOFF))
+                continue
+            failures = 0
+
+            if loaded:
+                idle = options["interval"]
+                if loaded == options["batch"]:
+                    continue  # hay más pendientes: sin espera
+            elif options["once"]:
+                break
+
+            if time.monotonic() >= next_stats:
+                next_stats = time.monotonic() + options["stats_every"]
+                try:
+                    await purge()
+                    self.stdout.write(f"outbox lag: {await lag()}")
+                except Exception as e:
+                    self.stderr.write(f"outbox: fallo purgando/midiendo: {e}")
+
+            if not loaded:
+                await asyncio.sleep(idle)
+                idle = min(idle * 2, options["max_interval"])
@@ -0,0 +1,23 @@
+# ChatHiveApp/management/commands/recompute_unread.py
+from django.core.management.base import BaseCommand
+
+from ChatHiveApp.models import ThreadMember
+from ChatHiveApp.unread import recompute_unread
+
+
+class Command(BaseCommand):
+    help = "Recalcula ThreadMember.last_read_at / unread_count (set-based) por si los contadores derivan."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--thread", help="Solo los miembros de este hilo (uuid)")
+        parser.add_argument("--user", help="Solo las membresías de este usuario (uuid)")
+
+    def handle(self, *args, **options):
+        members = ThreadMember.objects.all()
+        if options.get("thread"):
+            members = members.filter(thread_id=options["thread"])
+        if options.get("user"):
+            members = members.filter(user_id=options["user"])
+
+        n = recompute_unread(members)
+        self.stdout.write(self.style.SUCCESS(f"{n} membresía(s) recalculadas."))
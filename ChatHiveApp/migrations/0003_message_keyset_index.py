@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-16 20:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ChatHiveApp', '0002_alter_thread_direct_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='message',
+            name='ChatHiveApp_thread__26e35f_idx',
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['thread', 'created_at', 'id'], name='ChatHiveApp_thread__229fd3_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.8 on 2026-10-16 20:53
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_unread_counters(apps, schema_editor):
+    ThreadMember = apps.get_model("ChatHiveApp", "ThreadMember")
+    Message = apps.get_model("ChatHiveApp", "Message")
+
+    ThreadMember.objects.update(
+        last_read_at=Subquery(
+            Message.objects.filter(id=OuterRef("last_read_message_id")).values("created_at")[:1]
+        )
+    )
+
+    def unread(after=None):
+        qs = Message.objects.filter(
+            thread_id=OuterRef("thread_id"), deleted_at__isnull=True
+        ).exclude(sender_id=OuterRef("user_id"))
+        if after is not None:
+            qs = qs.filter(created_at__gt=after)
+        qs = qs.order_by().values("thread_id").annotate(c=Count("id")).values("c")
+        return Coalesce(Subquery(qs, output_field=IntegerField()), Value(0))
+
+    ThreadMember.objects.filter(last_read_at__isnull=True).update(unread_count=unread())
+    ThreadMember.objects.filter(last_read_at__isnull=False).update(
+        unread_count=unread(after=OuterRef("last_read_at"))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ChatHiveApp', '0003_message_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='threadmember',
+            name='last_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='threadmember',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_unread_counters, migrations.RunPython.noop),
+    ]
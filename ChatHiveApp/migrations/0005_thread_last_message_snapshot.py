@@ -0,0 +1,64 @@
+# Generated by Django 5.2.8 on 2026-10-16 20:54
+
+from django.db import migrations, models
+from django.db.models import BooleanField, Case, OuterRef, Subquery, Value, When
+from django.db.models.functions import Substr
+
+
+def backfill_snapshot(apps, schema_editor):
+    Thread = apps.get_model("ChatHiveApp", "Thread")
+    Message = apps.get_model("ChatHiveApp", "Message")
+
+    last = Message.objects.filter(id=OuterRef("last_message_id"))
+    Thread.objects.filter(last_message_id__isnull=False).update(
+        last_message_preview=Subquery(
+            last.annotate(
+                preview=Case(
+                    When(deleted_at__isnull=False, then=Value("")),
+                    default=Substr("text", 1, 140),
+                )
+            ).values("preview")[:1]
+        ),
+        last_message_sender_id=Subquery(last.values("sender_id")[:1]),
+        last_message_type=Subquery(last.values("type")[:1]),
+        last_message_deleted=Subquery(
+            last.annotate(
+                is_deleted=Case(
+                    When(deleted_at__isnull=False, then=Value(True)),
+                    default=Value(False),
+                    output_field=BooleanField(),
+                )
+            ).values("is_deleted")[:1]
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ChatHiveApp', '0004_threadmember_unread_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thread',
+            name='last_message_deleted',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='last_message_preview',
+            field=models.CharField(blank=True, default='', max_length=140),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='last_message_sender_id',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='last_message_type',
+            field=models.CharField(blank=True, default='', max_length=10),
+        ),
+        migrations.RunPython(backfill_snapshot, migrations.RunPython.noop),
+    ]
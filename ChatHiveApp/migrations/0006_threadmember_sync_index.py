@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-16 20:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ChatHiveApp', '0005_thread_last_message_snapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='threadmember',
+            index=models.Index(fields=['user', 'updated_at'], name='ChatHiveApp_user_id_6aaf76_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-16 22:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ChatHiveApp', '0007_outbox_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='threadmember',
+            name='last_delivered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='threadmember',
+            name='last_delivered_message_id',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+    ]
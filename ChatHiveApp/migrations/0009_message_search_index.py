@@ -0,0 +1,65 @@
+# Índice de búsqueda de texto de Message (ver ChatHiveApp.search).
+#
+#   - PostgreSQL: columna tsvector generada (se recalcula sola al editar) + GIN parcial
+#     sobre los mensajes no eliminados.
+#   - SQLite: tabla FTS5 mantenida por triggers (desarrollo / tests locales).
+#   - Otros motores: nada; la búsqueda cae a icontains.
+
+from django.db import migrations
+
+MESSAGE_TABLE = '"ChatHiveApp_message"'
+FTS_TABLE = "chathive_message_fts"
+
+
+def forwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute(
+            f"ALTER TABLE {MESSAGE_TABLE} ADD COLUMN search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('simple', coalesce(text, ''))) STORED"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX message_search_gin ON {MESSAGE_TABLE} USING GIN (search_vector) "
+            "WHERE deleted_at IS NULL"
+        )
+    elif vendor == "sqlite":
+        schema_editor.execute(f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(text, message_id UNINDEXED)")
+        schema_editor.execute(
+            f"INSERT INTO {FTS_TABLE} (text, message_id) "
+            f"SELECT text, id FROM {MESSAGE_TABLE} WHERE deleted_at IS NULL"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {MESSAGE_TABLE} WHEN new.deleted_at IS NULL BEGIN "
+            f"INSERT INTO {FTS_TABLE} (text, message_id) VALUES (new.text, new.id); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF text, deleted_at ON {MESSAGE_TABLE} BEGIN "
+            f"DELETE FROM {FTS_TABLE} WHERE message_id = old.id; "
+            f"INSERT INTO {FTS_TABLE} (text, message_id) SELECT new.text, new.id WHERE new.deleted_at IS NULL; END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {MESSAGE_TABLE} BEGIN "
+            f"DELETE FROM {FTS_TABLE} WHERE message_id = old.id; END"
+        )
+
+
+def backwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS message_search_gin")
+        schema_editor.execute(f"ALTER TABLE {MESSAGE_TABLE} DROP COLUMN IF EXISTS search_vector")
+    elif vendor == "sqlite":
+        for suffix in ("ai", "au", "ad"):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ChatHiveApp', '0008_threadmember_delivered_watermark'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 5.2.8 on 2026-10-16 23:12
+#
+# Message.seq: posición densa del mensaje en su hilo. El relleno numera los mensajes
+# existentes por (created_at, id), deja Thread.message_seq / last_message_seq al día y
+# traduce las marcas de ThreadMember (last_read / last_delivered) a seq.
+# La restricción única (thread, seq) va en 0011, fuera de esta transacción.
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+BATCH = 2000
+
+
+def _postgres_backfill(schema_editor, Thread, ThreadMember, Message):
+    q = schema_editor.quote_name
+    message, thread, member = q(Message._meta.db_table), q(Thread._meta.db_table), q(ThreadMember._meta.db_table)
+    schema_editor.execute(
+        f"UPDATE {message} m SET seq = r.n FROM ("
+        f"SELECT id, ROW_NUMBER() OVER (PARTITION BY thread_id ORDER BY created_at, id) AS n FROM {message}"
+        f") r WHERE m.id = r.id"
+    )
+    schema_editor.execute(
+        f"UPDATE {thread} t SET message_seq = COALESCE((SELECT MAX(seq) FROM {message} WHERE thread_id = t.id), 0), "
+        f"last_message_seq = (SELECT seq FROM {message} WHERE id = t.last_message_id)"
+    )
+    for prefix in ("last_read", "last_delivered"):
+        schema_editor.execute(
+            f"UPDATE {member} tm SET {prefix}_seq = m.seq FROM {message} m WHERE m.id = tm.{prefix}_message_id"
+        )
+
+
+def backfill(apps, schema_editor):
+    Thread = apps.get_model("ChatHiveApp", "Thread")
+    ThreadMember = apps.get_model("ChatHiveApp", "ThreadMember")
+    Message = apps.get_model("ChatHiveApp", "Message")
+
+    if schema_editor.connection.vendor == "postgresql":
+        _postgres_backfill(schema_editor, Thread, ThreadMember, Message)
+        return
+
+    for thread in Thread.objects.only("id", "last_message_id").iterator(chunk_size=BATCH):
+        batch = []
+        seq = 0
+        for message in Message.objects.filter(thread_id=thread.id).order_by("created_at", "id").only("id"):
+            seq += 1
+            message.seq = seq
+            batch.append(message)
+            if len(batch) >= BATCH:
+                Message.objects.bulk_update(batch, ["seq"])
+                batch = []
+        if batch:
+            Message.objects.bulk_update(batch, ["seq"])
+        Thread.objects.filter(id=thread.id).update(
+            message_seq=seq,
+            last_message_seq=Subquery(Message.objects.filter(id=thread.last_message_id).values("seq")[:1]),
+        )
+
+    for prefix in ("last_read", "last_delivered"):
+        ThreadMember.objects.filter(**{f"{prefix}_message_id__isnull": False}).update(
+            **{
+                f"{prefix}_seq": Coalesce(
+                    Subquery(Message.objects.filter(id=OuterRef(f"{prefix}_message_id")).values("seq")[:1]), 0
+                )
+            }
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ChatHiveApp', '0009_message_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thread',
+            name='message_seq',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='last_message_seq',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='seq',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='threadmember',
+            name='last_read_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='threadmember',
+            name='last_delivered_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
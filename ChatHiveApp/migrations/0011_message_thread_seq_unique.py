@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-16 23:12
+#
+# Restricción única (thread, seq): también es el índice del historial por seq.
+# En SQLite añadirla rehace la tabla de mensajes y se pierden los triggers FTS de
+# 0009; se vuelven a crear aquí.
+
+from django.db import migrations, models
+
+FTS_TABLE = "chathive_message_fts"
+
+
+def recreate_fts_triggers(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite" or FTS_TABLE not in connection.introspection.table_names():
+        return
+    message = schema_editor.quote_name(apps.get_model("ChatHiveApp", "Message")._meta.db_table)
+    for suffix in ("ai", "au", "ad"):
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+    schema_editor.execute(
+        f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {message} WHEN new.deleted_at IS NULL BEGIN "
+        f"INSERT INTO {FTS_TABLE} (text, message_id) VALUES (new.text, new.id); END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF text, deleted_at ON {message} BEGIN "
+        f"DELETE FROM {FTS_TABLE} WHERE message_id = old.id; "
+        f"INSERT INTO {FTS_TABLE} (text, message_id) SELECT new.text, new.id WHERE new.deleted_at IS NULL; END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {message} BEGIN "
+        f"DELETE FROM {FTS_TABLE} WHERE message_id = old.id; END"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ChatHiveApp', '0010_message_seq'),
+    ]
+
+    # Al revertir, RemoveConstraint también rehace la tabla: el primer RunPython corre después
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, recreate_fts_triggers),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(fields=('thread', 'seq'), name='uniq_message_thread_seq'),
+        ),
+        migrations.RunPython(recreate_fts_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-16 23:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ChatHiveApp', '0012_outboxevent_failed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='replay_id',
+            field=models.CharField(blank=True, default='', max_length=41),
+        ),
+    ]
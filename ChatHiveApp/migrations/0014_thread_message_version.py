@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-16 22:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ChatHiveApp', '0013_outboxevent_replay_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thread',
+            name='message_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -1,9 +1,9 @@
 # ChatHiveApp/models.py
 import uuid
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
-from django.db.models import Q, UniqueConstraint
+from django.db.models import F, Q, UniqueConstraint
 
 
 # --------------------------------------------
@@ -29,7 +29,10 @@ class Thread(TimeStampedModel):
     """
     - kind: DIRECT (1 a 1) o GROUP (varios)
     - direct_key: para DIRECT, clave determinística "minUserId:maxUserId" -> permite unicidad.
-    - last_message_*: optimiza listados (Inbox).
+    - last_message_*: snapshot del último mensaje; el Inbox no consulta Message.
+    - message_seq: último Message.seq asignado en el hilo (ver allocate_message_seqs).
+    - message_version: sube con cada edición o borrado de mensajes y con cada cambio de
+      perfil de un miembro (ver bump_message_version); con message_seq valida el historial.
     """
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     kind = models.CharField(max_length=12, choices=ThreadKind.choices, db_index=True)
@@ -49,9 +52,17 @@ class Thread(TimeStampedModel):
         help_text="Clave determinística para hilos DIRECT (p.ej. '<user1>:<user2>').",
     )
 
-    # Optimizaciones para Inbox
+    # Optimizaciones para Inbox (snapshot del último mensaje, ver ChatHiveApp.inbox)
     last_message_at = models.DateTimeField(blank=True, null=True, db_index=True)
     last_message_id = models.UUIDField(blank=True, null=True, editable=False)
+    last_message_preview = models.CharField(max_length=140, blank=True, default="")
+    last_message_sender_id = models.UUIDField(blank=True, null=True, editable=False)
+    last_message_type = models.CharField(max_length=10, blank=True, default="")
+    last_message_deleted = models.BooleanField(default=False)
+    last_message_seq = models.BigIntegerField(blank=True, null=True, editable=False)
+
+    message_seq = models.BigIntegerField(default=0, editable=False)
+    message_version = models.BigIntegerField(default=0, editable=False)
 
     class Meta:
         indexes = [
@@ -74,7 +85,10 @@ class ThreadMemberRole(models.TextChoices):
 
 class ThreadMember(TimeStampedModel):
     """
-    - last_read_message_id: para calcular mensajes no leídos rápidamente
+    - last_read_message_id / last_read_at / last_read_seq: marca de lectura del usuario en el hilo
+    - last_delivered_message_id / last_delivered_at / last_delivered_seq: marca de entrega (ver ChatHiveApp.receipts)
+      Ambas marcas solo avanzan; se comparan por *_seq (Message.seq, 0 = ninguna).
+    - unread_count: contador desnormalizado (ver ChatHiveApp.unread), lo lee el inbox sin agregar
     - is_active: si el usuario salió del grupo, pero se conserva la historia
     """
     id = models.BigAutoField(primary_key=True)
@@ -88,17 +102,36 @@ class ThreadMember(TimeStampedModel):
 
     # Lecturas
     last_read_message_id = models.UUIDField(blank=True, null=True)
+    last_read_at = models.DateTimeField(blank=True, null=True)
+    last_read_seq = models.BigIntegerField(default=0)
+    unread_count = models.PositiveIntegerField(default=0)
+
+    # Entregas
+    last_delivered_message_id = models.UUIDField(blank=True, null=True)
+    last_delivered_at = models.DateTimeField(blank=True, null=True)
+    last_delivered_seq = models.BigIntegerField(default=0)
 
     class Meta:
         unique_together = (("thread", "user"),)
         indexes = [
             models.Index(fields=["user", "is_active"]),
             models.Index(fields=["thread", "role"]),
+            # inbox incremental: filas cambiadas desde ?changed_since=
+            models.Index(fields=["user", "updated_at"]),
         ]
 
     def __str__(self):
         return f"{self.user_id} in {self.thread_id} ({self.role})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # is_active / role leídos: un save() sin update_fields solo avisa si cambiaron (ver signals)
+        instance._loaded_member_values = {
+            name: value for name, value in zip(field_names, values) if name in ("is_active", "role")
+        }
+        return instance
+
 
 # --------------------------------------------
 # Mensajes
@@ -109,7 +142,31 @@ class MessageType(models.TextChoices):
     SYSTEM = "SYSTEM", "System"
 
 
+def allocate_message_seqs(thread_id, count: int = 1) -> int:
+    """
+    Reserva 'count' números consecutivos del hilo y devuelve el primero. Va en la misma
+    transacción que el INSERT: el UPDATE bloquea la fila del Thread hasta el commit (los
+    envíos concurrentes al hilo se ordenan ahí) y un rollback devuelve los números.
+    """
+    Thread.objects.filter(id=thread_id).update(message_seq=F("message_seq") + count)
+    last = Thread.objects.filter(id=thread_id).values_list("message_seq", flat=True).get()
+    return last - count + 1
+
+
+def bump_message_version(thread_ids) -> None:
+    """
+    El historial de estos hilos cambió sin mensajes nuevos (edición, borrado, perfil de un
+    remitente). Va en la transacción de la escritura: el ETag del historial no puede ver
+    el cambio antes que los datos ni perderlo si falla algo después del commit.
+    """
+    Thread.objects.filter(id__in=list(thread_ids)).update(message_version=F("message_version") + 1)
+
+
 class Message(TimeStampedModel):
+    """
+    - seq: posición del mensaje en su hilo (1, 2, 3, ... sin huecos), asignada al insertar.
+      Es el orden del historial, de los cursores y de las marcas de lectura/entrega.
+    """
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     thread = models.ForeignKey(Thread, on_delete=models.CASCADE, related_name="messages")
@@ -128,10 +185,13 @@ class Message(TimeStampedModel):
     edited_at = models.DateTimeField(blank=True, null=True)
     deleted_at = models.DateTimeField(blank=True, null=True, db_index=True)
 
+    seq = models.BigIntegerField(blank=True, null=True, editable=False)
+
     class Meta:
         ordering = ["created_at"]
         indexes = [
-            models.Index(fields=["thread", "created_at"]),
+            # keyset del historial: (thread, created_at, id)
+            models.Index(fields=["thread", "created_at", "id"]),
             models.Index(fields=["sender", "created_at"]),
             models.Index(fields=["type"]),
         ]
@@ -142,8 +202,19 @@ class Message(TimeStampedModel):
                 condition=Q(client_id__isnull=False),
                 name="uniq_message_thread_client_id_not_null",
             ),
+            # historial por keyset: (thread, seq)
+            UniqueConstraint(fields=["thread", "seq"], name="uniq_message_thread_seq"),
         ]
 
+    def save(self, *args, **kwargs):
+        # bulk_create no pasa por aquí: quien lo use asigna seq (ver ChatHiveApp.writer)
+        if self.seq is None and self._state.adding:
+            with transaction.atomic():
+                self.seq = allocate_message_seqs(self.thread_id)
+                super().save(*args, **kwargs)
+            return
+        super().save(*args, **kwargs)
+
     def __str__(self):
         base = f"{self.type} in {self.thread_id}"
         return f"{base} by {self.sender_id or 'system'}"
@@ -219,6 +290,11 @@ class ReceiptStatus(models.TextChoices):
 
 
 class Receipt(TimeStampedModel):
+    """
+    Legado: una fila por (mensaje, usuario). Ya no se escribe; el estado de entrega/lectura
+    vive en las marcas de ThreadMember y ChatHiveApp.receipts.receipts_for() devuelve
+    esta misma forma calculada a partir de ellas.
+    """
 
     id = models.BigAutoField(primary_key=True)
     message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name="receipts")
@@ -263,3 +339,42 @@ class MessageAudit(TimeStampedModel):
 
     def __str__(self):
         return f"audit {self.event} msg {self.message_id}"
+
+
+# --------------------------------------------
+# Outbox de eventos realtime (ver ChatHiveApp.outbox)
+# --------------------------------------------
+class OutboxKind(models.TextChoices):
+    GROUP = "GROUP", "Group"  # payload = frame para 'group'
+    INBOX = "INBOX", "Inbox"  # payload = {"thread_id", "user_ids"}: deltas del inbox
+
+
+class OutboxEvent(models.Model):
+    """
+    Evento escrito en la misma transacción que el cambio que lo origina; el dispatcher
+    (manage.py dispatch_outbox) lo envía al channel layer y marca dispatched_at.
+    Entrega at-least-once: los frames llevan event_id para que el cliente deduplique.
+    Tras OUTBOX_MAX_ATTEMPTS fallos se marca failed_at (dead letter) y deja de reintentarse.
+    replay_id: posición asignada en el registro de repetición la primera vez que se cargó
+    (los reenvíos la reutilizan en vez de volver a anotarse).
+    """
+    id = models.BigAutoField(primary_key=True)
+    event_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    kind = models.CharField(max_length=8, choices=OutboxKind.choices, default=OutboxKind.GROUP)
+    group = models.CharField(max_length=200, blank=True, default="")
+    payload = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now)
+    dispatched_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    failed_at = models.DateTimeField(blank=True, null=True)
+    replay_id = models.CharField(max_length=41, blank=True, default="")
+
+    class Meta:
+        indexes = [
+            # solo las filas pendientes: el dispatcher lee por orden de id
+            models.Index(fields=["id"], condition=Q(dispatched_at__isnull=True), name="outbox_pending_idx"),
+            models.Index(fields=["dispatched_at"]),
+        ]
+
+    def __str__(self):
+        return f"outbox {self.kind} {self.group or self.payload.get('thread_id')}"
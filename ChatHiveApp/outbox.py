@@ -0,0 +1,162 @@
+# ChatHiveApp/outbox.py
+"""
+Outbox transaccional para los eventos realtime de la API REST.
+
+Los caminos de escritura guardan el evento (OutboxEvent) en la misma transacción
+que el cambio: si hay rollback, no sale nada, y la request no espera a Redis.
+'manage.py dispatch_outbox' lee las filas pendientes en orden, las envía al channel
+layer (en paralelo entre grupos, en orden dentro de cada grupo) y marca dispatched_at.
+
+Entrega at-least-once: si el dispatcher cae entre el envío y la marca, el lote se
+reenvía; cada frame lleva "event_id" para que el cliente deduplique. Una fila que
+falla OUTBOX_MAX_ATTEMPTS veces pasa a dead letter (failed_at) y deja de bloquear la cola.
+Los eventos de hilo se anotan una sola vez en el registro de repetición (ChatHiveApp.replay):
+el replay_id se guarda en la fila y los reenvíos salen con el mismo.
+
+Solo se usa con settings.REALTIME_OUTBOX = True, que exige desplegar el dispatcher
+como proceso aparte. Por defecto (False) se envía en transaction.on_commit desde el
+propio proceso, como antes.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import timedelta
+from typing import List, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DateTimeField, F, Min, Value, When
+from django.utils import timezone
+
+from ChatHiveApp import replay
+from ChatHiveApp.models import OutboxEvent, OutboxKind
+from ChatHiveApp.publisher import publish
+from ChatHiveApp.realtime import inbox_update_sends, send_inbox_updates, thread_event_message
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH = 500
+OUTBOX_RETENTION = timedelta(hours=1)
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_DEAD_RETENTION = timedelta(days=7)
+
+
+def enabled() -> bool:
+    return getattr(settings, "REALTIME_OUTBOX", False)
+
+
+# ─────────────────────────────────────────────────────────
+# Encolar (dentro de la transacción del cambio)
+# ─────────────────────────────────────────────────────────
+def enqueue_group(group: str, data: dict) -> None:
+    """
+    Frame 'data' para todas las conexiones de 'group'.
+    """
+    if not enabled():
+        transaction.on_commit(lambda: publish([(group, thread_event_message(replay.record(group, data)))]))
+        return
+    OutboxEvent.objects.create(kind=OutboxKind.GROUP, group=group, payload=data)
+
+
+def enqueue_inbox(thread_id, user_ids=None) -> None:
+    """
+    Deltas del inbox del hilo; se calculan al despachar (estado confirmado más reciente).
+    """
+    user_ids = [str(u) for u in user_ids] if user_ids is not None else None
+    if not enabled():
+        transaction.on_commit(lambda: send_inbox_updates(thread_id, user_ids))
+        return
+    OutboxEvent.objects.create(
+        kind=OutboxKind.INBOX, payload={"thread_id": str(thread_id), "user_ids": user_ids}
+    )
+
+
+# ─────────────────────────────────────────────────────────
+# Despacho
+# ─────────────────────────────────────────────────────────
+def _pending():
+    return OutboxEvent.objects.filter(dispatched_at__isnull=True, failed_at__isnull=True)
+
+
+def _event_data(row: OutboxEvent) -> dict:
+    return {**row.payload, "event_id": str(row.event_id)}
+
+
+def load_pending(limit: int = OUTBOX_BATCH) -> Tuple[List[Tuple[int, list]], List[int]]:
+    """
+    Siguiente lote pendiente, en orden de id:
+    ([(id, [(grupo, evento), ...]), ...], ids de las filas que no se pudieron preparar).
+    """
+    rows = list(
+        _pending()
+        .order_by("id")
+        .only("id", "event_id", "kind", "group", "payload", "replay_id")[:limit]
+    )
+    # Eventos de grupo aún sin replay_id al registro de repetición, en orden (un pipeline);
+    # el replay_id queda en la fila para que un reintento no los vuelva a anotar.
+    fresh = [row for row in rows if row.kind != OutboxKind.INBOX and not row.replay_id]
+    assigned = []
+    for row, (_, data) in zip(fresh, replay.record_many([(row.group, _event_data(row)) for row in fresh])):
+        if data.get("replay_id"):
+            row.replay_id = data["replay_id"]
+            assigned.append(row)
+    if assigned:
+        OutboxEvent.objects.bulk_update(assigned, ["replay_id"])
+
+    batch, broken = [], []
+    for row in rows:
+        try:
+            if row.kind == OutboxKind.INBOX:
+                sends = inbox_update_sends(
+                    row.payload["thread_id"], row.payload.get("user_ids"), event_id=str(row.event_id)
+                )
+            else:
+                data = _event_data(row)
+                if row.replay_id:
+                    data["replay_id"] = row.replay_id
+                sends = [(row.group, thread_event_message(data))]
+        except Exception:
+            logger.exception("outbox: no se pudo preparar el evento %s", row.id)
+            broken.append(row.id)
+            continue
+        batch.append((row.id, sends))
+    return batch, broken
+
+
+def mark_dispatched(ids: List[int]) -> int:
+    return OutboxEvent.objects.filter(id__in=ids).update(dispatched_at=timezone.now())
+
+
+def mark_failed(ids: List[int], max_attempts: int = OUTBOX_MAX_ATTEMPTS) -> int:
+    """
+    Suma un intento; la fila que llega a max_attempts pasa a dead letter (failed_at).
+    """
+    return OutboxEvent.objects.filter(id__in=ids).update(
+        attempts=F("attempts") + 1,
+        failed_at=Case(
+            When(attempts__gte=max_attempts - 1, then=Value(timezone.now())),
+            default=F("failed_at"),
+            output_field=DateTimeField(),
+        ),
+    )
+
+
+def purge_dispatched(retention: timedelta = OUTBOX_RETENTION, dead_retention: timedelta = OUTBOX_DEAD_RETENTION) -> int:
+    now = timezone.now()
+    dispatched = OutboxEvent.objects.filter(dispatched_at__lt=now - retention).delete()[0]
+    return dispatched + OutboxEvent.objects.filter(failed_at__lt=now - dead_retention).delete()[0]
+
+
+def lag() -> dict:
+    """
+    Métrica de retraso: filas pendientes y antigüedad (s) de la más vieja.
+    """
+    pending = _pending()
+    oldest = pending.aggregate(oldest=Min("created_at"))["oldest"]
+    return {
+        "enabled": enabled(),
+        "pending": pending.count(),
+        "oldest_pending_age": round((timezone.now() - oldest).total_seconds(), 3) if oldest else 0.0,
+        "failed_attempts": pending.filter(attempts__gt=0).count(),
+        "dead_letter": OutboxEvent.objects.filter(failed_at__isnull=False).count(),
+    }
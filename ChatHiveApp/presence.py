@@ -0,0 +1,347 @@
+# ChatHiveApp/presence.py
+"""
+Presencia en línea a partir de las conexiones WS.
+
+Estado (en el Redis del channel layer; en memoria si el layer no es Redis, p.ej. tests):
+  - presence:conn:<user_id>  ZSET channel_name -> expiración. Conexiones vivas = score > ahora;
+                             si un worker muere sin disconnect, sus entradas caducan solas.
+  - presence:seen            HASH user_id -> epoch del último connect/heartbeat/disconnect.
+  - presence:announced:<user_id>  "1"/"0", último estado anunciado a los peers; caduca a
+                             las PRESENCE_ANNOUNCED_TTL (sin él, el siguiente cambio se anuncia).
+
+ChatConsumer llama a connected() / heartbeat() / disconnected(). User.last_seen no se
+escribe por evento: cada PRESENCE_FLUSH_INTERVAL se vacía presence:seen con un único
+bulk_update. Los cambios online/offline se anuncian a los peers de hilos DIRECT tras
+PRESENCE_DEBOUNCE, y solo si el estado final difiere del último anunciado: una conexión
+móvil que se cae y vuelve dentro de la ventana no genera ningún evento.
+
+Frame (por el grupo user_<peer>):
+  { "type": "presence", "payload": { "user_id", "online": bool, "last_seen": "<iso>"|null } }
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, Iterable, List, Optional
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+
+from ChatHiveApp.realtime import channel_layer_redis, thread_event_message, user_group_name
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_TTL = 90  # segundos sin heartbeat para dar una conexión por muerta
+PRESENCE_HEARTBEAT = 30  # cada cuánto refresca el consumer su conexión
+PRESENCE_DEBOUNCE = 5.0  # ventana de coalescencia de cambios online/offline
+PRESENCE_FLUSH_INTERVAL = 30.0  # cada cuánto se persiste last_seen
+PRESENCE_ANNOUNCED_TTL = 86400  # segundos que se recuerda el último estado anunciado
+
+KEY_PREFIX = "chathive:presence"
+
+# Estado actual (conexiones vivas) frente al último anunciado, en un paso: dos _announce
+# concurrentes del mismo usuario (otro worker) no pueden anunciar ambos ni cruzarse.
+# Devuelve 1/0 si cambió, -1 si no.
+_ANNOUNCE = """
+local online = '0'
+if redis.call('ZCOUNT', KEYS[1], '(' .. ARGV[1], '+inf') > 0 then online = '1' end
+local prev = redis.call('GET', KEYS[2])
+redis.call('SET', KEYS[2], online, 'EX', ARGV[2])
+if prev == online then return -1 end
+return tonumber(online)
+"""
+
+
+# ─────────────────────────────────────────────────────────
+# Stores
+# ─────────────────────────────────────────────────────────
+class RedisPresenceStore:
+    def __init__(self, client):
+        self.redis = client
+        self.seen_key = f"{KEY_PREFIX}:seen"
+        self._announce = client.register_script(_ANNOUNCE)
+
+    def _conn_key(self, user_id) -> str:
+        return f"{KEY_PREFIX}:conn:{user_id}"
+
+    def _announced_key(self, user_id) -> str:
+        return f"{KEY_PREFIX}:announced:{user_id}"
+
+    async def add(self, user_id, channel: str, now: float) -> int:
+        key = self._conn_key(user_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zremrangebyscore(key, "-inf", now)
+            pipe.zadd(key, {channel: now + PRESENCE_TTL})
+            pipe.expire(key, PRESENCE_TTL)
+            pipe.zcard(key)
+            pipe.hset(self.seen_key, str(user_id), now)
+            res = await pipe.execute()
+        return res[3]
+
+    async def touch(self, user_id, channel: str, now: float) -> None:
+        key = self._conn_key(user_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zadd(key, {channel: now + PRESENCE_TTL})
+            pipe.expire(key, PRESENCE_TTL)
+            pipe.hset(self.seen_key, str(user_id), now)
+            await pipe.execute()
+
+    async def remove(self, user_id, channel: str, now: float) -> int:
+        key = self._conn_key(user_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(key, channel)
+            pipe.zremrangebyscore(key, "-inf", now)
+            pipe.zcard(key)
+            pipe.hset(self.seen_key, str(user_id), now)
+            res = await pipe.execute()
+        return res[2]
+
+    async def count(self, user_id, now: float) -> int:
+        return await self.redis.zcount(self._conn_key(user_id), f"({now}", "+inf")
+
+    async def online(self, user_ids: Iterable, now: float) -> set:
+        user_ids = [str(u) for u in user_ids]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.zcount(self._conn_key(user_id), f"({now}", "+inf")
+            counts = await pipe.execute()
+        return {u for u, n in zip(user_ids, counts) if n}
+
+    async def drain_seen(self) -> Dict[str, float]:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hgetall(self.seen_key)
+            pipe.delete(self.seen_key)
+            raw, _ = await pipe.execute()
+        return {_str(k): float(v) for k, v in raw.items()}
+
+    async def restore_seen(self, seen: Dict[str, float]) -> None:
+        # HSETNX: si el usuario se vio después de drenar, su valor es más nuevo y se queda
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for user_id, ts in seen.items():
+                pipe.hsetnx(self.seen_key, user_id, ts)
+            await pipe.execute()
+
+    async def announce_change(self, user_id, now: float) -> Optional[bool]:
+        """
+        Estado online actual si difiere del último anunciado (y queda como anunciado); None si no.
+        """
+        keys = [self._conn_key(user_id), self._announced_key(user_id)]
+        changed = int(await self._announce(keys=keys, args=[now, PRESENCE_ANNOUNCED_TTL]))
+        return None if changed < 0 else bool(changed)
+
+
+class MemoryPresenceStore:
+    """
+    Mismo contrato que RedisPresenceStore, en memoria del proceso (tests / InMemoryChannelLayer).
+    """
+
+    def __init__(self):
+        self.conns: Dict[str, Dict[str, float]] = {}
+        self.seen: Dict[str, float] = {}
+        self.announced: Dict[str, tuple] = {}  # user_id -> (online, caduca)
+
+    def _live(self, user_id, now: float) -> Dict[str, float]:
+        conns = self.conns.setdefault(str(user_id), {})
+        for channel, expires in list(conns.items()):
+            if expires <= now:
+                del conns[channel]
+        return conns
+
+    async def add(self, user_id, channel, now):
+        conns = self._live(user_id, now)
+        conns[channel] = now + PRESENCE_TTL
+        self.seen[str(user_id)] = now
+        return len(conns)
+
+    async def touch(self, user_id, channel, now):
+        self.conns.setdefault(str(user_id), {})[channel] = now + PRESENCE_TTL
+        self.seen[str(user_id)] = now
+
+    async def remove(self, user_id, channel, now):
+        conns = self._live(user_id, now)
+        conns.pop(channel, None)
+        self.seen[str(user_id)] = now
+        return len(conns)
+
+    async def count(self, user_id, now):
+        return len(self._live(user_id, now))
+
+    async def online(self, user_ids, now):
+        return {str(u) for u in user_ids if self._live(u, now)}
+
+    async def drain_seen(self):
+        seen, self.seen = self.seen, {}
+        return seen
+
+    async def restore_seen(self, seen):
+        for user_id, ts in seen.items():
+            self.seen.setdefault(user_id, ts)
+
+    async def announce_change(self, user_id, now):
+        online = bool(self._live(user_id, now))
+        prev, expires = self.announced.get(str(user_id), (None, 0))
+        self.announced[str(user_id)] = (online, now + PRESENCE_ANNOUNCED_TTL)
+        return None if prev == online and expires > now else online
+
+
+def _str(value) -> str:
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+_memory_store = MemoryPresenceStore()
+
+
+def _build_store():
+    """
+    Redis del channel layer "default" (primer host) si es channels_redis; si no, en memoria.
+    """
+    client = channel_layer_redis()
+    return RedisPresenceStore(client) if client is not None else _memory_store
+
+
+# ─────────────────────────────────────────────────────────
+# Persistencia y fan-out (sync)
+# ─────────────────────────────────────────────────────────
+def persist_last_seen(seen: Dict[str, float]) -> int:
+    """
+    Escribe User.last_seen de todos los usuarios vistos: un UPDATE ... CASE por lote.
+    """
+    from accounts.models import User
+
+    if not seen:
+        return 0
+    users = [
+        User(id=user_id, last_seen=datetime.fromtimestamp(ts, tz=dt_timezone.utc))
+        for user_id, ts in seen.items()
+    ]
+    return User.objects.bulk_update(users, ["last_seen"], batch_size=500)
+
+
+def direct_peer_ids(user_id) -> List[str]:
+    """
+    Usuarios con los que 'user_id' comparte un hilo DIRECT activo (una consulta).
+    """
+    from ChatHiveApp.models import ThreadKind, ThreadMember
+
+    return [
+        str(u)
+        for u in ThreadMember.objects.filter(
+            thread__kind=ThreadKind.DIRECT,
+            thread__members__user_id=user_id,
+            thread__members__is_active=True,
+            is_active=True,
+        )
+        .exclude(user_id=user_id)
+        .values_list("user_id", flat=True)
+        .distinct()
+    ]
+
+
+# ─────────────────────────────────────────────────────────
+# Servicio (uno por event loop)
+# ─────────────────────────────────────────────────────────
+class PresenceService:
+    def __init__(self, store=None):
+        self.store = store or _build_store()
+        self._announce_pending: Dict[str, asyncio.TimerHandle] = {}
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+
+    # La presencia es best-effort: un fallo del store nunca tumba la conexión WS
+    async def connected(self, user_id, channel: str) -> None:
+        try:
+            if await self.store.add(user_id, channel, time.time()) == 1:
+                self._schedule_announce(str(user_id))
+        except Exception:
+            logger.exception("presence: connect %s", user_id)
+        self._schedule_flush()
+
+    async def heartbeat(self, user_id, channel: str) -> None:
+        try:
+            await self.store.touch(user_id, channel, time.time())
+        except Exception:
+            logger.exception("presence: heartbeat %s", user_id)
+        self._schedule_flush()
+
+    async def disconnected(self, user_id, channel: str) -> None:
+        try:
+            if await self.store.remove(user_id, channel, time.time()) == 0:
+                self._schedule_announce(str(user_id))
+        except Exception:
+            logger.exception("presence: disconnect %s", user_id)
+        self._schedule_flush()
+
+    async def online_user_ids(self, user_ids: Iterable) -> set:
+        return await self.store.online(user_ids, time.time())
+
+    # ── Anuncios coalescidos
+    def _schedule_announce(self, user_id: str) -> None:
+        if user_id in self._announce_pending:
+            return  # ya hay uno en la ventana: leerá el estado final
+        loop = asyncio.get_running_loop()
+        self._announce_pending[user_id] = loop.call_later(
+            PRESENCE_DEBOUNCE, lambda: asyncio.ensure_future(self._announce(user_id))
+        )
+
+    async def _announce(self, user_id: str) -> None:
+        self._announce_pending.pop(user_id, None)
+        now = time.time()
+        try:
+            online = await self.store.announce_change(user_id, now)
+            if online is None:
+                return
+            peers = await database_sync_to_async(direct_peer_ids)(user_id)
+            if not peers:
+                return
+
+            # Mismo frame para todos los peers: se codifica una vez
+            event = thread_event_message({
+                "type": "presence",
+                "payload": {
+                    "user_id": user_id,
+                    "online": online,
+                    "last_seen": None if online else datetime.fromtimestamp(now, tz=dt_timezone.utc).isoformat(),
+                },
+            })
+            layer = get_channel_layer()
+            await asyncio.gather(*(layer.group_send(user_group_name(p), event) for p in peers))
+        except Exception:
+            logger.exception("presence: no se pudo anunciar a %s", user_id)
+
+    # ── last_seen por lotes
+    def _schedule_flush(self) -> None:
+        if self._flush_timer is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._flush_timer = loop.call_later(PRESENCE_FLUSH_INTERVAL, lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self) -> int:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        seen: Dict[str, float] = {}
+        try:
+            seen = await self.store.drain_seen()
+            return await database_sync_to_async(persist_last_seen)(seen)
+        except Exception:
+            logger.exception("presence: no se pudo persistir last_seen")
+        # Lo drenado vuelve al store (sin pisar valores más nuevos) y se reintenta
+        if seen:
+            try:
+                await self.store.restore_seen(seen)
+                self._schedule_flush()
+            except Exception:
+                logger.exception("presence: se pierden %d last_seen sin persistir", len(seen))
+        return 0
+
+
+_services: Dict[asyncio.AbstractEventLoop, PresenceService] = {}
+
+
+def get_presence() -> PresenceService:
+    loop = asyncio.get_running_loop()
+    service = _services.get(loop)
+    if service is None:
+        service = _services[loop] = PresenceService()
+    return service
@@ -0,0 +1,213 @@
+# ChatHiveApp/realtime.py
+"""
+Grupos del channel layer y eventos que el servidor empuja a las conexiones WS.
+
+  - thread_<id>: conexiones que hicieron thread.join (mensajes, typing).
+  - user_<id>:   todas las conexiones de un usuario (se suscriben al conectar):
+                 membresía y deltas del inbox, para no tener que hacer polling de /threads/.
+
+Frames de inbox (por el grupo user_<id>):
+  { "type": "inbox.thread", "payload": { "thread_id", "is_archived", "unread_count", "last_read_message_id",
+                                         "last_read_seq", "message_seq", "last_message": {...}|null } }
+  { "type": "inbox.thread.added", "payload": { "thread": <ThreadListSerializer> } }
+  { "type": "inbox.thread.removed", "payload": { "thread_id" } }
+
+Nunca se anuncia algo que luego hace rollback: los deltas y los eventos de la API REST
+pasan por el outbox transaccional (ChatHiveApp.outbox); el resto va en transaction.on_commit.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Iterable
+
+from django.conf import settings
+
+from ChatHiveApp.codecs import encode_frames
+from ChatHiveApp.publisher import publish
+
+
+# ─────────────────────────────────────────────────────────
+# Grupos y eventos
+# ─────────────────────────────────────────────────────────
+def thread_group_name(thread_id) -> str:
+    return f"thread_{thread_id}"
+
+
+def user_group_name(user_id) -> str:
+    # Todas las conexiones de un usuario (eventos dirigidos: membresía, inbox, etc.)
+    return f"user_{user_id}"
+
+
+# Internos de channels_redis.core.RedisChannelLayer que usa el pipeline de group_add_many
+_REDIS_LAYER_METHODS = (
+    "connection", "consistent_hash", "_group_key", "require_valid_group_name", "require_valid_channel_name",
+)
+
+
+def _pipelined_group_add(layer) -> bool:
+    try:
+        from channels_redis.core import RedisChannelLayer
+    except ImportError:
+        return False
+    return (
+        isinstance(layer, RedisChannelLayer)
+        and all(callable(getattr(layer, name, None)) for name in _REDIS_LAYER_METHODS)
+        and isinstance(getattr(layer, "group_expiry", None), int)
+    )
+
+
+async def group_add_many(layer, groups: Iterable[str], channel: str) -> None:
+    """
+    group_add de varios grupos para un mismo canal. Con RedisChannelLayer (channels_redis)
+    el ZADD + EXPIRE de todos va en un pipeline por shard: un viaje a Redis en vez de uno
+    por grupo. Esos internos no son API pública: si faltan (otra versión de channels_redis)
+    o el layer es otro (InMemoryChannelLayer, pubsub), un group_add por grupo, en paralelo.
+    """
+    groups = list(groups)
+    if not groups:
+        return
+    if not _pipelined_group_add(layer):
+        await asyncio.gather(*(layer.group_add(g, channel) for g in groups))
+        return
+
+    # Lo mismo que RedisChannelLayer.group_add, agrupado por shard
+    assert layer.require_valid_channel_name(channel), "Channel name not valid"
+    by_shard = {}
+    for group in groups:
+        assert layer.require_valid_group_name(group), "Group name not valid"
+        by_shard.setdefault(layer.consistent_hash(group), []).append(group)
+
+    now = time.time()
+
+    async def _shard(index, shard_groups):
+        async with layer.connection(index).pipeline(transaction=False) as pipe:
+            for group in shard_groups:
+                key = layer._group_key(group)
+                pipe.zadd(key, {channel: now})
+                pipe.expire(key, layer.group_expiry)
+            await pipe.execute()
+
+    await asyncio.gather(*(_shard(i, g) for i, g in by_shard.items()))
+
+
+def thread_event_message(data: dict) -> dict:
+    """
+    Evento "thread.event" para group_send con el frame ya codificado (una vez en el emisor,
+    no una vez por receptor). Solo viaja el frame y su tipo ("kind"); el receptor lo
+    decodifica únicamente si necesita leerlo.
+    """
+    return {"type": "thread.event", "kind": data.get("type"), "frames": encode_frames(data)}
+
+
+def channel_layer_redis(aio: bool = True):
+    """
+    Cliente del Redis del channel layer "default" (primer host), async o sync; None si el
+    layer no es Redis (p.ej. InMemoryChannelLayer en tests).
+    """
+    layer = getattr(settings, "CHANNEL_LAYERS", {}).get("default", {})
+    if "redis" not in layer.get("BACKEND", "").lower():
+        return None
+
+    if aio:
+        import redis.asyncio as redis_client
+    else:
+        import redis as redis_client
+
+    host = (layer.get("CONFIG", {}).get("hosts") or [("127.0.0.1", 6379)])[0]
+    if isinstance(host, str):
+        return redis_client.from_url(host)
+    if isinstance(host, dict):
+        return redis_client.from_url(host["address"]) if "address" in host else redis_client.Redis(**host)
+    return redis_client.Redis(host=host[0], port=host[1])
+
+
+# ─────────────────────────────────────────────────────────
+# Deltas del inbox
+# ─────────────────────────────────────────────────────────
+def inbox_update_sends(thread_id, user_ids=None, event_id=None) -> list:
+    """
+    (grupo, evento) con el estado actual de la fila del inbox (snapshot + no leídos de
+    cada uno) para los miembros activos del hilo, o solo 'user_ids'. Dos consultas.
+    """
+    from ChatHiveApp.models import Thread, ThreadMember
+    from ChatHiveApp.serializers import ThreadListSerializer
+
+    thread = (
+        Thread.objects.filter(id=thread_id)
+        .only(
+            "id",
+            "is_archived",
+            "last_message_id",
+            "last_message_at",
+            "last_message_preview",
+            "last_message_sender_id",
+            "last_message_type",
+            "last_message_deleted",
+            "last_message_seq",
+            "message_seq",
+        )
+        .first()
+    )
+    if thread is None:
+        return []
+
+    members = ThreadMember.objects.filter(thread_id=thread_id, is_active=True)
+    if user_ids is not None:
+        members = members.filter(user_id__in=list(user_ids))
+
+    # Mismo formato que el listado de hilos
+    last_message = ThreadListSerializer().get_last_message(thread)
+    sends = []
+    for user_id, unread_count, last_read, last_read_seq in members.values_list(
+        "user_id", "unread_count", "last_read_message_id", "last_read_seq"
+    ):
+        data = {
+            "type": "inbox.thread",
+            "payload": {
+                "thread_id": str(thread.id),
+                "is_archived": thread.is_archived,
+                "unread_count": unread_count,
+                "last_read_message_id": str(last_read) if last_read else None,
+                "last_read_seq": last_read_seq,
+                "message_seq": thread.message_seq,
+                "last_message": last_message,
+            },
+        }
+        if event_id:
+            data["event_id"] = event_id
+        sends.append((user_group_name(user_id), thread_event_message(data)))
+    return sends
+
+
+def send_inbox_updates(thread_id, user_ids=None) -> None:
+    publish(inbox_update_sends(thread_id, user_ids))
+
+
+def push_inbox_update(thread_id, user_ids=None) -> None:
+    """
+    Encola los deltas del inbox del hilo en el outbox (misma transacción que el cambio).
+    Llamar después de tocar snapshot, contadores o archivado.
+    """
+    from ChatHiveApp import outbox
+
+    outbox.enqueue_inbox(thread_id, user_ids)
+
+
+def send_thread_added(thread_id, user_id) -> None:
+    """
+    El usuario entró (o volvió) a un hilo: se le envía la fila completa del inbox.
+    """
+    from accounts.models import User
+    from ChatHiveApp.api.threads import annotated_queryset_for
+    from ChatHiveApp.serializers import ThreadListSerializer
+
+    user = User.objects.filter(id=user_id).first()
+    thread = annotated_queryset_for(user).filter(id=thread_id).first() if user else None
+    if thread is None:
+        return
+    data = {
+        "type": "inbox.thread.added",
+        "payload": {"thread": ThreadListSerializer(thread, context={"user": user}).data},
+    }
+    publish([(user_group_name(user_id), thread_event_message(data))])
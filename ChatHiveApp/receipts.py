@@ -0,0 +1,331 @@
+# ChatHiveApp/receipts.py
+"""
+Estado de entrega/lectura por marcas de agua en ThreadMember.
+
+En vez de una fila Receipt por (mensaje, usuario) -O(mensajes × miembros)-, cada
+membresía guarda hasta qué mensaje le llegó (last_delivered_*) y hasta cuál leyó
+(last_read_*), como Message.seq del mensaje en el hilo. Las marcas solo avanzan
+y leer implica entregado.
+
+"Leído por" / "entregado a" de un mensaje se derivan comparando su posición con las
+marcas de los miembros activos (sin contar al emisor). Receipt queda como modelo legado:
+receipts_for() devuelve su misma forma calculada desde las marcas.
+
+Las marcas que llegan por WebSocket pasan por ReceiptCoalescer: por (usuario, hilo, tipo)
+solo se escribe la más adelantada de cada ventana, con un UPDATE.
+
+Frames (por el grupo thread_<id>, vía outbox):
+  { "type": "receipt.updated", "payload": { "thread_id", "user_id", "kind": "read"|"delivered", "message_id", "seq" } }
+  "delivered" solo se difunde en hilos DIRECT: en grupos serían N avisos por mensaje a N
+  miembros; ahí los contadores se piden por REST.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from channels.db import database_sync_to_async
+from django.db import transaction
+from django.db.models import Q
+
+from ChatHiveApp import outbox, realtime, unread
+from ChatHiveApp.models import Message, ReceiptStatus, Thread, ThreadKind, ThreadMember
+
+logger = logging.getLogger(__name__)
+
+READ = "read"
+DELIVERED = "delivered"
+KINDS = (READ, DELIVERED)
+
+# Marcas por WS: ventana de coalescencia y tope de claves (usuario, hilo, tipo) por lote
+COALESCE_WINDOW = 0.5  # segundos
+COALESCE_MAX_KEYS = 500
+
+
+def reached_position(prefix: str, message: Message) -> Q:
+    """
+    Filas cuya marca '<prefix>' ya alcanzó a 'message' (complemento de unread.before_position).
+    """
+    return Q(**{f"{prefix}_seq__gte": message.seq})
+
+
+def mark_delivered(thread_id, user_id, message: Message) -> bool:
+    """
+    Mueve la marca de entrega de (thread, user) hasta 'message' (solo hacia adelante).
+    """
+    updated = (
+        ThreadMember.objects.filter(thread_id=thread_id, user_id=user_id)
+        .filter(unread.before_position("last_delivered", message))
+        .update(
+            last_delivered_message_id=message.id,
+            last_delivered_at=message.created_at,
+            last_delivered_seq=message.seq,
+        )
+    )
+    return bool(updated)
+
+
+def _announce(thread_id, thread_kind, user_id, kind: str, message_id, seq) -> None:
+    """
+    Aviso de marca movida: el inbox del propio usuario (sus otros dispositivos) al leer y
+    "receipt.updated" al hilo para los emisores ("delivered" solo en DIRECT).
+    """
+    if kind == READ:
+        realtime.push_inbox_update(thread_id, [user_id])
+    if kind == READ or thread_kind == ThreadKind.DIRECT:
+        outbox.enqueue_group(
+            realtime.thread_group_name(thread_id),
+            {
+                "type": "receipt.updated",
+                "payload": {
+                    "thread_id": str(thread_id),
+                    "user_id": str(user_id),
+                    "kind": kind,
+                    "message_id": str(message_id),
+                    "seq": seq,
+                },
+            },
+        )
+
+
+def _advance(message: Message, user_id, kind: str) -> bool:
+    """
+    Un solo UPDATE condicional (leer también adelanta la entrega) y su aviso si la marca se movió.
+    """
+    if kind == READ:
+        advanced = unread.mark_read(message.thread_id, user_id, message)
+    else:
+        advanced = mark_delivered(message.thread_id, user_id, message)
+    if advanced:
+        _announce(message.thread_id, message.thread.kind, user_id, kind, message.id, message.seq)
+    return advanced
+
+
+def _messages(message_ids) -> Dict[str, Message]:
+    qs = (
+        Message.objects.filter(id__in=list(message_ids))
+        .select_related("thread")
+        .only("id", "thread_id", "created_at", "seq", "thread__kind")
+    )
+    return {str(m.id): m for m in qs}
+
+
+@transaction.atomic
+def advance(thread_id, user_id, message_id, kind: str) -> Optional[dict]:
+    """
+    Avanza la marca 'kind' del usuario hasta el mensaje 'message_id' del hilo (o hasta el
+    último si es None). None si el mensaje no es del hilo; {"advanced": False, ...} si la
+    marca ya estaba ahí o más adelante.
+    """
+    if message_id is None:
+        message_id = Thread.objects.filter(id=thread_id).values_list("last_message_id", flat=True).first()
+    message = _messages([message_id]).get(str(message_id)) if message_id else None
+    if message is None or str(message.thread_id) != str(thread_id):
+        return None
+
+    advanced = _advance(message, user_id, kind)
+    return {
+        "thread_id": str(thread_id),
+        "kind": kind,
+        "message_id": str(message.id),
+        "seq": message.seq,
+        "advanced": advanced,
+    }
+
+
+@transaction.atomic
+def advance_many(items) -> int:
+    """
+    Aplica un lote ya coalescido de [(user_id, thread_id, kind, message_ids|None), ...]:
+    de cada entrada solo cuenta el mensaje más adelantado (None = el último del hilo).
+    Dos SELECT para todo el lote y un UPDATE por (usuario, hilo, tipo), cada uno en su
+    savepoint: si una entrada falla se registra y se descarta solo esa.
+    """
+    latest_threads = {str(t) for _, t, _, ids in items if ids is None}
+    latest = dict(
+        Thread.objects.filter(id__in=latest_threads).values_list("id", "last_message_id")
+    ) if latest_threads else {}
+    latest = {str(t): m for t, m in latest.items() if m}
+
+    wanted = set(str(m) for m in latest.values())
+    for _, _, _, ids in items:
+        wanted.update(ids or ())
+    messages = _messages(wanted) if wanted else {}
+
+    advanced = 0
+    for user_id, thread_id, kind, ids in items:
+        ids = [latest.get(str(thread_id))] if ids is None else ids
+        candidates = [
+            messages[str(m)] for m in ids
+            if m and str(m) in messages and str(messages[str(m)].thread_id) == str(thread_id)
+        ]
+        if not candidates:
+            continue
+        target = max(candidates, key=lambda m: m.seq)
+        try:
+            with transaction.atomic():
+                advanced += _advance(target, user_id, kind)
+        except Exception:
+            logger.exception("receipts: no se pudo aplicar %s de %s en %s", kind, user_id, thread_id)
+    return advanced
+
+
+@transaction.atomic
+def mark_all_read(user_id) -> List[str]:
+    """
+    "Marcar todo como leído": un UPDATE para todas las membresías del usuario y un aviso
+    por hilo que cambió. Devuelve los thread_id afectados.
+    """
+    rows = unread.mark_all_read(user_id)
+    if not rows:
+        return []
+    kinds = dict(Thread.objects.filter(id__in=[row[0] for row in rows]).values_list("id", "kind"))
+    for thread_id, message_id, seq in rows:
+        _announce(thread_id, kinds.get(thread_id), user_id, READ, message_id, seq)
+    return [str(row[0]) for row in rows]
+
+
+# ─────────────────────────────────────────────────────────
+# Lecturas derivadas de las marcas
+# ─────────────────────────────────────────────────────────
+def watermarks(thread_id) -> List[dict]:
+    """
+    Marcas de los miembros activos del hilo: el cliente puede derivar de aquí los
+    recibos de cualquier mensaje que tenga cargado.
+    """
+    rows = ThreadMember.objects.filter(thread_id=thread_id, is_active=True).values_list(
+        "user_id", "last_delivered_message_id", "last_delivered_seq", "last_read_message_id", "last_read_seq"
+    )
+    return [
+        {
+            "user_id": str(user_id),
+            "delivered_message_id": str(delivered) if delivered else None,
+            "delivered_seq": delivered_seq,
+            "read_message_id": str(read) if read else None,
+            "read_seq": read_seq,
+        }
+        for user_id, delivered, delivered_seq, read, read_seq in rows
+    ]
+
+
+def _reached_members(message: Message, prefix: str):
+    qs = ThreadMember.objects.filter(thread_id=message.thread_id, is_active=True).filter(
+        reached_position(prefix, message)
+    )
+    if message.sender_id:
+        qs = qs.exclude(user_id=message.sender_id)
+    return qs
+
+
+def read_by(message: Message):
+    """
+    Miembros activos (sin el emisor) cuya marca de lectura alcanzó al mensaje.
+    """
+    return _reached_members(message, "last_read")
+
+
+def delivered_to(message: Message):
+    return _reached_members(message, "last_delivered")
+
+
+def receipt_counts(thread_id, messages: Iterable[Message]) -> Dict[str, dict]:
+    """
+    {message_id: {"delivered": n, "read": n}} para varios mensajes de un hilo con una sola
+    consulta: las marcas se ordenan una vez y cada mensaje se resuelve por bisección.
+    """
+    rows = list(
+        ThreadMember.objects.filter(thread_id=thread_id, is_active=True).values_list(
+            "user_id", "last_delivered_seq", "last_read_seq"
+        )
+    )
+    by_user = {user_id: {DELIVERED: delivered, READ: read} for user_id, delivered, read in rows}
+    sorted_marks = {kind: sorted(marks[kind] for marks in by_user.values()) for kind in KINDS}
+
+    counts = {}
+    for message in messages:
+        sender_marks = by_user.get(message.sender_id) if message.sender_id else None
+        entry = {}
+        for kind in KINDS:
+            marks = sorted_marks[kind]
+            n = len(marks) - bisect_left(marks, message.seq)
+            if sender_marks and sender_marks[kind] >= message.seq:
+                n -= 1
+            entry[kind] = n
+        counts[str(message.id)] = entry
+    return counts
+
+
+def receipts_for(message: Message) -> List[dict]:
+    """
+    Vista de compatibilidad con el antiguo Receipt: una entrada por miembro al que le llegó
+    el mensaje, con status DELIVERED o READ.
+    """
+    rows = delivered_to(message).values_list("user_id", "last_read_seq")
+    return [
+        {
+            "message_id": str(message.id),
+            "user_id": str(user_id),
+            "status": ReceiptStatus.READ if read_seq >= message.seq else ReceiptStatus.DELIVERED,
+        }
+        for user_id, read_seq in rows
+    ]
+
+
+# ─────────────────────────────────────────────────────────
+# Coalescer (async, uno por event loop)
+# ─────────────────────────────────────────────────────────
+class ReceiptCoalescer:
+    """
+    Los clientes mandan una marca por cada mensaje que entra en pantalla: aquí se juntan
+    por (usuario, hilo, tipo) durante COALESCE_WINDOW y se escribe solo la más adelantada,
+    todo el lote en un salto a database_sync_to_async. Fire-and-forget: quien envía no espera.
+    """
+
+    def __init__(self, window: float = COALESCE_WINDOW, max_keys: int = COALESCE_MAX_KEYS):
+        self.window = window
+        self.max_keys = max_keys
+        # (user_id, thread_id, kind) -> ids de mensaje vistos, o None = "hasta el último"
+        self._pending: Dict[Tuple[str, str, str], Optional[Set[str]]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def submit(self, user_id, thread_id, kind: str, message_id=None) -> None:
+        key = (str(user_id), str(thread_id), kind)
+        if message_id is None:
+            self._pending[key] = None
+        else:
+            ids = self._pending.setdefault(key, set())
+            if ids is not None:
+                ids.add(str(message_id))
+
+        if len(self._pending) >= self.max_keys:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush_now)
+
+    def _flush_now(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            asyncio.ensure_future(self._flush(batch))
+
+    async def _flush(self, batch):
+        items = [(user_id, thread_id, kind, ids) for (user_id, thread_id, kind), ids in batch.items()]
+        try:
+            await database_sync_to_async(advance_many)(items)
+        except Exception:
+            logger.exception("receipts: no se pudieron aplicar %d marca(s)", len(items))
+
+
+_coalescers: Dict[asyncio.AbstractEventLoop, ReceiptCoalescer] = {}
+
+
+def get_receipt_coalescer() -> ReceiptCoalescer:
+    loop = asyncio.get_running_loop()
+    coalescer = _coalescers.get(loop)
+    if coalescer is None:
+        coalescer = _coalescers[loop] = ReceiptCoalescer()
+    return coalescer
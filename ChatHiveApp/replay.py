@@ -0,0 +1,269 @@
+# ChatHiveApp/replay.py
+"""
+Registro acotado de los eventos de cada hilo para reanudar tras una reconexión.
+
+Los eventos que se difunden al grupo thread_<id> (REPLAY_TYPES: mensajes creados,
+editados, borrados y marcas de lectura) se añaden antes de enviarse a un stream de
+Redis por hilo (chathive:replay:thread_<id>, XADD MAXLEN REPLAY_MAX_EVENTS). El frame
+lleva su posición en "replay_id" ("<ms>-<n>") y un "event_id" único.
+
+Los replay_id se asignan antes del group_send y desde varios procesos (publisher,
+dispatcher del outbox, consumers), así que los frames en vivo pueden llegar
+desordenados: el cliente NO descarta por replay_id, deduplica por event_id (y los
+mensajes, además, por seq). Como 'since' guarda el mayor replay_id visto.
+
+Al reconectar, el cliente hace thread.join con "since". El consumer se une al grupo y
+reenvía en orden lo del stream desde REPLAY_REORDER_WINDOW antes de 'since' (cubre lo
+que se asignó antes pero aún no había llegado; lo ya visto se descarta por event_id),
+antes de "thread.joined". Si el registro ya se recortó por detrás de 'since', no se
+reenvía nada y "thread.joined" lleva "gap": true: hay que recargar por REST. Un hilo
+sin registro (sin eventos desde hace menos de REPLAY_TTL) no ha perdido nada.
+
+El outbox guarda el replay_id en la fila al anotarlo, así que sus reenvíos llevan el
+mismo y el mismo event_id; solo si el dispatcher cae entre anotarlo y guardarlo se
+anota de nuevo (otro replay_id, mismo event_id).
+Sin Redis (tests / InMemoryChannelLayer) se usa un registro en proceso.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+
+from ChatHiveApp.codecs import JSON_CODEC
+from ChatHiveApp.realtime import channel_layer_redis
+
+logger = logging.getLogger(__name__)
+
+REPLAY_MAX_EVENTS = 500  # por hilo
+REPLAY_TTL = 7 * 86400  # segundos sin eventos hasta que el stream expira
+REPLAY_REORDER_WINDOW = 5000  # ms antes de 'since' que se reenvían (llegadas desordenadas)
+REPLAY_GROUP_PREFIX = "thread_"
+REPLAY_TYPES = {"message.created", "message.updated", "message.deleted", "receipt.updated"}
+KEY_PREFIX = "chathive:replay"
+
+_REPLAY_ID = re.compile(r"^\d{1,20}-\d{1,20}$")
+
+
+def parse_replay_id(value) -> Optional[Tuple[int, int]]:
+    if not isinstance(value, str) or not _REPLAY_ID.match(value):
+        return None
+    ms, seq = value.split("-")
+    return int(ms), int(seq)
+
+
+def replayable(group: str, data: dict) -> bool:
+    return group.startswith(REPLAY_GROUP_PREFIX) and data.get("type") in REPLAY_TYPES
+
+
+@dataclass
+class Replay:
+    events: List[dict] = field(default_factory=list)
+    gap: bool = False
+    last_id: Optional[str] = None  # último replay_id del registro (nuevo 'since' tras recargar)
+
+
+def _with_event_id(data: dict) -> dict:
+    return data if data.get("event_id") else {**data, "event_id": str(uuid.uuid4())}
+
+
+def _window_start(position: Tuple[int, int]) -> Tuple[int, int]:
+    return max(position[0] - REPLAY_REORDER_WINDOW, 0), 0
+
+
+def _empty(since: str, position: Tuple[int, int]) -> Replay:
+    """
+    Sin registro del grupo: nada perdido si 'since' es más reciente que REPLAY_TTL (un
+    evento posterior a 'since' habría renovado la expiración); si no, pudo expirar.
+    """
+    if time.time() * 1000 - position[0] < REPLAY_TTL * 1000:
+        return Replay(last_id=since)
+    return Replay(gap=True)
+
+
+def _str(value) -> str:
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+# ─────────────────────────────────────────────────────────
+# Stores
+# ─────────────────────────────────────────────────────────
+class RedisReplayLog:
+    """
+    Un stream por grupo. Escribe el código sync (outbox, on_commit) y el async (consumer);
+    solo lee el consumer.
+    """
+
+    def __init__(self):
+        self._sync = None
+        self._async = None
+
+    @property
+    def redis(self):
+        if self._sync is None:
+            self._sync = channel_layer_redis(aio=False)
+        return self._sync
+
+    @property
+    def aredis(self):
+        if self._async is None:
+            self._async = channel_layer_redis(aio=True)
+        return self._async
+
+    @staticmethod
+    def _key(group: str) -> str:
+        return f"{KEY_PREFIX}:{group}"
+
+    def append_many(self, items: List[Tuple[str, dict]]) -> List[str]:
+        with self.redis.pipeline(transaction=False) as pipe:
+            for group, data in items:
+                key = self._key(group)
+                pipe.xadd(key, {"d": JSON_CODEC.encode(data)}, maxlen=REPLAY_MAX_EVENTS, approximate=False)
+                pipe.expire(key, REPLAY_TTL)
+            results = pipe.execute()
+        return [_str(r) for r in results[::2]]
+
+    async def aappend(self, group: str, data: dict) -> str:
+        key = self._key(group)
+        async with self.aredis.pipeline(transaction=False) as pipe:
+            pipe.xadd(key, {"d": JSON_CODEC.encode(data)}, maxlen=REPLAY_MAX_EVENTS, approximate=False)
+            pipe.expire(key, REPLAY_TTL)
+            replay_id, _ = await pipe.execute()
+        return _str(replay_id)
+
+    async def since(self, group: str, since: str) -> Replay:
+        key = self._key(group)
+        position = parse_replay_id(since)
+        try:
+            info = await self.aredis.xinfo_stream(key)
+        except Exception:
+            # ResponseError "no such key": nunca hubo eventos o expiró
+            return _empty(since, position)
+
+        last_id = _str(info["last-generated-id"])
+
+        # Redis >= 7: la mayor id recortada; antes, se aproxima por la primera retenida
+        deleted = info.get("max-deleted-entry-id")
+        if deleted is not None:
+            gap = position < parse_replay_id(_str(deleted))
+        else:
+            first = info.get("first-entry")
+            gap = first is None or (
+                position < parse_replay_id(_str(first[0])) and info["length"] >= REPLAY_MAX_EVENTS
+            )
+        if gap:
+            return Replay(gap=True, last_id=last_id)
+
+        start = _window_start(position)
+        rows = await self.aredis.xrange(key, min=f"{start[0]}-{start[1]}", max="+")
+        events = [
+            {**JSON_CODEC.decode(_str(fields.get(b"d", fields.get("d")))), "replay_id": _str(rid)}
+            for rid, fields in rows
+        ]
+        return Replay(events=events, last_id=last_id)
+
+
+class MemoryReplayLog:
+    """
+    Mismo contrato en proceso: un deque acotado por grupo y la mayor id descartada.
+    """
+
+    def __init__(self, max_events: int = REPLAY_MAX_EVENTS):
+        self.max_events = max_events
+        self._logs: Dict[str, Deque[Tuple[Tuple[int, int], dict]]] = {}
+        self._trimmed: Dict[str, Tuple[int, int]] = {}
+        self._last: Tuple[int, int] = (0, 0)
+        self._lock = threading.Lock()
+
+    def _next_id(self) -> Tuple[int, int]:
+        ms = int(time.time() * 1000)
+        self._last = (ms, 0) if ms > self._last[0] else (self._last[0], self._last[1] + 1)
+        return self._last
+
+    def append_many(self, items: List[Tuple[str, dict]]) -> List[str]:
+        ids = []
+        with self._lock:
+            for group, data in items:
+                log = self._logs.setdefault(group, deque())
+                position = self._next_id()
+                log.append((position, data))
+                if len(log) > self.max_events:
+                    self._trimmed[group] = log.popleft()[0]
+                ids.append(f"{position[0]}-{position[1]}")
+        return ids
+
+    async def aappend(self, group: str, data: dict) -> str:
+        return self.append_many([(group, data)])[0]
+
+    async def since(self, group: str, since: str) -> Replay:
+        position = parse_replay_id(since)
+        with self._lock:
+            log = self._logs.get(group)
+            if not log:
+                return _empty(since, position)
+            last = log[-1][0]
+            last_id = f"{last[0]}-{last[1]}"
+            if position < self._trimmed.get(group, (0, 0)):
+                return Replay(gap=True, last_id=last_id)
+            start = _window_start(position)
+            events = [{**data, "replay_id": f"{p[0]}-{p[1]}"} for p, data in log if p >= start]
+        return Replay(events=events, last_id=last_id)
+
+
+# ─────────────────────────────────────────────────────────
+# API
+# ─────────────────────────────────────────────────────────
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_replay_log():
+    global _log
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                _log = RedisReplayLog() if channel_layer_redis(aio=False) is not None else MemoryReplayLog()
+    return _log
+
+
+def record_many(sends: List[Tuple[str, dict]]) -> List[Tuple[str, dict]]:
+    """
+    (grupo, data) -> (grupo, data con "replay_id") para los eventos repetibles, en orden.
+    Si el registro falla se envían igual, sin replay_id (el cliente no avanza su 'since').
+    """
+    out = list(sends)
+    pending = [i for i, (group, data) in enumerate(out) if replayable(group, data)]
+    if not pending:
+        return out
+    for i in pending:
+        group, data = out[i]
+        out[i] = (group, _with_event_id(data))
+    try:
+        ids = get_replay_log().append_many([out[i] for i in pending])
+    except Exception:
+        logger.exception("replay: no se pudieron registrar %d evento(s)", len(pending))
+        return out
+    for i, replay_id in zip(pending, ids):
+        group, data = out[i]
+        out[i] = (group, {**data, "replay_id": replay_id})
+    return out
+
+
+def record(group: str, data: dict) -> dict:
+    return record_many([(group, data)])[0][1]
+
+
+async def arecord(group: str, data: dict) -> dict:
+    if not replayable(group, data):
+        return data
+    data = _with_event_id(data)
+    try:
+        return {**data, "replay_id": await get_replay_log().aappend(group, data)}
+    except Exception:
+        logger.exception("replay: no se pudo registrar el evento de %s", group)
+        return data
@@ -0,0 +1,173 @@
+# ChatHiveApp/search.py
+"""
+Búsqueda de texto en los mensajes de los hilos del usuario.
+
+El índice lo crea la migración 0009:
+  - PostgreSQL: columna generada Message.search_vector (to_tsvector('simple', text)) con GIN
+    parcial (deleted_at IS NULL). Al editar se recalcula sola; al borrar (soft delete) el
+    texto queda vacío y además el filtro excluye deleted_at.
+  - SQLite: tabla FTS5 chathive_message_fts mantenida por triggers (solo desarrollo/tests;
+    si una migración posterior rehace la tabla de mensajes en SQLite hay que recrearlos).
+  - Otros motores: icontains sin ranking.
+
+Orden: relevancia desc, luego (created_at, id) desc; el cursor es esa terna.
+Los fragmentos se devuelven con HTML escapado y las coincidencias entre <mark>…</mark>.
+"""
+from __future__ import annotations
+
+import html
+import re
+from typing import List, Optional, Tuple
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from ChatHiveApp.models import Message, ThreadMember
+
+SEARCH_CONFIG = "simple"  # la misma que la columna generada de la migración 0009
+FTS_TABLE = "chathive_message_fts"
+SNIPPET_WORDS = 16
+FALLBACK_CONTEXT = 60  # caracteres a cada lado de la coincidencia (sin índice)
+
+# Delimitadores internos (uso privado de Unicode): se sustituyen tras escapar el HTML
+_MARK_START = "\ue000"
+_MARK_END = "\ue001"
+_FTS_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+# (message_id, rank, snippet|None)
+Hit = Tuple[object, float, Optional[str]]
+
+
+def render_snippet(raw: str) -> str:
+    return html.escape(raw).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+def _after_position(position) -> Q:
+    rank, created_at, pk = position
+    return (
+        Q(rank__lt=rank)
+        | Q(rank=rank, created_at__lt=created_at)
+        | Q(rank=rank, created_at=created_at, id__lt=pk)
+    )
+
+
+def _member_messages(user_id, thread_id=None):
+    qs = Message.objects.filter(
+        deleted_at__isnull=True,
+        thread_id__in=ThreadMember.objects.filter(user_id=user_id, is_active=True).values("thread_id"),
+    )
+    if thread_id:
+        qs = qs.filter(thread_id=thread_id)
+    return qs
+
+
+# ─────────────────────────────────────────────────────────
+# Motores
+# ─────────────────────────────────────────────────────────
+def _postgres_hits(user_id, query, thread_id, position, limit) -> List[Hit]:
+    table = connection.ops.quote_name(Message._meta.db_table)
+    tsquery = "websearch_to_tsquery(%s, %s)"
+    qs = _member_messages(user_id, thread_id).annotate(
+        matched=RawSQL(f"{table}.search_vector @@ {tsquery}", [SEARCH_CONFIG, query], output_field=BooleanField()),
+        # float8: el valor sobrevive exacto al cursor JSON
+        rank=RawSQL(f"ts_rank_cd({table}.search_vector, {tsquery})::float8", [SEARCH_CONFIG, query],
+                    output_field=FloatField()),
+    ).filter(matched=True)
+    if position:
+        qs = qs.filter(_after_position(position))
+    rows = list(qs.order_by("-rank", "-created_at", "-id").values_list("id", "rank")[:limit])
+    if not rows:
+        return []
+
+    # ts_headline solo para la página
+    options = f"StartSel={_MARK_START}, StopSel={_MARK_END}, MaxWords={SNIPPET_WORDS}, MinWords=6, MaxFragments=2"
+    headlines = dict(
+        Message.objects.filter(id__in=[pk for pk, _ in rows])
+        .annotate(snippet=RawSQL(f"ts_headline(%s, {table}.text, {tsquery}, %s)",
+                                 [SEARCH_CONFIG, SEARCH_CONFIG, query, options]))
+        .values_list("id", "snippet")
+    )
+    return [(pk, rank, headlines.get(pk)) for pk, rank in rows]
+
+
+def _fts_query(query: str) -> str:
+    # Cada palabra como frase entre comillas: la sintaxis FTS5 del usuario no llega al MATCH
+    return " ".join(f'"{token}"' for token in _FTS_TOKEN.findall(query))
+
+
+def _sqlite_hits(user_id, query, thread_id, position, limit) -> List[Hit]:
+    match = _fts_query(query)
+    if not match:
+        return []
+    ops = connection.ops
+    message_table = ops.quote_name(Message._meta.db_table)
+    member_table = ops.quote_name(ThreadMember._meta.db_table)
+    pk_field = Message._meta.pk
+    user_field = ThreadMember._meta.get_field("user").target_field
+
+    rank = f"-bm25({FTS_TABLE})"
+    where = [f"{FTS_TABLE} MATCH %s", "m.deleted_at IS NULL"]
+    params = [match]
+    if thread_id:
+        where.append("m.thread_id = %s")
+        params.append(pk_field.get_db_prep_value(thread_id, connection))
+    if position:
+        r, created_at, pk = position
+        created_at = ops.adapt_datetimefield_value(created_at)
+        pk = pk_field.get_db_prep_value(pk, connection)
+        where.append(
+            f"({rank} < %s OR ({rank} = %s AND (m.created_at < %s OR (m.created_at = %s AND m.id < %s))))"
+        )
+        params += [r, r, created_at, created_at, pk]
+
+    sql = (
+        f"SELECT m.id, {rank}, snippet({FTS_TABLE}, 0, %s, %s, '…', {SNIPPET_WORDS}) "
+        f"FROM {FTS_TABLE} JOIN {message_table} m ON m.id = {FTS_TABLE}.message_id "
+        f"JOIN {member_table} tm ON tm.thread_id = m.thread_id AND tm.user_id = %s AND tm.is_active "
+        f"WHERE {' AND '.join(where)} "
+        f"ORDER BY {rank} DESC, m.created_at DESC, m.id DESC LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql, [_MARK_START, _MARK_END, user_field.get_db_prep_value(user_id, connection), *params, limit]
+        )
+        rows = cursor.fetchall()
+    return [(pk_field.to_python(pk), float(r), snippet) for pk, r, snippet in rows]
+
+
+def _fallback_hits(user_id, query, thread_id, position, limit) -> List[Hit]:
+    qs = _member_messages(user_id, thread_id).filter(text__icontains=query).annotate(
+        rank=Value(0.0, output_field=FloatField())
+    )
+    if position:
+        qs = qs.filter(_after_position(position))
+    rows = qs.order_by("-created_at", "-id").values_list("id", "text")[:limit]
+    pattern = re.compile(re.escape(query), re.IGNORECASE)
+
+    def snippet(text):
+        # Ventana de texto alrededor de la primera coincidencia
+        found = pattern.search(text)
+        start = max(0, found.start() - FALLBACK_CONTEXT) if found else 0
+        window = text[start:start + 2 * FALLBACK_CONTEXT + len(query)]
+        return pattern.sub(lambda m: f"{_MARK_START}{m.group(0)}{_MARK_END}", window)
+
+    return [(pk, 0.0, snippet(text)) for pk, text in rows]
+
+
+def _sqlite_fts_available() -> bool:
+    return FTS_TABLE in connection.introspection.table_names()
+
+
+def search_hits(user_id, query: str, thread_id=None, position=None, limit: int = 30) -> List[Hit]:
+    """
+    Hasta 'limit' coincidencias posteriores a 'position' (rank, created_at, id), en orden.
+    """
+    query = (query or "").strip()
+    if not query:
+        return []
+    if connection.vendor == "postgresql":
+        return _postgres_hits(user_id, query, thread_id, position, limit)
+    if connection.vendor == "sqlite" and _sqlite_fts_available():
+        return _sqlite_hits(user_id, query, thread_id, position, limit)
+    return _fallback_hits(user_id, query, thread_id, position, limit)
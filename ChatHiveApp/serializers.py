@@ -38,6 +38,7 @@ class MessageSerializer(serializers.ModelSerializer):
             "meta",
             "reply_to",
             "client_id",
+            "seq",
             "created_at",
             "edited_at",
             "deleted_at",
@@ -45,6 +46,7 @@ class MessageSerializer(serializers.ModelSerializer):
         read_only_fields = (
             "id",
             "thread",
+            "seq",
             "sender_id",
             "sender",
             "created_at",
@@ -69,13 +71,17 @@ class MessageSerializer(serializers.ModelSerializer):
         data = super().to_representation(obj)
         if obj.deleted_at:
           data["text"] = ""
+        # Contadores derivados de las marcas de los miembros (?receipts=1, ver ChatHiveApp.receipts)
+        counts = self.context.get("receipt_counts")
+        if counts is not None:
+            data["receipts"] = counts.get(str(obj.id))
         return data
 
 class ThreadListSerializer(serializers.ModelSerializer):
     """
     Serializer compacto para listar hilos en la sidebar.
-    Usa anotaciones hechas en el queryset: last_text, last_sender_id,
-    last_created_at, unread_count, etc.
+    El último mensaje sale del snapshot last_message_* del Thread y
+    unread_count de la anotación del queryset (sin consultas extra).
     """
 
     last_message = serializers.SerializerMethodField()
@@ -90,6 +96,7 @@ class ThreadListSerializer(serializers.ModelSerializer):
             "title",
             "is_archived",
             "unread_count",
+            "message_seq",
             "last_message",
             "peer",
             "created_at",
@@ -98,19 +105,18 @@ class ThreadListSerializer(serializers.ModelSerializer):
 
     # ── Último mensaje ────────────────────────────────────────────
     def get_last_message(self, obj: Thread):
-        # Usa las anotaciones hechas en la view: last_text, last_sender_id, last_created_at
-        last_text = getattr(obj, "last_text", None)
-        last_sender_id = getattr(obj, "last_sender_id", None)
-        last_created_at = getattr(obj, "last_created_at", None)
-
-        if last_text is None and obj.last_message_id is None:
+        # Snapshot desnormalizado en Thread (ver ChatHiveApp.inbox)
+        if obj.last_message_id is None:
             return None
 
         return {
-            "id": str(obj.last_message_id) if obj.last_message_id else None,
-            "text": last_text,
-            "sender_id": str(last_sender_id) if last_sender_id else None,
-            "created_at": last_created_at,
+            "id": str(obj.last_message_id),
+            "seq": obj.last_message_seq,
+            "text": obj.last_message_preview,
+            "sender_id": str(obj.last_message_sender_id) if obj.last_message_sender_id else None,
+            "type": obj.last_message_type or None,
+            "deleted": obj.last_message_deleted,
+            "created_at": serializers.DateTimeField().to_representation(obj.last_message_at),
         }
 
     # ── Peer para hilos DIRECT ────────────────────────────────────
@@ -125,8 +131,10 @@ class ThreadListSerializer(serializers.ModelSerializer):
         if getattr(obj, "kind", None) != "DIRECT":
             return None
 
+        # "user" en el contexto cuando no hay request (p.ej. eventos WS, ver ChatHiveApp.realtime)
         request = self.context.get("request")
-        me_id = getattr(request.user, "id", None) if request and hasattr(request, "user") else None
+        me = self.context.get("user") or getattr(request, "user", None)
+        me_id = getattr(me, "id", None)
 
         # Si la vista hizo prefetch como:
         #   .prefetch_related(Prefetch("members", queryset=ThreadMember.objects.select_related("user"), to_attr="members_all"))
@@ -1,33 +1,81 @@
 # ChatHiveApp/signals.py
-from django.db.models.signals import post_save
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
-from django.utils import timezone
-from .models import Message, Thread
+from .hot_window import hot_window
+from .inbox import touch_members
+from .publisher import publish
+from .realtime import send_thread_added, user_group_name
+from .models import Message, Thread, ThreadMember, bump_message_version
 
-def thread_group_name(thread_id):
-    return f"thread_{thread_id}"
+# Campos de ThreadMember que se ven en la lista de miembros del inbox de los demás
+MEMBER_LIST_FIELDS = {"is_active", "role"}
 
-@receiver(post_save, sender=Message)
-def fanout_message(sender, instance: Message, created, **kwargs):
-    if not created:
+# Campos de User que el historial muestra del remitente (UserMiniSerializer)
+SENDER_FIELDS = {"email", "first_name", "last_name", "display_name"}
+
+
+def notify_membership_revoked(thread_id, user_id):
+    """
+    Avisa a las conexiones del usuario: invalidan su caché de membresía y salen del grupo del hilo.
+    """
+    publish([(user_group_name(user_id), {"type": "membership.revoked", "thread_id": str(thread_id)})])
+
+
+def _member_changes(instance: ThreadMember, update_fields) -> set:
+    """
+    MEMBER_LIST_FIELDS que cambia este save: de los guardados (update_fields, o todos en un
+    save() completo como el del admin), los que difieren de lo leído de BD (ThreadMember.from_db).
+    """
+    fields = MEMBER_LIST_FIELDS & set(update_fields) if update_fields else MEMBER_LIST_FIELDS
+    loaded = getattr(instance, "_loaded_member_values", None)
+    if loaded is None:
+        return set(fields)
+    return {name for name in fields if name not in loaded or loaded[name] != getattr(instance, name)}
+
+
+@receiver(post_save, sender=ThreadMember)
+def membership_saved(sender, instance: ThreadMember, created, update_fields=None, **kwargs):
+    thread_id, user_id = instance.thread_id, instance.user_id
+    changes = MEMBER_LIST_FIELDS if created else _member_changes(instance, update_fields)
+    instance._loaded_member_values = {name: getattr(instance, name) for name in MEMBER_LIST_FIELDS}
+    if changes:
+        # La fila del hilo cambia para todos los miembros (?changed_since=, ETag del inbox)
+        touch_members(thread_id)
+    if "is_active" not in changes:
+        return
+    if instance.is_active:
+        # Alta (o reactivación): la fila del hilo aparece en su inbox sin polling
+        transaction.on_commit(lambda: send_thread_added(thread_id, user_id))
+    elif not created:
+        # Baja (activo -> inactivo): sus conexiones salen del grupo del hilo
+        transaction.on_commit(lambda: notify_membership_revoked(thread_id, user_id))
+
+
+@receiver(post_delete, sender=ThreadMember)
+def membership_deleted(sender, instance: ThreadMember, **kwargs):
+    thread_id, user_id = instance.thread_id, instance.user_id
+    touch_members(thread_id)
+    transaction.on_commit(lambda: notify_membership_revoked(thread_id, user_id))
+
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance: Message, **kwargs):
+    # Borrado físico (admin, cascada del hilo): la ventana caliente del hilo se descarta
+    hot_window.invalidate(instance.thread_id)
+    bump_message_version([instance.thread_id])
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def sender_profile_saved(sender, instance, created, update_fields=None, **kwargs):
+    """
+    El historial lleva el perfil del remitente: nueva versión (ETag) y ventana caliente
+    vacía en los hilos del usuario.
+    """
+    if created or (update_fields and not SENDER_FIELDS & set(update_fields)):
         return
-    # Optimizar hilo
-    Thread.objects.filter(id=instance.thread_id).update(
-        last_message_at=timezone.now(),
-        last_message_id=instance.id,
-    )
-    layer = get_channel_layer()
-    payload = {
-        "type": "chat.message",
-        "message": {
-            "id": str(instance.id),
-            "thread_id": str(instance.thread_id),
-            "sender_id": instance.sender_id,
-            "text": instance.text,
-            "type": instance.type,
-            "created_at": instance.created_at.isoformat(),
-        },
-    }
-    async_to_sync(layer.group_send)(thread_group_name(instance.thread_id), payload)
+    thread_ids = list(Thread.objects.filter(members__user=instance).values_list("id", flat=True))
+    bump_message_version(thread_ids)
+    for thread_id in thread_ids:
+        hot_window.invalidate(thread_id)
@@ -1,3 +1,886 @@
-from django.test import TestCase
+import asyncio
+import time
+import uuid
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.db import IntegrityError, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+import msgpack
+from channels.layers import get_channel_layer
+from channels_redis.core import RedisChannelLayer
+
+from accounts.models import User
+from ChatHiveApp import hot_window as hot_window_module
+from ChatHiveApp import outbox, receipts, replay, unread
+from ChatHiveApp.api.messages import ChatMessagePagination
+from ChatHiveApp.api.threads import sync_cursor
+from ChatHiveApp.api.pagination import encode_cursor
+from ChatHiveApp import codecs
+from ChatHiveApp.codecs import (
+    EXT_UUID,
+    JSON_CODEC,
+    MSGPACK_CODEC,
+    MSGPACK_SUBPROTOCOL,
+    encode_frames,
+    frame_for,
+    negotiate,
+)
+from ChatHiveApp.consumers import TypingThrottle
+from ChatHiveApp.receipts import ReceiptCoalescer, advance_many
+from ChatHiveApp.presence import PRESENCE_ANNOUNCED_TTL, MemoryPresenceStore
+from ChatHiveApp.realtime import _pipelined_group_add, group_add_many, thread_event_message
+from ChatHiveApp.hot_window import HotWindow, MemoryHotWindowStore
+from ChatHiveApp.models import Message, MessageType, OutboxEvent, OutboxKind, Thread, ThreadKind, ThreadMember
+from ChatHiveApp.replay import MemoryReplayLog
+from ChatHiveApp.writer import PendingMessage, persist_batch
+
+# Sin Redis: channel layer, presencia, ventana caliente y replay en memoria
+IN_MEMORY_LAYER = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYER, REALTIME_OUTBOX=False)
+class ChatTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(email="alice@chathive.test")
+        cls.bob = User.objects.create_user(email="bob@chathive.test")
+        cls.carol = User.objects.create_user(email="carol@chathive.test")
+
+    def make_thread(self, *users) -> Thread:
+        thread = Thread.objects.create(kind=ThreadKind.GROUP, title="test", created_by=users[0])
+        ThreadMember.objects.bulk_create([ThreadMember(thread=thread, user=u) for u in users])
+        return thread
+
+    def send(self, thread, user, text="hola", client_id=None) -> Message:
+        return persist_batch([PendingMessage(str(thread.id), str(user.id), text, client_id)])[0]
+
+    def member(self, thread, user) -> ThreadMember:
+        return ThreadMember.objects.get(thread=thread, user=user)
+
+
+# ─────────────────────────────────────────────────────────
+# seq por hilo
+# ─────────────────────────────────────────────────────────
+class MessageSeqTests(ChatTestCase):
+    def test_batch_allocates_consecutive_seqs_per_thread(self):
+        t1 = self.make_thread(self.alice, self.bob)
+        t2 = self.make_thread(self.alice, self.bob)
+        items = [
+            PendingMessage(str(t), str(self.alice.id), f"m{i}")
+            for i, t in enumerate([t1.id, t2.id, t1.id, t1.id, t2.id])
+        ]
+
+        results = persist_batch(items)
+
+        self.assertEqual([m.seq for m in results], [1, 1, 2, 3, 2])
+        self.assertEqual(list(t1.messages.order_by("seq").values_list("text", flat=True)), ["m0", "m2", "m3"])
+        t1.refresh_from_db()
+        t2.refresh_from_db()
+        self.assertEqual((t1.message_seq, t1.last_message_seq), (3, 3))
+        self.assertEqual((t2.message_seq, t2.last_message_seq), (2, 2))
+
+        # El siguiente lote (y save()) continúa la numeración del hilo
+        self.assertEqual(self.send(t1, self.bob).seq, 4)
+        message = Message.objects.create(thread=t1, sender=self.bob, type=MessageType.TEXT, text="save")
+        self.assertEqual(message.seq, 5)
+
+    def test_repeated_client_id_is_one_message(self):
+        thread = self.make_thread(self.alice, self.bob)
+        item = PendingMessage(str(thread.id), str(self.alice.id), "hola", "c-1")
+        twin = PendingMessage(str(thread.id), str(self.alice.id), "hola", "c-1")
+
+        first, second = persist_batch([item, twin])
+        retry = self.send(thread, self.alice, "hola", client_id="c-1")
+
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(first.pk, retry.pk)
+        self.assertEqual(first.seq, 1)
+        thread.refresh_from_db()
+        self.assertEqual(thread.message_seq, 1)
+
+    def test_seq_is_unique_per_thread(self):
+        thread = self.make_thread(self.alice)
+        other = self.make_thread(self.alice)
+        self.send(thread, self.alice)
+        self.send(other, self.alice)  # el mismo seq en otro hilo es válido
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Message.objects.bulk_create([Message(thread=thread, sender=self.alice, text="dup", seq=1)])
+
+
+# ─────────────────────────────────────────────────────────
+# Contadores de no leídos
+# ─────────────────────────────────────────────────────────
+class UnreadCounterTests(ChatTestCase):
+    def setUp(self):
+        self.thread = self.make_thread(self.alice, self.bob, self.carol)
+        self.m1, self.m2, self.m3 = (self.send(self.thread, self.bob, f"m{i}") for i in range(1, 4))
+
+    def counts(self):
+        return {
+            user: self.member(self.thread, user).unread_count
+            for user in (self.alice, self.bob, self.carol)
+        }
+
+    def delete(self, message):
+        Message.objects.filter(pk=message.pk).update(deleted_at=timezone.now())
+        return unread.on_message_deleted(message)
+
+    def test_new_messages_count_for_everyone_but_the_sender(self):
+        self.assertEqual(self.counts(), {self.alice: 3, self.bob: 0, self.carol: 3})
+
+    def test_mark_read_counts_only_later_messages_and_moves_forward(self):
+        self.assertTrue(unread.mark_read(self.thread.id, self.alice.id, self.m2))
+
+        member = self.member(self.thread, self.alice)
+        self.assertEqual(member.unread_count, 1)
+        self.assertEqual((member.last_read_seq, member.last_delivered_seq), (2, 2))
+        self.assertEqual(member.last_read_message_id, self.m2.id)
+
+        # Una marca anterior no retrocede
+        self.assertFalse(unread.mark_read(self.thread.id, self.alice.id, self.m1))
+        self.assertEqual(self.member(self.thread, self.alice).last_read_seq, 2)
+
+    def test_mark_read_skips_deleted_messages(self):
+        self.delete(self.m3)
+        unread.mark_read(self.thread.id, self.alice.id, self.m1)
+        self.assertEqual(self.member(self.thread, self.alice).unread_count, 1)  # solo m2
+
+    def test_deleting_a_message_only_decrements_who_had_not_read_it(self):
+        unread.mark_read(self.thread.id, self.alice.id, self.m2)
+
+        self.delete(self.m1)  # alice ya lo había leído
+        self.assertEqual(self.counts(), {self.alice: 1, self.bob: 0, self.carol: 2})
+
+        self.delete(self.m3)  # nadie lo había leído
+        self.assertEqual(self.counts(), {self.alice: 0, self.bob: 0, self.carol: 1})
+
+    def test_recompute_matches_incremental_counters(self):
+        unread.mark_read(self.thread.id, self.alice.id, self.m1)
+        self.delete(self.m2)
+        self.send(self.thread, self.carol, "m4")
+        incremental = self.counts()
+
+        ThreadMember.objects.filter(thread=self.thread).update(unread_count=99)
+        unread.recompute_unread(ThreadMember.objects.filter(thread=self.thread))
+
+        self.assertEqual(self.counts(), incremental)
+        self.assertEqual(incremental, {self.alice: 2, self.bob: 1, self.carol: 2})
+
+
+
+# ─────────────────────────────────────────────────────────
+# Altas y bajas de miembros
+# ─────────────────────────────────────────────────────────
+class MembershipSignalTests(ChatTestCase):
+    def setUp(self):
+        self.thread = self.make_thread(self.alice, self.bob)
+        self.patches = {
+            name: mock.patch(f"ChatHiveApp.signals.{name}").start()
+            for name in ("touch_members", "send_thread_added", "notify_membership_revoked")
+        }
+        self.addCleanup(mock.patch.stopall)
+
+    def save(self, member, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            member.save(**kwargs)
+
+    def calls(self):
+        return {name: patched.call_count for name, patched in self.patches.items()}
+
+    def test_deactivation_is_revoked_once(self):
+        member = self.member(self.thread, self.bob)
+        member.is_active = False
+        self.save(member)  # save() completo, como el admin
+        self.assertEqual(self.calls(), {"touch_members": 1, "send_thread_added": 0, "notify_membership_revoked": 1})
+
+        # Más saves del miembro ya inactivo no vuelven a revocar ni tocan el inbox
+        member.mute_until = timezone.now()
+        self.save(member)
+        member = self.member(self.thread, self.bob)
+        self.save(member)
+        self.save(member, update_fields=["is_active", "updated_at"])
+        self.assertEqual(self.calls(), {"touch_members": 1, "send_thread_added": 0, "notify_membership_revoked": 1})
+
+    def test_reactivation_adds_the_thread(self):
+        ThreadMember.objects.filter(thread=self.thread, user=self.bob).update(is_active=False)
+        member = self.member(self.thread, self.bob)
+        member.is_active = True
+        self.save(member, update_fields=["is_active", "updated_at"])
+        self.assertEqual(self.calls(), {"touch_members": 1, "send_thread_added": 1, "notify_membership_revoked": 0})
+
+    def test_unrelated_changes_do_not_touch_members(self):
+        member = self.member(self.thread, self.alice)
+        member.unread_count = 0
+        self.save(member)
+        self.save(member, update_fields=["unread_count"])
+        self.assertEqual(sum(self.calls().values()), 0)
+
+
+
+# ─────────────────────────────────────────────────────────
+# Marcas de lectura / entrega por lotes
+# ─────────────────────────────────────────────────────────
+class AdvanceManyTests(ChatTestCase):
+    def setUp(self):
+        self.thread = self.make_thread(self.alice, self.bob, self.carol)
+        self.m1, self.m2, self.m3 = (self.send(self.thread, self.alice, f"m{i}") for i in range(1, 4))
+
+    def marks(self, user):
+        member = self.member(self.thread, user)
+        return member.last_delivered_seq, member.last_read_seq
+
+    def test_only_the_furthest_message_of_each_entry_counts(self):
+        other = self.send(self.make_thread(self.alice, self.bob), self.alice)  # de otro hilo: se ignora
+        ids = [str(self.m2.id), str(self.m1.id), str(other.id)]
+        advanced = advance_many([
+            (str(self.bob.id), str(self.thread.id), receipts.READ, ids),
+            (str(self.carol.id), str(self.thread.id), receipts.DELIVERED, None),  # hasta el último
+        ])
+
+        self.assertEqual(advanced, 2)
+        self.assertEqual(self.marks(self.bob), (2, 2))  # leer también entrega
+        self.assertEqual(self.marks(self.carol), (3, 0))
+
+        # Solo hacia adelante
+        self.assertEqual(advance_many([(str(self.bob.id), str(self.thread.id), receipts.READ, [str(self.m1.id)])]), 0)
+        self.assertEqual(self.marks(self.bob), (2, 2))
+
+    def test_a_failing_entry_is_dropped_alone(self):
+        original = receipts._advance
+
+        def flaky(message, user_id, kind):
+            if str(user_id) == str(self.bob.id):
+                Message.objects.bulk_create([Message(thread=self.thread, sender=self.bob, text="dup", seq=1)])
+            return original(message, user_id, kind)
+
+        with mock.patch.object(receipts, "_advance", flaky), self.assertLogs("ChatHiveApp.receipts", "ERROR"):
+            advanced = advance_many([
+                (str(self.bob.id), str(self.thread.id), receipts.READ, [str(self.m3.id)]),
+                (str(self.carol.id), str(self.thread.id), receipts.READ, [str(self.m3.id)]),
+            ])
+
+        self.assertEqual(advanced, 1)
+        self.assertEqual(self.marks(self.bob), (0, 0))
+        self.assertEqual(self.marks(self.carol), (3, 3))
+
+
+class ReceiptCoalescerTests(SimpleTestCase):
+    def setUp(self):
+        self.batches = []
+        patcher = mock.patch.object(receipts, "advance_many", side_effect=lambda items: self.batches.append(items))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def pending(self):
+        return {(user, thread, kind): ids for batch in self.batches for user, thread, kind, ids in batch}
+
+    async def test_marks_are_merged_per_user_thread_and_kind(self):
+        coalescer = ReceiptCoalescer(window=0.02)
+        coalescer.submit("u1", "t1", receipts.READ, "m1")
+        coalescer.submit("u1", "t1", receipts.READ, "m2")
+        coalescer.submit("u1", "t1", receipts.DELIVERED, "m2")
+        coalescer.submit("u2", "t1", receipts.READ, "m1")
+        coalescer.submit("u2", "t1", receipts.READ)  # "hasta el último" absorbe los ids
+        coalescer.submit("u2", "t1", receipts.READ, "m3")
+        self.assertEqual(self.batches, [])
+
+        await asyncio.sleep(0.05)
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual(self.pending(), {
+            ("u1", "t1", receipts.READ): {"m1", "m2"},
+            ("u1", "t1", receipts.DELIVERED): {"m2"},
+            ("u2", "t1", receipts.READ): None,
+        })
+
+    async def test_max_keys_flushes_without_waiting_for_the_window(self):
+        coalescer = ReceiptCoalescer(window=10, max_keys=2)
+        coalescer.submit("u1", "t1", receipts.READ, "m1")
+        coalescer.submit("u1", "t2", receipts.READ, "m1")
+        await asyncio.sleep(0.02)
+        self.assertEqual(len(self.pending()), 2)
+        self.assertIsNone(coalescer._timer)
+
+
+
+# ─────────────────────────────────────────────────────────
+# Outbox transaccional
+# ─────────────────────────────────────────────────────────
+@override_settings(REALTIME_OUTBOX=True)
+class OutboxTests(ChatTestCase):
+    def setUp(self):
+        self.thread = self.make_thread(self.alice, self.bob)
+        self.previous, replay._log = replay._log, MemoryReplayLog()
+        self.addCleanup(setattr, replay, "_log", self.previous)
+
+    def enqueue(self, text="hola"):
+        outbox.enqueue_group(f"thread_{self.thread.id}", {"type": "message.created", "payload": {"text": text}})
+
+    def frames(self, batch):
+        return [JSON_CODEC.decode(event["frames"]["json"]) for _, sends in batch for _, event in sends]
+
+    def test_rolled_back_writes_enqueue_nothing(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.enqueue()
+            raise RuntimeError
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_load_pending_keeps_order_and_reuses_ids_on_redelivery(self):
+        self.enqueue("a")
+        outbox.enqueue_inbox(self.thread.id, [self.bob.id])
+        self.enqueue("b")
+
+        batch, broken = outbox.load_pending()
+        self.assertEqual(broken, [])
+        ids = list(OutboxEvent.objects.order_by("id").values_list("id", flat=True))
+        self.assertEqual([row_id for row_id, _ in batch], ids)
+        first = self.frames(batch)
+        self.assertEqual([f["type"] for f in first], ["message.created", "inbox.thread", "message.created"])
+        self.assertTrue(all(f["event_id"] for f in first))
+
+        # Sin marcar como enviado: el reenvío lleva los mismos event_id y replay_id
+        def ids(frames):
+            return [(f["event_id"], f.get("replay_id")) for f in frames]
+
+        self.assertEqual(ids(self.frames(outbox.load_pending()[0])), ids(first))
+        self.assertEqual(len(replay._log._logs[f"thread_{self.thread.id}"]), 2)
+
+        outbox.mark_dispatched([batch[0][0]])
+        self.assertEqual(len(outbox.load_pending()[0]), 2)
+
+    def test_unpreparable_rows_are_reported_apart(self):
+        OutboxEvent.objects.create(kind=OutboxKind.INBOX, payload={})
+        self.enqueue()
+        with self.assertLogs("ChatHiveApp.outbox", "ERROR"):
+            batch, broken = outbox.load_pending()
+        self.assertEqual(len(batch), 1)
+        self.assertEqual(len(broken), 1)
+
+    def test_rows_failing_max_attempts_become_dead_letter(self):
+        self.enqueue()
+        row = OutboxEvent.objects.get()
+        for _ in range(2):
+            outbox.mark_failed([row.id], max_attempts=3)
+        self.assertEqual(len(outbox.load_pending()[0]), 1)
+
+        outbox.mark_failed([row.id], max_attempts=3)
+        row.refresh_from_db()
+        self.assertEqual(row.attempts, 3)
+        self.assertIsNotNone(row.failed_at)
+        self.assertEqual(outbox.load_pending(), ([], []))
+        self.assertEqual(outbox.lag()["dead_letter"], 1)
+        self.assertEqual(outbox.lag()["pending"], 0)
+
+
+
+# ─────────────────────────────────────────────────────────
+# Inbox incremental
+# ─────────────────────────────────────────────────────────
+class InboxChangedSinceTests(ChatTestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.old, self.new_a, self.new_b, self.left = (self.make_thread(self.alice, self.bob) for _ in range(4))
+        self.touch(self.old, minutes=10)
+        self.touch(self.new_a, minutes=1)
+        self.touch(self.new_b, minutes=1)
+        self.touch(self.left, minutes=1, is_active=False)
+        self.client = APIClient()
+        self.client.force_authenticate(self.bob)
+        self.url = reverse("chat-threads-list")
+
+    def touch(self, thread, minutes, **fields):
+        ThreadMember.objects.filter(thread=thread, user=self.bob).update(
+            updated_at=self.now - timedelta(minutes=minutes), **fields
+        )
+
+    def changes(self, cursor, **params):
+        response = self.client.get(self.url, {"changed_since": cursor, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_only_rows_changed_after_the_cursor(self):
+        data = self.changes(sync_cursor(self.now - timedelta(minutes=5)))
+        self.assertEqual({r["id"] for r in data["results"]}, {str(self.new_a.id), str(self.new_b.id)})
+        self.assertEqual(data["removed"], [str(self.left.id)])
+        self.assertFalse(data["has_more"])
+
+        # El siguiente cursor no repite lo ya devuelto
+        self.assertEqual(self.changes(data["sync"])["results"], [])
+
+    def test_pages_by_changed_at_and_id(self):
+        cursor = sync_cursor(self.now - timedelta(minutes=5))
+        first = self.changes(cursor, page_size=1)
+        self.assertTrue(first["has_more"])
+        second = self.changes(first["sync"], page_size=1)
+        self.assertFalse(second["has_more"])
+        ids = [first["results"][0]["id"], second["results"][0]["id"]]
+        self.assertEqual(ids, sorted([str(self.new_a.id), str(self.new_b.id)]))
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(self.url, {"changed_since": "no-es-un-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+
+# ─────────────────────────────────────────────────────────
+# Historial por seq
+# ─────────────────────────────────────────────────────────
+class ChatMessagePaginationTests(ChatTestCase):
+    def setUp(self):
+        self.thread = self.make_thread(self.alice, self.bob)
+        self.messages = [self.send(self.thread, self.alice, f"m{i}") for i in range(1, 6)]
+        self.queryset = Message.objects.filter(thread=self.thread)
+        self.paginator = ChatMessagePagination()
+
+    def resolve(self, value, param="before"):
+        return self.paginator.resolve_anchor(self.queryset, param, value)
+
+    def test_resolve_anchor_from_seq(self):
+        self.assertEqual(self.resolve("3"), [3])
+        self.assertEqual(self.resolve(encode_cursor([4])), [4])
+
+    def test_resolve_anchor_from_message_id(self):
+        self.assertEqual(self.resolve(str(self.messages[1].id)), [2])
+
+    def test_resolve_anchor_from_legacy_cursor(self):
+        m = self.messages[2]
+        self.assertEqual(self.resolve(encode_cursor([m.created_at, m.id])), [3])
+
+    def test_resolve_anchor_rejects_unknown_or_foreign_ids(self):
+        other = self.send(self.make_thread(self.alice), self.alice)
+        for value in (str(other.id), "no-es-un-cursor", encode_cursor(["a", "b", "c"])):
+            with self.subTest(value=value), self.assertRaises(ValidationError):
+                self.resolve(value)
+
+    def test_pages_are_seq_ranges(self):
+        def page(**params):
+            request = Request(APIRequestFactory().get("/", {"page_size": 2, **params}))
+            return [m.seq for m in self.paginator.paginate_queryset(self.queryset, request)]
+
+        self.assertEqual(page(), [5, 4])
+        self.assertEqual(page(before="4"), [3, 2])
+        self.assertEqual(page(after="2"), [4, 3])
+        self.assertEqual(page(around=str(self.messages[2].id)), [4, 3])
+
+
+
+
+# ─────────────────────────────────────────────────────────
+# Ventana caliente
+# ─────────────────────────────────────────────────────────
+@mock.patch.object(hot_window_module, "HOT_WINDOW_SIZE", 3)
+class HotWindowTests(ChatTestCase):
+    def setUp(self):
+        self.thread = self.make_thread(self.alice, self.bob)
+        for i in range(1, 5):
+            self.send(self.thread, self.alice, f"m{i}")
+        self.window = HotWindow()
+        self.window._store = MemoryHotWindowStore()
+        self.tid = str(self.thread.id)
+
+    def texts(self, page):
+        messages, more = page
+        return [m["text"] for m in messages], more
+
+    def write(self, message, op="messages_created"):
+        with self.captureOnCommitCallbacks(execute=True):
+            getattr(self.window, op)([message])
+
+    def test_miss_fills_the_window_from_the_database(self):
+        self.assertIsNone(self.window.first_page(self.tid, 2))
+        self.assertEqual(self.texts(self.window.load(self.tid, 2)), (["m4", "m3"], True))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.texts(self.window.first_page(self.tid, 3)), (["m4", "m3", "m2"], True))
+        self.assertEqual((self.window.fills, self.window.hits, self.window.misses), (1, 1, 1))
+
+    def test_fill_is_dropped_if_a_write_landed_while_reading(self):
+        version = self.window.version(self.tid)
+        self.window.store.invalidate(self.tid)  # escritura concurrente
+        self.assertFalse(self.window.store.fill(self.tid, version, [], False))
+        self.assertIsNone(self.window.first_page(self.tid, 3))
+
+    def test_created_messages_are_appended_and_trimmed(self):
+        self.window.load(self.tid, 3)
+        version = self.window.version(self.tid)
+
+        self.write(self.send(self.thread, self.bob, "m5"))
+        self.assertGreater(self.window.version(self.tid), version)
+        self.assertEqual(self.texts(self.window.first_page(self.tid, 10)), (["m5", "m4", "m3"], True))
+
+    def test_edits_patch_the_entry_and_physical_deletes_invalidate(self):
+        self.window.load(self.tid, 3)
+        message = Message.objects.get(thread=self.thread, seq=4)
+        Message.objects.filter(pk=message.pk).update(text="editado")
+        message.refresh_from_db()
+        self.write(message, "messages_changed")
+        self.assertEqual(self.texts(self.window.first_page(self.tid, 1)), (["editado"], True))
+
+        version = self.window.version(self.tid)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.window.invalidate(self.tid)
+        self.assertIsNone(self.window.first_page(self.tid, 1))
+        self.assertGreater(self.window.version(self.tid), version)
+
+
+# ─────────────────────────────────────────────────────────
+# GET condicional del historial
+# ─────────────────────────────────────────────────────────
+class MessageListETagTests(ChatTestCase):
+    def setUp(self):
+        self.thread = self.make_thread(self.alice, self.bob)
+        self.message = self.send(self.thread, self.alice, "hola")
+        self.client = APIClient()
+        self.client.force_authenticate(self.bob)
+        self.url = reverse("chat-thread-messages", kwargs={"thread_id": str(self.thread.id)})
+
+    def get(self, etag=None):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        return self.client.get(self.url, **headers)
+
+    def texts(self, response):
+        return [m["text"] for m in response.json()["results"]]
+
+    def test_unchanged_history_is_not_modified(self):
+        first = self.get()
+        self.assertEqual(first.status_code, 200)
+        again = self.get(first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again["ETag"], first["ETag"])
+
+    def test_write_invalidates_before_on_commit_runs(self):
+        etag = self.get()["ETag"]
+        kwargs = {"thread_id": str(self.thread.id), "pk": str(self.message.id)}
+        edit_url = reverse("chat-thread-message-detail", kwargs=kwargs)
+        self.client.force_authenticate(self.alice)
+
+        # Sin ejecutar los on_commit (versión de la ventana caliente sin subir, como si Redis fallara)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(self.client.patch(edit_url, {"text": "editado"}, format="json").status_code, 200)
+        self.assertEqual(self.get(etag).status_code, 200)
+
+        for callback in callbacks:
+            callback()
+        response = self.get(etag)
+        self.assertEqual((response.status_code, self.texts(response)), (200, ["editado"]))
+
+    def test_sender_profile_change_invalidates(self):
+        etag = self.get()["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.display_name = "Alicia"
+            self.alice.save()
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"][0]["sender"]["display"], "Alicia")
+
+        # last_seen no sale en el historial
+        etag = response["ETag"]
+        self.alice.last_seen = timezone.now()
+        self.alice.save(update_fields=["last_seen"])
+        self.assertEqual(self.get(etag).status_code, 304)
+
+
+# ─────────────────────────────────────────────────────────
+# Typing en origen
+# ─────────────────────────────────────────────────────────
+class RecordingLayer:
+    """
+    Channel layer mínimo que anota los group_send (grupo, evento).
+    """
+
+    def __init__(self):
+        self.sent = []
+
+    async def group_send(self, group, event):
+        self.sent.append((group, event))
+
+
+class TypingThrottleTests(SimpleTestCase):
+    def setUp(self):
+        self.layer = RecordingLayer()
+        self.throttle = TypingThrottle(interval=0.05, refresh=1.0)
+
+    def statuses(self):
+        return [event["status"] for _, event in self.layer.sent]
+
+    async def submit(self, status, thread="t1", user="u1", channel="c1"):
+        await self.throttle.submit(self.layer, thread, user, status, channel)
+
+    async def test_repeated_state_is_not_broadcast(self):
+        await self.submit("start")
+        await self.submit("start")
+        await asyncio.sleep(0.08)
+        await self.submit("start")  # dentro de refresh
+        self.assertEqual(self.statuses(), ["start"])
+        self.assertEqual(self.layer.sent[0][0], "thread_t1")
+
+    async def test_stop_without_start_is_not_broadcast(self):
+        await self.submit("stop")
+        self.assertEqual(self.statuses(), [])
+
+    async def test_changes_within_interval_leave_with_the_latest_state(self):
+        await self.submit("start")
+        await self.submit("stop")
+        await self.submit("start")
+        await self.submit("stop")
+        self.assertEqual(self.statuses(), ["start"])
+        await asyncio.sleep(0.08)
+        self.assertEqual(self.statuses(), ["start", "stop"])
+
+    async def test_limit_is_per_thread_and_sender(self):
+        await self.submit("start", thread="t1")
+        await self.submit("start", thread="t2")
+        await self.submit("start", user="u2")
+        self.assertEqual(len(self.layer.sent), 3)
+
+    async def test_reset_lets_the_next_start_through(self):
+        await self.submit("start")
+        await asyncio.sleep(0.08)
+        self.throttle.reset("t1", "u1")  # el emisor envió un mensaje
+        await self.submit("start")
+        self.assertEqual(self.statuses(), ["start", "start"])
+
+    async def test_stop_channel_stops_only_that_connection_starts(self):
+        await self.submit("start", thread="t1", channel="c1")
+        await self.submit("start", thread="t2", channel="c2")
+        await asyncio.sleep(0.08)
+        await self.throttle.stop_channel(self.layer, "u1", "c1")
+        self.assertEqual(
+            [(group, event["status"]) for group, event in self.layer.sent],
+            [("thread_t1", "start"), ("thread_t2", "start"), ("thread_t1", "stop")],
+        )
+
+
+
+# ─────────────────────────────────────────────────────────
+# Suscripción a varios grupos
+# ─────────────────────────────────────────────────────────
+class PartialRedisLayer(RedisChannelLayer):
+    """
+    RedisChannelLayer sin los internos del pipeline (otra versión de channels_redis).
+    """
+
+    _group_key = None
+
+    def __init__(self):
+        super().__init__(hosts=[("localhost", 6379)])
+        self.added = []
+
+    async def group_add(self, group, channel):
+        self.added.append((group, channel))
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYER)
+class GroupAddManyTests(SimpleTestCase):
+    async def test_layer_in_use_receives_group_sends(self):
+        layer = get_channel_layer()
+        channel = await layer.new_channel()
+        await group_add_many(layer, ["thread_a", "thread_b"], channel)
+
+        for group in ("thread_a", "thread_b"):
+            await layer.group_send(group, {"type": "ping", "group": group})
+        received = [(await layer.receive(channel))["group"] for _ in range(2)]
+        self.assertEqual(received, ["thread_a", "thread_b"])
+
+    async def test_missing_redis_internals_fall_back_to_group_add(self):
+        layer = PartialRedisLayer()
+        await group_add_many(layer, ["thread_a", "thread_b"], "chan")
+        self.assertEqual(layer.added, [("thread_a", "chan"), ("thread_b", "chan")])
+
+    def test_installed_channels_redis_keeps_the_pipeline(self):
+        # Si una actualización de channels_redis quita los internos, se nota aquí
+        self.assertTrue(_pipelined_group_add(RedisChannelLayer(hosts=[("localhost", 6379)])))
+
+
+# ─────────────────────────────────────────────────────────
+# Registro de repetición
+# ─────────────────────────────────────────────────────────
+class MemoryReplayLogTests(SimpleTestCase):
+    def setUp(self):
+        self.log = MemoryReplayLog(max_events=3)
+
+    def frame(self, n):
+        return {"type": "message.created", "payload": {"n": n}, "event_id": f"e{n}"}
+
+    def append(self, *ns, group="thread_t1"):
+        return self.log.append_many([(group, self.frame(n)) for n in ns])
+
+    def now_id(self, offset_ms=0):
+        return f"{int(time.time() * 1000) + offset_ms}-0"
+
+    async def test_since_replays_from_the_reorder_window(self):
+        ids = self.append(1, 2, 3)
+        missed = await self.log.since("thread_t1", ids[1])
+        # Lo anterior a 'since' dentro de la ventana también sale: el cliente deduplica por event_id
+        self.assertEqual([e["event_id"] for e in missed.events], ["e1", "e2", "e3"])
+        self.assertEqual([e["replay_id"] for e in missed.events], ids)
+        self.assertEqual((missed.gap, missed.last_id), (False, ids[-1]))
+
+        old = self.log.append_many([("thread_t2", self.frame(9))])[0]
+        ms, n = replay.parse_replay_id(old)
+        far = f"{ms + replay.REPLAY_REORDER_WINDOW + 1}-{n}"
+        self.assertEqual((await self.log.since("thread_t2", far)).events, [])
+
+    async def test_trimmed_log_is_a_gap(self):
+        ids = self.append(1, 2, 3, 4)  # max_events=3: e1 se descarta
+        missed = await self.log.since("thread_t1", "0-1")
+        self.assertEqual((missed.gap, missed.events, missed.last_id), (True, [], ids[-1]))
+        self.assertFalse((await self.log.since("thread_t1", ids[0])).gap)
+
+    async def test_thread_without_log_missed_nothing(self):
+        since = self.now_id()
+        self.assertEqual(await self.log.since("thread_new", since), replay.Replay(last_id=since))
+
+        expired = self.now_id(-replay.REPLAY_TTL * 1000 - 1)
+        self.assertTrue((await self.log.since("thread_new", expired)).gap)
+
+
+class RecordReplayTests(SimpleTestCase):
+    def setUp(self):
+        self.log = MemoryReplayLog()
+        self.previous, replay._log = replay._log, self.log
+
+    def tearDown(self):
+        replay._log = self.previous
+
+    def test_record_many_tags_only_replayable_events(self):
+        sends = [
+            ("thread_t1", {"type": "message.created", "payload": {}}),
+            ("thread_t1", {"type": "receipt.updated", "payload": {}, "event_id": "fixed"}),
+            ("thread_t1", {"type": "typing", "payload": {}}),
+            ("user_u1", {"type": "message.created", "payload": {}}),
+        ]
+        out = replay.record_many(sends)
+
+        created, receipt, typing, inbox = (data for _, data in out)
+        self.assertTrue(created["event_id"] and created["replay_id"])
+        self.assertEqual(receipt["event_id"], "fixed")
+        self.assertNotIn("replay_id", typing)
+        self.assertNotIn("replay_id", inbox)
+        self.assertEqual([g for g, _ in out], [g for g, _ in sends])
+
+    async def test_replayed_copy_keeps_the_live_event_id(self):
+        live = await replay.arecord("thread_t1", {"type": "message.updated", "payload": {}})
+        missed = await self.log.since("thread_t1", live["replay_id"])
+        self.assertEqual([e["event_id"] for e in missed.events], [live["event_id"]])
+
+
+# ─────────────────────────────────────────────────────────
+# Presencia: anuncios
+# ─────────────────────────────────────────────────────────
+class PresenceAnnounceTests(SimpleTestCase):
+    def setUp(self):
+        self.store = MemoryPresenceStore()
+        self.now = 1000.0
+
+    async def test_only_changes_against_the_last_announced_state_are_announced(self):
+        await self.store.add("u1", "c1", self.now)
+        self.assertIs(await self.store.announce_change("u1", self.now), True)
+        self.assertIsNone(await self.store.announce_change("u1", self.now))
+
+        # Se cae y vuelve dentro de la ventana: nada que anunciar
+        await self.store.remove("u1", "c1", self.now)
+        await self.store.add("u1", "c2", self.now)
+        self.assertIsNone(await self.store.announce_change("u1", self.now))
+
+        await self.store.remove("u1", "c2", self.now)
+        self.assertIs(await self.store.announce_change("u1", self.now), False)
+
+    async def test_concurrent_announces_report_the_change_once(self):
+        await self.store.add("u1", "c1", self.now)
+        results = await asyncio.gather(*(self.store.announce_change("u1", self.now) for _ in range(3)))
+        self.assertEqual(sorted(results, key=str), [None, None, True])
+
+    async def test_announced_state_expires(self):
+        await self.store.add("u1", "c1", self.now)
+        await self.store.announce_change("u1", self.now)
+        later = self.now + PRESENCE_ANNOUNCED_TTL + 1
+        await self.store.touch("u1", "c1", later)
+        self.assertIs(await self.store.announce_change("u1", later), True)
+
+
+# ─────────────────────────────────────────────────────────
+# Codecs del WebSocket
+# ─────────────────────────────────────────────────────────
+class MsgpackCodecTests(SimpleTestCase):
+    def setUp(self):
+        self.frame = {
+            "type": "message.created",
+            "payload": {
+                "message": {
+                    "id": str(uuid.uuid4()),
+                    "thread_id": str(uuid.uuid4()),
+                    "seq": 7,
+                    "text": "hola ñandú",
+                    "client_id": str(uuid.uuid4()),
+                    "created_at": "2026-10-16T10:00:00.123000+00:00",
+                    "edited_at": None,
+                },
+                "user_ids": [str(uuid.uuid4()), str(uuid.uuid4())],
+            },
+        }
+
+    def test_round_trip(self):
+        wire = MSGPACK_CODEC.encode(self.frame)
+        self.assertIsInstance(wire, bytes)
+        self.assertEqual(MSGPACK_CODEC.decode(wire), self.frame)
+
+    def test_ids_and_times_use_binary_types_but_client_keys_do_not(self):
+        raw = msgpack.unpackb(MSGPACK_CODEC.encode(self.frame), raw=False, timestamp=0)
+        message = raw["payload"]["message"]
+        message_id = uuid.UUID(self.frame["payload"]["message"]["id"])
+        self.assertEqual(message["id"], msgpack.ExtType(EXT_UUID, message_id.bytes))
+        self.assertIsInstance(message["created_at"], msgpack.Timestamp)
+        self.assertIsInstance(message["client_id"], str)
+        self.assertTrue(all(isinstance(u, msgpack.ExtType) for u in raw["payload"]["user_ids"]))
+
+    def test_values_that_do_not_parse_stay_strings(self):
+        frame = {"id": "x" * 36, "thread_id": "no-es-uuid", "sent_at": "ayer"}
+        self.assertEqual(MSGPACK_CODEC.decode(MSGPACK_CODEC.encode(frame)), frame)
+
+    def test_batch_embeds_encoded_frames(self):
+        for codec in (JSON_CODEC, MSGPACK_CODEC):
+            with self.subTest(codec=codec.name):
+                batch = codec.encode_batch([codec.encode(self.frame), codec.encode({"type": "ready"})])
+                self.assertEqual(codec.decode(batch), {"type": "batch", "payload": [self.frame, {"type": "ready"}]})
+
+    def test_negotiate(self):
+        self.assertIs(negotiate([MSGPACK_SUBPROTOCOL]), MSGPACK_CODEC)
+        self.assertIs(negotiate(["otro"]), JSON_CODEC)
+        self.assertIs(negotiate(None), JSON_CODEC)
+
+
+class PreEncodedFrameTests(SimpleTestCase):
+    def setUp(self):
+        codecs._transcoded.clear()
+        self.content = {"type": "message.deleted", "payload": {"message_id": str(uuid.uuid4()), "seq": 3}}
+
+    def test_fan_out_event_carries_only_the_json_frame(self):
+        event = thread_event_message(self.content)
+        self.assertEqual(event["type"], "thread.event")
+        self.assertEqual(event["kind"], "message.deleted")
+        self.assertEqual(list(event["frames"]), ["json"])
+        self.assertEqual(JSON_CODEC.decode(event["frames"]["json"]), self.content)
+
+    def test_json_receivers_write_the_frame_as_is(self):
+        frames = encode_frames(self.content)
+        self.assertIs(frame_for(JSON_CODEC, frames), frames["json"])
+        self.assertEqual(len(codecs._transcoded), 0)
+
+    def test_msgpack_is_transcoded_once_per_process(self):
+        frames = encode_frames(self.content)
+        first = frame_for(MSGPACK_CODEC, frames)
+        self.assertEqual(MSGPACK_CODEC.decode(first), self.content)
+        # Otro receptor del mismo evento (el dict llega deserializado de nuevo por conexión)
+        self.assertIs(frame_for(MSGPACK_CODEC, dict(frames)), first)
+
+    def test_transcode_cache_is_bounded(self):
+        for n in range(codecs.TRANSCODE_CACHE_SIZE + 10):
+            frame_for(MSGPACK_CODEC, encode_frames({"type": "ping", "n": n}))
+        self.assertEqual(len(codecs._transcoded), codecs.TRANSCODE_CACHE_SIZE)
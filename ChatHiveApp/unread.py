@@ -0,0 +1,175 @@
+# ChatHiveApp/unread.py
+"""
+Contadores de no leídos desnormalizados en ThreadMember.
+
+ThreadMember.unread_count / last_read_at se mantienen en los caminos de escritura
+(crear / borrar mensaje, mover la marca de lectura) para que el inbox los lea
+directamente, sin agregar sobre Message.
+
+Cada UPDATE también pone updated_at=Now(): es la marca que usa el inbox
+incremental (?changed_since=) para saber qué filas cambiaron.
+
+Las marcas se comparan por Message.seq (last_read_seq / last_delivered_seq, 0 = ninguna):
+"no leídos" es un rango de enteros sobre el índice (thread, seq).
+"""
+from __future__ import annotations
+
+from django.db.models import (
+    BigIntegerField, Case, Count, DateTimeField, F, IntegerField, OuterRef, Q, Subquery, UUIDField, Value, When,
+)
+from django.db.models.functions import Coalesce, Now
+
+from ChatHiveApp.models import Message, Thread, ThreadMember
+
+
+def before_position(prefix: str, message: Message) -> Q:
+    """
+    Filas de ThreadMember cuya marca '<prefix>_seq' está antes de 'message' en el hilo
+    (o que aún no tienen marca: 0).
+    """
+    return Q(**{f"{prefix}_seq__lt": message.seq})
+
+
+def _unread_subquery(after_seq=None):
+    """
+    COUNT correlacionado de mensajes no leídos para la fila de ThreadMember externa:
+    mensajes del hilo, no eliminados, de otros usuarios y (si aplica) con seq > 'after_seq'
+    (un entero o una referencia OuterRef).
+    """
+    qs = (
+        Message.objects.filter(thread_id=OuterRef("thread_id"), deleted_at__isnull=True)
+        .exclude(sender_id=OuterRef("user_id"))
+    )
+    if after_seq is not None:
+        qs = qs.filter(seq__gt=after_seq)
+    qs = qs.order_by().values("thread_id").annotate(c=Count("id")).values("c")
+    return Coalesce(Subquery(qs, output_field=IntegerField()), Value(0))
+
+
+def on_message_created(message: Message) -> int:
+    """
+    +1 a los miembros activos del hilo, excepto al emisor (un solo UPDATE; todos cambian de posición).
+    """
+    return on_messages_created(message.thread_id, [message.sender_id])
+
+
+def on_messages_created(thread_id, sender_ids) -> int:
+    """
+    Varios mensajes nuevos en un hilo (uno por elemento de sender_ids): cada miembro
+    activo suma los que no envió él, en un solo UPDATE.
+    """
+    total = len(sender_ids)
+    per_sender: dict = {}
+    for sender_id in sender_ids:
+        if sender_id:
+            per_sender[sender_id] = per_sender.get(sender_id, 0) + 1
+
+    return ThreadMember.objects.filter(thread_id=thread_id, is_active=True).update(
+        unread_count=Case(
+            *[When(user_id=uid, then=F("unread_count") + (total - n)) for uid, n in per_sender.items()],
+            default=F("unread_count") + total,
+        ),
+        updated_at=Now(),
+    )
+
+
+def on_message_deleted(message: Message) -> int:
+    """
+    -1 a los miembros para los que el mensaje seguía sin leer.
+    """
+    qs = ThreadMember.objects.filter(thread_id=message.thread_id, unread_count__gt=0).filter(
+        before_position("last_read", message)
+    )
+    if message.sender_id:
+        qs = qs.exclude(user_id=message.sender_id)
+    return qs.update(unread_count=F("unread_count") - 1, updated_at=Now())
+
+
+def mark_read(thread_id, user_id, message: Message) -> bool:
+    """
+    Mueve la marca de lectura de (thread, user) hasta 'message' (solo hacia adelante),
+    recalcula su contador y adelanta la de entrega si iba detrás, todo en el mismo UPDATE.
+    """
+    delivered_behind = before_position("last_delivered", message)
+    updated = (
+        ThreadMember.objects.filter(thread_id=thread_id, user_id=user_id)
+        .filter(before_position("last_read", message))
+        .update(
+            last_read_message_id=message.id,
+            last_read_at=message.created_at,
+            last_read_seq=message.seq,
+            last_delivered_message_id=Case(
+                When(delivered_behind, then=Value(message.id)),
+                default=F("last_delivered_message_id"),
+                output_field=UUIDField(),
+            ),
+            last_delivered_at=Case(
+                When(delivered_behind, then=Value(message.created_at)),
+                default=F("last_delivered_at"),
+                output_field=DateTimeField(),
+            ),
+            last_delivered_seq=Case(
+                When(delivered_behind, then=Value(message.seq)),
+                default=F("last_delivered_seq"),
+                output_field=BigIntegerField(),
+            ),
+            # el SET ve los valores previos de la fila: usamos el seq literal
+            unread_count=_unread_subquery(after_seq=message.seq),
+            updated_at=Now(),
+        )
+    )
+    return bool(updated)
+
+
+def mark_all_read(user_id) -> list:
+    """
+    Lleva las marcas de todas las membresías activas del usuario hasta el último mensaje
+    de cada hilo (snapshot last_message_* de Thread) en un solo UPDATE; una marca que ya
+    estaba más adelante (p.ej. en un último mensaje eliminado) no retrocede.
+    Devuelve [(thread_id, last_message_id, last_message_seq), ...] de las filas que cambiaron.
+    """
+    behind = ThreadMember.objects.filter(user_id=user_id, is_active=True, thread__last_message_seq__isnull=False).filter(
+        Q(unread_count__gt=0) | Q(last_read_seq__lt=F("thread__last_message_seq"))
+    )
+    rows = list(behind.values_list("pk", "thread_id", "thread__last_message_id", "thread__last_message_seq"))
+    if not rows:
+        return []
+
+    thread = Thread.objects.filter(id=OuterRef("thread_id"))
+    last_id = Subquery(thread.values("last_message_id")[:1], output_field=UUIDField())
+    last_at = Subquery(thread.values("last_message_at")[:1], output_field=DateTimeField())
+    last_seq = Subquery(thread.values("last_message_seq")[:1], output_field=BigIntegerField())
+
+    def forward(prefix, field, value, output_field):
+        is_behind = Q(**{f"{prefix}_seq__lt": last_seq})
+        return Case(When(is_behind, then=value), default=F(f"{prefix}_{field}"), output_field=output_field)
+
+    ThreadMember.objects.filter(pk__in=[row[0] for row in rows]).update(
+        last_read_message_id=forward("last_read", "message_id", last_id, UUIDField()),
+        last_read_at=forward("last_read", "at", last_at, DateTimeField()),
+        last_read_seq=forward("last_read", "seq", last_seq, BigIntegerField()),
+        last_delivered_message_id=forward("last_delivered", "message_id", last_id, UUIDField()),
+        last_delivered_at=forward("last_delivered", "at", last_at, DateTimeField()),
+        last_delivered_seq=forward("last_delivered", "seq", last_seq, BigIntegerField()),
+        unread_count=0,
+        updated_at=Now(),
+    )
+    return [row[1:] for row in rows]
+
+
+def recompute_unread(members=None) -> int:
+    """
+    Reparación set-based: recalcula last_read_at / last_read_seq y unread_count con
+    UPDATE ... = (SELECT ...), sin iterar filas en Python.
+    'members' permite acotar (p.ej. un hilo o un usuario); por defecto, todos.
+    """
+    if members is None:
+        members = ThreadMember.objects.all()
+
+    last_read = Message.objects.filter(id=OuterRef("last_read_message_id"))
+    members.update(
+        last_read_at=Subquery(last_read.values("created_at")[:1]),
+        last_read_seq=Coalesce(Subquery(last_read.values("seq")[:1]), Value(0), output_field=BigIntegerField()),
+    )
+    # seq > last_read_seq: con 0 (sin marca) cuenta todo el hilo
+    return members.update(unread_count=_unread_subquery(after_seq=OuterRef("last_read_seq")))
@@ -5,6 +5,9 @@ from rest_framework.routers import DefaultRouter
 from ChatHiveApp.api.threads import ThreadViewSet
 from ChatHiveApp.api.messages import MessageViewSet
 from ChatHiveApp.api.direct import DirectThreadResolveView, DirectSendFirstMessageView
+from ChatHiveApp.api.receipts import MarkAllReadView, MessageReceiptsView, ThreadReadView, ThreadReceiptsView
+from ChatHiveApp.api.search import MessageSearchView
+from ChatHiveApp.api.metrics import HotWindowStatsView, OutboxLagView, PublisherStatsView
 
 router = DefaultRouter()
 router.register(r"chat/threads", ThreadViewSet, basename="chat-threads")
@@ -32,6 +35,20 @@ urlpatterns = [
         name="chat-thread-message-detail",
     ),
 
+    # 🔹 Entrega/lectura por marcas de agua
+    path(
+        "chat/threads/<str:thread_id>/messages/<str:pk>/receipts/",
+        MessageReceiptsView.as_view(),
+        name="chat-thread-message-receipts",
+    ),
+    path(
+        "chat/threads/<str:thread_id>/receipts/",
+        ThreadReceiptsView.as_view(),
+        name="chat-thread-receipts",
+    ),
+    path("chat/threads/<str:thread_id>/read/", ThreadReadView.as_view(), name="chat-thread-read"),
+    path("chat/threads/read-all/", MarkAllReadView.as_view(), name="chat-threads-read-all"),
+
     # 🔹 Directos: RESOLVE y SEND
     path(
         "chat/threads/direct/resolve/",
@@ -43,6 +60,14 @@ urlpatterns = [
         DirectSendFirstMessageView.as_view(),
         name="chat-thread-direct-send",
     ),
+
+    # 🔹 Búsqueda de mensajes (todos los hilos del usuario)
+    path("chat/search/messages/", MessageSearchView.as_view(), name="chat-search-messages"),
+
+    # 🔹 Métricas (staff)
+    path("chat/metrics/outbox/", OutboxLagView.as_view(), name="chat-metrics-outbox"),
+    path("chat/metrics/publisher/", PublisherStatsView.as_view(), name="chat-metrics-publisher"),
+    path("chat/metrics/hot-window/", HotWindowStatsView.as_view(), name="chat-metrics-hot-window"),
 ]
 
 # Rutas generadas por el router (lista/detalle de threads)
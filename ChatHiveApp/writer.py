@@ -0,0 +1,194 @@
+# ChatHiveApp/writer.py
+"""
+Group commit para los envíos por WebSocket.
+
+Los message.send que llegan dentro de BATCH_WINDOW (de todas las conexiones del
+worker) se persisten juntos: un SELECT de idempotencia, un bulk_create y un UPDATE
+de contadores + snapshot por hilo, en una sola transacción y un solo salto a
+database_sync_to_async. Cada emisor recibe su Message cuando el lote confirma.
+"""
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Union
+
+from channels.db import database_sync_to_async
+from django.db import IntegrityError, transaction
+
+from ChatHiveApp import inbox, realtime, unread
+from ChatHiveApp.hot_window import hot_window
+from ChatHiveApp.models import Message, MessageType, allocate_message_seqs
+
+BATCH_WINDOW = 0.005  # segundos
+BATCH_MAX = 200
+
+
+@dataclass
+class PendingMessage:
+    thread_id: str
+    sender_id: str
+    text: str
+    client_id: Optional[str] = None
+    future: asyncio.Future = field(default=None, repr=False)
+
+
+# ─────────────────────────────────────────────────────────
+# Persistencia (sync)
+# ─────────────────────────────────────────────────────────
+def create_or_get_message(thread_id, user_id, text, client_id=None) -> Message:
+    """
+    Idempotencia:
+      - Si llega client_id y ya existe (UniqueConstraint en (thread, client_id)), regresa el existente.
+      - Si no, crea el mensaje, suma no leídos a los demás miembros y actualiza el snapshot last_message_* del Thread.
+    """
+    if client_id:
+        existing = Message.objects.filter(thread_id=thread_id, client_id=client_id).first()
+        if existing:
+            return existing
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                msg = Message.objects.create(
+                    thread_id=thread_id,
+                    sender_id=user_id,
+                    type=MessageType.TEXT,
+                    text=text,
+                    client_id=client_id,
+                )
+            unread.on_message_created(msg)
+            hot_window.messages_created([msg])
+        except IntegrityError:
+            # colisión por client_id concurrente (otro proceso lo creó primero)
+            msg = Message.objects.get(thread_id=thread_id, client_id=client_id)
+
+        inbox.set_last_message(msg)
+        realtime.push_inbox_update(thread_id)
+        return msg
+
+
+def _persist_one(p: PendingMessage) -> Union[Message, Exception]:
+    try:
+        return create_or_get_message(p.thread_id, p.sender_id, p.text, p.client_id)
+    except Exception as e:  # se entrega solo a ese emisor
+        return e
+
+
+def persist_batch(items: List[PendingMessage]) -> List[Union[Message, Exception]]:
+    """
+    Persiste un lote completo; devuelve un Message por elemento (en el mismo orden).
+    Si otro proceso gana la carrera de un client_id, el lote se repite elemento a elemento,
+    cada uno en su transacción: el que falle devuelve su excepción en su posición y los
+    demás quedan confirmados.
+    """
+    keys = {(p.thread_id, p.client_id) for p in items if p.client_id}
+    existing: Dict[tuple, Message] = {}
+    if keys:
+        for m in Message.objects.filter(
+            thread_id__in={k[0] for k in keys}, client_id__in={k[1] for k in keys}
+        ):
+            existing[(str(m.thread_id), m.client_id)] = m
+
+    try:
+        with transaction.atomic():
+            results: List[Message] = []
+            to_create: List[Message] = []
+            for p in items:
+                key = (p.thread_id, p.client_id)
+                if p.client_id and key in existing:
+                    results.append(existing[key])
+                    continue
+                msg = Message(
+                    thread_id=p.thread_id,
+                    sender_id=p.sender_id,
+                    type=MessageType.TEXT,
+                    text=p.text,
+                    client_id=p.client_id,
+                )
+                if p.client_id:
+                    existing[key] = msg  # duplicado dentro del mismo lote
+                to_create.append(msg)
+                results.append(msg)
+
+            by_thread: Dict[str, List[Message]] = {}
+            for msg in to_create:
+                by_thread.setdefault(str(msg.thread_id), []).append(msg)
+            # Hilos en orden fijo: allocate_message_seqs bloquea la fila del Thread y dos
+            # lotes con {A, B} y {B, A} se bloquearían mutuamente (deadlock).
+            by_thread = dict(sorted(by_thread.items()))
+            # bulk_create no llama a save(): un bloque de seq consecutivos por hilo
+            for thread_id, msgs in by_thread.items():
+                first = allocate_message_seqs(thread_id, len(msgs))
+                for offset, msg in enumerate(msgs):
+                    msg.seq = first + offset
+
+            Message.objects.bulk_create(to_create)
+            hot_window.messages_created(to_create)
+
+            for thread_id, msgs in by_thread.items():
+                unread.on_messages_created(thread_id, [m.sender_id for m in msgs])
+                inbox.set_last_message(msgs[-1])
+                realtime.push_inbox_update(thread_id)
+
+            return results
+    except IntegrityError:
+        return [_persist_one(p) for p in items]
+
+
+# ─────────────────────────────────────────────────────────
+# Writer (async, uno por event loop)
+# ─────────────────────────────────────────────────────────
+class MessageBatchWriter:
+    def __init__(self, window: float = BATCH_WINDOW, max_size: int = BATCH_MAX):
+        self.window = window
+        self.max_size = max_size
+        self._pending: List[PendingMessage] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def submit(self, thread_id, sender_id, text, client_id=None) -> Message:
+        loop = asyncio.get_running_loop()
+        item = PendingMessage(str(thread_id), str(sender_id), text, client_id or None, loop.create_future())
+        self._pending.append(item)
+
+        if len(self._pending) >= self.max_size:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush_now)
+
+        return await item.future
+
+    def _flush_now(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._flush(batch))
+
+    async def _flush(self, batch: List[PendingMessage]):
+        try:
+            results = await database_sync_to_async(persist_batch)(batch)
+        except Exception as e:
+            for p in batch:
+                if not p.future.done():
+                    p.future.set_exception(e)
+            return
+        for p, result in zip(batch, results):
+            if p.future.done():
+                continue
+            if isinstance(result, Exception):
+                p.future.set_exception(result)
+            else:
+                p.future.set_result(result)
+
+
+_writers: Dict[asyncio.AbstractEventLoop, MessageBatchWriter] = {}
+
+
+def get_message_writer() -> MessageBatchWriter:
+    loop = asyncio.get_running_loop()
+    writer = _writers.get(loop)
+    if writer is None:
+        writer = _writers[loop] = MessageBatchWriter()
+    return writer
@@ -117,7 +117,7 @@ AUTH_USER_MODEL = 'accounts.User'
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "accounts.auth.cookie_jwt.CookieJWTAuthentication",
+        "accounts.auth.cookie_jwt.CachedCookieJWTAuthentication",
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
@@ -131,6 +131,21 @@ REST_FRAMEWORK = {
         "login": "10/min", 
     },
 }
+# Eventos realtime de la API por outbox transaccional. Activarlo SOLO si se despliega
+# 'manage.py dispatch_outbox' como proceso aparte (una instancia); si no, los eventos
+# quedan en OutboxEvent sin enviarse. False: se envían en on_commit desde el propio proceso.
+REALTIME_OUTBOX = os.getenv("REALTIME_OUTBOX", "0").lower() in ("1", "true", "yes")
+# Envíos desde código sync por el publisher de fondo (ChatHiveApp.publisher). Sin medir:
+# comparar antes con 'manage.py bench_rest_writes'. False: async_to_sync en línea por llamada
+REALTIME_PUBLISHER = os.getenv("REALTIME_PUBLISHER", "0").lower() in ("1", "true", "yes")
+
+# Caché del usuario autenticado en REST (ver accounts.auth.user_cache.RestUserCache)
+AUTH_USER_CACHE = {
+    "TTL": 30,
+    "SHARED_ALIAS": os.getenv("AUTH_USER_CACHE_ALIAS") or None,
+}
+# Alias de CACHES para las sugerencias del directorio (ver accounts.users.directory)
+USER_DIRECTORY_CACHE_ALIAS = os.getenv("USER_DIRECTORY_CACHE_ALIAS", "default")
 from datetime import timedelta
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=15),
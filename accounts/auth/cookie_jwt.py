@@ -1,6 +1,10 @@
 # accounts/auth/cookie_jwt.py
+from django.utils.translation import gettext_lazy as _
 from rest_framework_simplejwt.authentication import JWTAuthentication
-from django.conf import settings
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .user_cache import rest_user_cache
 
 ACCESS_COOKIE_NAME = "access_token"
 
@@ -18,3 +22,27 @@ class CookieJWTAuthentication(JWTAuthentication):
 
         validated_token = self.get_validated_token(raw_token)
         return self.get_user(validated_token), validated_token
+
+
+class CachedCookieJWTAuthentication(CookieJWTAuthentication):
+    """
+    Igual que CookieJWTAuthentication, pero el usuario sale de rest_user_cache
+    (TTL corto + versión por usuario, ver accounts.auth.user_cache) en vez de un SELECT por request.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN or api_settings.USER_ID_FIELD not in ("id", "pk"):
+            # el hash de la contraseña no se cachea; y el caché va por pk
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        user = rest_user_cache.get(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
@@ -1,7 +1,7 @@
 from django.urls import path
 from .views import (
     LoginView, RefreshCookieView, RefreshBearerView,
-    LogoutView, MeView, ChangePasswordView
+    LogoutView, MeView, ChangePasswordView, WsUserCacheStatsView
 )
 
 urlpatterns = [
@@ -13,4 +13,5 @@ urlpatterns = [
     path("logout/", LogoutView.as_view(), name="auth_logout"),
     path("me/", MeView.as_view(), name="auth_me"),
     path("change-password/", ChangePasswordView.as_view(), name="auth_change_password"),
+    path("ws-user-cache/", WsUserCacheStatsView.as_view(), name="auth_ws_user_cache"),
 ]
@@ -0,0 +1,278 @@
+# accounts/auth/user_cache.py
+"""
+Caché en proceso de usuarios para autenticar el handshake WS.
+
+Tras un deploy todas las conexiones reconectan a la vez y cada handshake resolvía
+el mismo User con su propia consulta. Aquí:
+  - LRU acotado (USER_CACHE_MAXSIZE) con TTL (USER_CACHE_TTL) de registros "slim"
+    (solo las columnas que usan los consumers; el resto se difiere).
+  - single-flight: las búsquedas concurrentes del mismo id esperan a una sola consulta.
+  - invalidación en post_save/post_delete de User (ver accounts.signals). Es local al
+    proceso: entre procesos el TTL acota lo desactualizado.
+  - stats(): hit rate y latencia de las consultas a BD (expuesto en /api/auth/ws-user-cache/).
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+
+USER_CACHE_MAXSIZE = 10_000
+USER_CACHE_TTL = 60  # segundos
+
+SLIM_USER_FIELDS = ("id", "email", "first_name", "last_name", "display_name", "is_active", "is_staff")
+
+User = get_user_model()
+
+
+@sync_to_async
+def _load_user(user_id):
+    return User.objects.only(*SLIM_USER_FIELDS).get(pk=user_id)
+
+
+class UserCache:
+    def __init__(self, maxsize: int = USER_CACHE_MAXSIZE, ttl: float = USER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, object]]" = OrderedDict()
+        self._lock = threading.Lock()  # el caché se comparte entre event loops / hilos
+        # single-flight por event loop: (loop, user_id) -> future de la consulta en curso
+        self._inflight: Dict[Tuple[asyncio.AbstractEventLoop, str], asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._latencies: deque = deque(maxlen=1024)  # ms de las últimas consultas a BD
+
+    # ── Lectura
+    def peek(self, user_id) -> Optional[object]:
+        key = str(user_id)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    async def get(self, user_id):
+        """
+        Devuelve el User (slim) o lanza User.DoesNotExist, como User.objects.get.
+        """
+        user = self.peek(user_id)
+        if user is not None:
+            self.hits += 1
+            return user
+
+        key = (asyncio.get_running_loop(), str(user_id))
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        started = time.perf_counter()
+        try:
+            try:
+                user = await _load_user(user_id)
+            finally:
+                self._latencies.append((time.perf_counter() - started) * 1000)
+            self.put(user)
+            future.set_result(user)
+            return user
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # marcada como recuperada aunque nadie más espere
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    # ── Escritura / invalidación
+    def put(self, user) -> None:
+        key = str(user.pk)
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, user)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, user_id) -> None:
+        with self._lock:
+            self._data.pop(str(user_id), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    # ── Métricas
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        samples = sorted(self._latencies)
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else None,
+            "db_lookup_ms": {
+                "avg": round(sum(samples) / len(samples), 3) if samples else None,
+                "p50": round(samples[len(samples) // 2], 3) if samples else None,
+                "p99": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3) if samples else None,
+                "max": round(samples[-1], 3) if samples else None,
+            },
+        }
+
+
+ws_user_cache = UserCache()
+
+
+# ─────────────────────────────────────────────────────────
+# REST: usuario de CachedCookieJWTAuthentication
+# ─────────────────────────────────────────────────────────
+def _rest_settings() -> dict:
+    from django.conf import settings
+
+    return {"TTL": 30, "MAXSIZE": USER_CACHE_MAXSIZE, "SHARED_ALIAS": None, **getattr(settings, "AUTH_USER_CACHE", {})}
+
+
+class RestUserCache:
+    """
+    Usuario autenticado de cada request REST sin SELECT a User.
+
+    Cada usuario tiene una versión (accounts.signals la sube en cualquier save de User
+    que no sea solo last_seen: /me, cambio de contraseña, desactivación, admin). Una entrada
+    solo vale si su versión es la actual y no pasó su TTL; al caducar se relee de BD y
+    JWTAuthentication vuelve a comprobar is_active, así que un usuario desactivado por un
+    camino sin signals (queryset.update) queda fuera como mucho TTL segundos después.
+
+    settings.AUTH_USER_CACHE = {"TTL": 30, "MAXSIZE": 10000, "SHARED_ALIAS": None}
+      SHARED_ALIAS: alias de CACHES (p.ej. Redis) para compartir versiones y registros
+      entre procesos; sin él todo es local al proceso.
+
+    Cada request recibe una instancia nueva (from_db): las vistas pueden modificarla y guardarla.
+    """
+
+    def __init__(self):
+        conf = _rest_settings()
+        self.ttl = conf["TTL"]
+        self.maxsize = conf["MAXSIZE"]
+        self.shared_alias = conf["SHARED_ALIAS"]
+        self._data: "OrderedDict[str, Tuple[float, int, tuple]]" = OrderedDict()
+        # Versiones locales (sin SHARED_ALIAS), LRU acotado como _data: al expulsar una se
+        # expulsa también su entrada, y la versión vuelve a 0 con la caché ya vacía
+        self._versions: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.fields = [f.attname for f in User._meta.concrete_fields if f.attname != "password"]
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @property
+    def shared(self):
+        if not self.shared_alias:
+            return None
+        from django.core.cache import caches
+
+        return caches[self.shared_alias]
+
+    @staticmethod
+    def _version_key(user_id) -> str:
+        return f"auth:uver:{user_id}"
+
+    @staticmethod
+    def _user_key(user_id) -> str:
+        return f"auth:user:{user_id}"
+
+    def _build(self, values: tuple):
+        return User.from_db("default", self.fields, values)
+
+    def _store_local(self, key: str, version: int, values: tuple) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, version, values)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get(self, user_id):
+        """
+        User (instancia nueva) o None si no existe.
+        """
+        key = str(user_id)
+        shared = self.shared
+
+        if shared is None:
+            version = self._versions.get(key, 0)
+            remote = None
+        else:
+            got = shared.get_many([self._version_key(key), self._user_key(key)])
+            version = got.get(self._version_key(key), 0)
+            remote = got.get(self._user_key(key))
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic() and entry[1] == version:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._build(entry[2])
+
+        if remote is not None and remote[0] == version:
+            self.shared_hits += 1
+            self._store_local(key, version, remote[1])
+            return self._build(remote[1])
+
+        self.misses += 1
+        values = User.objects.filter(pk=user_id).values_list(*self.fields).first()
+        if values is None:
+            return None
+        self._store_local(key, version, values)
+        if shared is not None:
+            shared.set(self._user_key(key), (version, values), self.ttl)
+        return self._build(values)
+
+    def bump(self, user_id) -> None:
+        """
+        Invalida las entradas del usuario (en todos los procesos si hay SHARED_ALIAS).
+        """
+        key = str(user_id)
+        with self._lock:
+            self._data.pop(key, None)
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self._versions.move_to_end(key)
+            while len(self._versions) > self.maxsize:
+                evicted, _ = self._versions.popitem(last=False)
+                self._data.pop(evicted, None)
+        shared = self.shared
+        if shared is not None:
+            vkey = self._version_key(key)
+            shared.add(vkey, 0, None)
+            try:
+                shared.incr(vkey)
+            except ValueError:  # expulsada entre add e incr
+                shared.set(vkey, 1, None)
+            shared.delete(self._user_key(key))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "size": len(self._data),
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.shared_hits) / lookups, 4) if lookups else None,
+        }
+
+
+rest_user_cache = RestUserCache()
@@ -119,6 +119,18 @@ class MeView(generics.RetrieveUpdateAPIView):
         return self.request.user
 
 
+# ------------------- Caché de usuarios del handshake WS -------------------
+class WsUserCacheStatsView(APIView):
+    """
+    Hit rate y latencia de la caché de usuarios del JWTAuthMiddleware (por proceso).
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        from .user_cache import ws_user_cache
+        return Response(ws_user_cache.stats())
+
+
 # ------------------- Cambiar contraseña -------------------
 class ChangePasswordView(generics.UpdateAPIView):
     serializer_class = ChangePasswordSerializer
@@ -13,7 +13,7 @@ class JWTAuthMiddleware:
       2) O del subprotocol 'jwt' (fallback)
       3) O querystring ?token=... (último recurso)
     Decodifica el JWT (HS256 por defecto / o RS256 con JWKS si usas claves públicas).
-    Inyecta scope['user'].
+    Inyecta scope['user'] (resuelto vía ws_user_cache, ver accounts.auth.user_cache).
     """
     def __init__(self, app):
         self.app = app
@@ -70,9 +70,8 @@ class JWTAuthMiddleware:
 
         return await self.app(scope, receive, send)
 
-# usuario sin bloquear el loop
-from asgiref.sync import sync_to_async
+# usuario sin bloquear el loop (caché LRU/TTL + single-flight)
+from .user_cache import ws_user_cache
 
-@sync_to_async
-def database_get_user(user_id):
-    return User.objects.get(pk=user_id)
+async def database_get_user(user_id):
+    return await ws_user_cache.get(user_id)
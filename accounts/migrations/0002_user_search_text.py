@@ -0,0 +1,51 @@
+# Generated by Django 5.2.8 on 2026-10-16 22:41
+
+from django.db import migrations, models
+
+from accounts.users.directory import build_search_text
+
+USER_TABLE = '"accounts_user"'
+
+
+def backfill(apps, schema_editor):
+    User = apps.get_model("accounts", "User")
+    batch = []
+    for user in User.objects.only("id", "email", "first_name", "last_name", "display_name").iterator(chunk_size=2000):
+        user.search_text = build_search_text(user)
+        batch.append(user)
+        if len(batch) >= 2000:
+            User.objects.bulk_update(batch, ["search_text"])
+            batch = []
+    if batch:
+        User.objects.bulk_update(batch, ["search_text"])
+
+
+def trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        f"CREATE INDEX user_search_text_trgm ON {USER_TABLE} USING GIN (search_text gin_trgm_ops)"
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS user_search_text_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='search_text',
+            field=models.CharField(blank=True, default='', editable=False, max_length=400),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.RunPython(trigram_index, drop_trigram_index),
+    ]
@@ -4,6 +4,8 @@ from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.utils import timezone
 
+from accounts.users.directory import SEARCH_FIELDS, SEARCH_TEXT_MAX_LENGTH, build_search_text
+
 
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra):
@@ -42,6 +44,9 @@ class User(AbstractBaseUser, PermissionsMixin):
     last_seen = models.DateTimeField(null=True, blank=True, db_index=True)
     status_message = models.CharField(max_length=140, blank=True, default="")
 
+    # directorio: email + nombres sin acentos ni mayúsculas (ver accounts.users.directory)
+    search_text = models.CharField(max_length=SEARCH_TEXT_MAX_LENGTH, blank=True, default="", editable=False)
+
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS: list[str] = []
 
@@ -50,6 +55,13 @@ class User(AbstractBaseUser, PermissionsMixin):
     class Meta:
         ordering = ["-date_joined"]
 
+    def save(self, *args, **kwargs):
+        self.search_text = build_search_text(self)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and set(update_fields) & set(SEARCH_FIELDS):
+            kwargs["update_fields"] = {*update_fields, "search_text"}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         # nombre completo
         full_name = f"{self.first_name} {self.last_name}".strip()
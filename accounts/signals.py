@@ -0,0 +1,31 @@
+# accounts/signals.py
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .auth.user_cache import rest_user_cache, ws_user_cache
+from .users.directory import SEARCH_FIELDS, bump_directory_version
+
+User = get_user_model()
+
+DIRECTORY_FIELDS = {*SEARCH_FIELDS, "search_text", "avatar", "is_active", "status_message"}
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    # last_seen no forma parte del registro cacheado
+    if update_fields and set(update_fields) <= {"last_seen"}:
+        return
+    ws_user_cache.invalidate(instance.pk)
+    # /me, cambio de contraseña, desactivación, admin...: nueva versión del usuario
+    rest_user_cache.bump(instance.pk)
+    # sugerencias cacheadas del directorio: solo si cambió algo de lo que muestran
+    if not update_fields or set(update_fields) & DIRECTORY_FIELDS:
+        bump_directory_version()
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    ws_user_cache.invalidate(instance.pk)
+    rest_user_cache.bump(instance.pk)
+    bump_directory_version()
@@ -1,3 +1,98 @@
+from django.core.cache import caches
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from accounts.auth.user_cache import RestUserCache
+from accounts.models import User
+from accounts.users import directory
+
+
+class RestUserCacheTests(TestCase):
+    def setUp(self):
+        self.cache = RestUserCache()
+        self.user = User.objects.create_user(email="alice@chathive.test", first_name="Alice")
+
+    def test_cached_user_needs_no_query(self):
+        self.assertEqual(self.cache.get(self.user.pk).first_name, "Alice")
+        with self.assertNumQueries(0):
+            cached = self.cache.get(self.user.pk)
+        self.assertEqual(cached.pk, self.user.pk)
+        self.assertIsNot(cached, self.cache.get(self.user.pk))  # instancia nueva por request
+
+    def test_bump_forces_a_fresh_read(self):
+        self.cache.get(self.user.pk)
+        User.objects.filter(pk=self.user.pk).update(first_name="Alicia")
+        self.assertEqual(self.cache.get(self.user.pk).first_name, "Alice")  # sin signals: TTL
+
+        self.cache.bump(self.user.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.cache.get(self.user.pk).first_name, "Alicia")
+
+    def test_stale_load_is_not_served_after_a_bump(self):
+        # Una lectura que empezó antes del bump guarda lo que leyó con la versión anterior
+        self.cache.bump(self.user.pk)
+        self.cache._store_local(str(self.user.pk), 0, ("stale",))
+        with self.assertNumQueries(1):
+            self.cache.get(self.user.pk)
+
+    def test_versions_are_bounded(self):
+        self.cache.maxsize = 2
+        others = [User.objects.create_user(email=f"u{i}@chathive.test") for i in range(3)]
+        for user in others:
+            self.cache.get(user.pk)
+            self.cache.bump(user.pk)
+        self.assertEqual(list(self.cache._versions), [str(u.pk) for u in others[1:]])
+        self.assertLessEqual(len(self.cache._data), 2)
+
+
+class DirectorySearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.me = User.objects.create_user(email="me@chathive.test", first_name="Yo")
+        cls.julia = User.objects.create_user(
+            email="julia.nunez@chathive.test", first_name="Julia", last_name="Núñez"
+        )
+        cls.juan = User.objects.create_user(email="jp@chathive.test", first_name="Juan", display_name="Juanito")
+        User.objects.create_user(email="inactiva@chathive.test", first_name="Julieta", is_active=False)
+
+    def setUp(self):
+        caches["default"].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def search(self, q, **params):
+        response = self.client.get(reverse("user-list"), {"q": q, "page_size": 100, **params})
+        return {row["email"] for row in response.json()["results"]}
+
+    def suggest(self, q, **params):
+        return [row["id"] for row in self.client.get(reverse("user-suggest"), {"q": q, **params}).json()]
+
+    def test_search_text_is_folded(self):
+        self.assertEqual(directory.fold("Ñúñez"), "nunez")
+        self.assertIn("nunez", self.julia.search_text.split())
+        self.assertIn("julia", self.julia.search_text.split())  # palabras del email
+
+    def test_contains_and_prefix_modes(self):
+        self.assertEqual(self.search("NUÑEZ"), {self.julia.email})
+        self.assertEqual(self.search("ju"), {self.julia.email, self.juan.email})
+        self.assertEqual(self.search("ito"), {self.juan.email})
+        self.assertEqual(self.search("ito", mode="prefix"), set())
+        self.assertEqual(self.search("jua nito", mode="prefix"), set())
+        self.assertEqual(self.search("jua juanito"), {self.juan.email})
+
+    def test_short_prefixes_are_cached_until_a_profile_changes(self):
+        self.assertEqual(set(self.suggest("ju")), {str(self.julia.id), str(self.juan.id)})
+        with self.assertNumQueries(0):
+            self.suggest("ju")
+
+        self.juan.first_name = "Pedro"
+        self.juan.display_name = ""
+        self.juan.save()
+        self.assertEqual(self.suggest("ju"), [str(self.julia.id)])
+
+    def test_long_queries_and_exclude_me_share_the_cache_safely(self):
+        self.assertIsNone(directory.suggest_cache_key("julia", 10))
+        self.assertEqual(self.suggest("y"), [str(self.me.id)])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest("y", exclude_me=1), [])
@@ -0,0 +1,122 @@
+# accounts/users/directory.py
+"""
+Búsqueda en el directorio de usuarios sobre una sola columna normalizada.
+
+User.search_text guarda email, nombre, apellido y display_name sin acentos y en
+minúsculas (más las palabras del email), separados por espacios; User.save() la
+mantiene y la migración 0002 la rellena. En PostgreSQL lleva un índice GIN de
+trigramas (pg_trgm), así que LIKE '%texto%' no recorre la tabla; en SQLite es la
+misma columna sin índice (desarrollo local).
+
+Modos:
+  - contains (GET /api/users/?q=): cada palabra de la consulta aparece en algún sitio.
+  - prefix (suggest, typeahead): cada palabra es el comienzo de una palabra del usuario.
+
+Las sugerencias de prefijos cortos (los "calientes" mientras se teclea) se cachean
+SUGGEST_CACHE_TTL segundos; editar un perfil sube la versión del directorio y las
+invalida todas (accounts.signals).
+"""
+from __future__ import annotations
+
+import re
+import unicodedata
+from typing import List, Optional
+
+from django.conf import settings
+from django.db.models import Q
+
+SEARCH_TEXT_MAX_LENGTH = 400
+MAX_QUERY_TOKENS = 5
+
+SUGGEST_CACHE_TTL = 30  # segundos
+SUGGEST_CACHE_MAX_PREFIX = 4  # solo consultas de hasta N caracteres
+SUGGEST_CACHE_VERSION_KEY = "users:dir:ver"
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+# Campos de User que entran en search_text
+SEARCH_FIELDS = ("email", "first_name", "last_name", "display_name")
+
+
+def fold(value: str) -> str:
+    """
+    Minúsculas y sin marcas diacríticas ("Ñúñez" -> "nunez").
+    """
+    decomposed = unicodedata.normalize("NFKD", value or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def build_search_text(user) -> str:
+    email = fold(user.email)
+    words: List[str] = [email] if email else []
+    for value in (email, user.first_name, user.last_name, user.display_name):
+        words.extend(_WORD.findall(fold(value)))
+    return " ".join(dict.fromkeys(words))[:SEARCH_TEXT_MAX_LENGTH]
+
+
+def query_tokens(q: str) -> List[str]:
+    return list(dict.fromkeys(_WORD.findall(fold(q))))[:MAX_QUERY_TOKENS]
+
+
+def search_filter(q: str, prefix: bool = False) -> Optional[Q]:
+    """
+    Q sobre search_text (AND de las palabras de 'q'), o None si no hay palabras.
+    """
+    tokens = query_tokens(q)
+    if not tokens:
+        return None
+    condition = Q()
+    for token in tokens:
+        if prefix:
+            condition &= Q(search_text__startswith=token) | Q(search_text__contains=f" {token}")
+        else:
+            condition &= Q(search_text__contains=token)
+    return condition
+
+
+# ─────────────────────────────────────────────────────────
+# Caché de sugerencias
+# ─────────────────────────────────────────────────────────
+def _cache():
+    from django.core.cache import caches
+
+    return caches[getattr(settings, "USER_DIRECTORY_CACHE_ALIAS", "default")]
+
+
+def _version(cache) -> int:
+    return cache.get(SUGGEST_CACHE_VERSION_KEY) or 0
+
+
+def suggest_cache_key(q: str, limit: int) -> Optional[str]:
+    """
+    Clave para una consulta cacheable (prefijo corto), o None.
+    """
+    normalized = " ".join(query_tokens(q))
+    if len(normalized) > SUGGEST_CACHE_MAX_PREFIX:
+        return None
+    return f"users:suggest:{normalized}:{limit}"
+
+
+def get_cached_suggestions(key: str):
+    cache = _cache()
+    entry = cache.get(key)
+    if entry is None or entry[0] != _version(cache):
+        return None
+    return entry[1]
+
+
+def set_cached_suggestions(key: str, data) -> None:
+    cache = _cache()
+    cache.set(key, (_version(cache), data), SUGGEST_CACHE_TTL)
+
+
+def bump_directory_version() -> None:
+    """
+    Invalida todas las sugerencias cacheadas (en todos los procesos si el alias es compartido).
+    """
+    cache = _cache()
+    cache.add(SUGGEST_CACHE_VERSION_KEY, 0, None)
+    try:
+        cache.incr(SUGGEST_CACHE_VERSION_KEY)
+    except ValueError:  # expulsada entre add e incr
+        cache.set(SUGGEST_CACHE_VERSION_KEY, 1, None)
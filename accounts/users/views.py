@@ -1,12 +1,12 @@
 # accounts/users/views.py
 from django.contrib.auth import get_user_model
-from django.db.models import Q
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
+from . import directory
 from .serializers import UserListSerializer, UserSuggestSerializer
 
 User = get_user_model()
@@ -19,9 +19,11 @@ class UserPagination(PageNumberPagination):
 class UserViewSet(ReadOnlyModelViewSet):
     """
     GET /api/users/                -> lista paginada
-    GET /api/users/?q=texto        -> búsqueda
+    GET /api/users/?q=texto        -> búsqueda (cada palabra en cualquier parte; &mode=prefix: inicio de palabra)
     GET /api/users/?exclude_me=1   -> excluye a request.user
-    GET /api/users/suggest/?q=ju   -> sugerencias (sin paginar)
+    GET /api/users/suggest/?q=ju   -> sugerencias por prefijo (sin paginar; prefijos cortos cacheados)
+
+    Ambas filtran sobre User.search_text (normalizada e indexada, ver accounts.users.directory).
     """
     permission_classes = [IsAuthenticated]
     serializer_class = UserListSerializer
@@ -37,31 +39,34 @@ class UserViewSet(ReadOnlyModelViewSet):
         # búsqueda
         q = (self.request.query_params.get("q") or "").strip()
         if q:
-            qs = qs.filter(
-                Q(email__icontains=q)
-                | Q(first_name__icontains=q)
-                | Q(last_name__icontains=q)
-                | Q(display_name__icontains=q)
-            )
+            prefix = self.request.query_params.get("mode") == "prefix"
+            condition = directory.search_filter(q, prefix=prefix)
+            qs = qs.filter(condition) if condition is not None else qs.none()
         return qs
 
     @action(detail=False, methods=["GET"], url_path="suggest")
     def suggest(self, request):
-        limit = int(request.query_params.get("limit") or 10)
+        try:
+            limit = max(1, min(int(request.query_params.get("limit") or 10), 50))
+        except ValueError:
+            limit = 10
         q = (request.query_params.get("q") or "").strip()
         exclude_me = request.query_params.get("exclude_me", "").lower() in ("1", "true", "yes")
 
-        qs = User.objects.filter(is_active=True)
-        if exclude_me and request.user.is_authenticated:
-            qs = qs.exclude(id=request.user.id)
-        if q:
-            qs = qs.filter(
-                Q(email__icontains=q)
-                | Q(first_name__icontains=q)
-                | Q(last_name__icontains=q)
-                | Q(display_name__icontains=q)
-            )
+        # La caché es común a todos: se pide uno de más y el propio usuario se quita después
+        key = directory.suggest_cache_key(q, limit + 1)
+        data = directory.get_cached_suggestions(key) if key else None
+        if data is None:
+            qs = User.objects.filter(is_active=True)
+            if q:
+                condition = directory.search_filter(q, prefix=True)
+                qs = qs.filter(condition) if condition is not None else qs.none()
+            qs = qs.order_by("-last_seen", "first_name", "last_name")[: limit + 1]
+            data = [dict(row) for row in UserSuggestSerializer(qs, many=True).data]
+            if key:
+                directory.set_cached_suggestions(key, data)
 
-        qs = qs.order_by("-last_seen", "first_name", "last_name")[: max(1, min(limit, 50))]
-        data = UserSuggestSerializer(qs, many=True).data
-        return Response(data)
+        if exclude_me and request.user.is_authenticated:
+            me = str(request.user.id)
+            data = [row for row in data if str(row["id"]) != me]
+        return Response(data[:limit])